@@ -0,0 +1,417 @@
+"""End-to-end handler benchmark.
+
+Drives synthetic Telegram updates through application.process_update with Supabase replaced by the
+in-memory store (optionally with a per-round-trip latency) and the Bot API replaced by a local fake
+mounted on the bot's own HTTPXRequest, so whole handlers are measured: routing, database round trips,
+replies, DMs and the background side effects drained after each update, as in webhook mode, plus any
+admin job the update started.
+
+Scenarios cover /use for every card, /store browsing, buying every card, /awardall and every
+/startevent. Each reports updates/s, p50/p99 latency and database and Bot API round trips per update.
+Round-trip counts do not depend on the machine, so they are the main thing the baseline guards.
+
+Usage:
+    python bench.py                              # every scenario, 20 updates each
+    python bench.py --only use: --db-latency 0.02 --api-latency 0.05
+    python bench.py --save-baseline              # record bench_baseline.json
+    python bench.py --compare                    # exit 1 if a scenario regressed against the baseline
+    python bench.py --only none --cold-start     # just time `import main` against the import budget
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass
+from urllib.parse import parse_qsl
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(HERE, 'bench_baseline.json')
+# Importing main must stay under this many milliseconds (a dyno restart pays it before the first reply).
+IMPORT_BUDGET_MS = 600
+GROUP_CHAT_ID = -1001000000001
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Power Store', 'username': 'powerstore_bench_bot'}
+# Bot API methods whose result is True rather than a Message.
+BOOLEAN_METHODS = {'answerCallbackQuery', 'setWebhook', 'deleteWebhook', 'setMyCommands', 'deleteMessage'}
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+# --- FAKE BOT API ---
+
+class FakeBotAPI:
+    """Local stand-in for the Bot API, used as the handler of an httpx.MockTransport.
+
+    Every call is answered with a plausible result (a Message echoing the chat and text, or True)
+    after `latency` seconds. `calls` and `methods` count what the bot asked for.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self.methods = Counter()
+        self.message_id = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        method = request.url.path.rsplit('/', 1)[-1]
+        self.calls += 1
+        self.methods[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return httpx.Response(200, json={'ok': True, 'result': self.result(method, self.params(request))})
+
+    @staticmethod
+    def params(request: httpx.Request) -> dict:
+        if 'x-www-form-urlencoded' not in request.headers.get('content-type', ''):
+            return {}
+        return dict(parse_qsl(request.content.decode()))
+
+    def result(self, method: str, params: dict):
+        if method == 'getMe':
+            return BOT_USER
+        if method in BOOLEAN_METHODS or 'inline_message_id' in params:
+            return True
+        try:
+            chat_id = int(params.get('chat_id', 0))
+        except ValueError:
+            chat_id = 0
+        self.message_id += 1
+        return {
+            'message_id': int(params.get('message_id', self.message_id)),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'supergroup', 'title': 'Bench'},
+            'from': BOT_USER,
+            'text': params.get('text') or params.get('caption') or '',
+        }
+
+
+def install_fake_bot_api(request, api: FakeBotAPI):
+    """Routes an HTTPXRequest's traffic to `api` instead of api.telegram.org."""
+    request._client_kwargs['transport'] = httpx.MockTransport(api)
+    request._client = request._build_client()
+
+
+# --- SCENARIOS ---
+
+@dataclass(slots=True)
+class Scenario:
+    """One kind of update: `prepare(i)` resets the state it needs (untimed), `update(i)` builds the Update."""
+    name: str
+    prepare: object
+    update: object
+
+
+class BenchWorld:
+    """The bot wired to an in-memory Supabase and the fake Bot API, with a seeded population of players."""
+
+    def __init__(self, players: int, db_latency: float, api_latency: float, seed: int, shedding: bool = False):
+        import main
+        from instrument import InstrumentedClient
+        from ledger import Ledger, SQLiteLedgerStore
+        from memstore import MemoryClient
+
+        self.main = main
+        self.rng = random.Random(seed)
+        main.RNG_SERVICE.reseed(seed)
+
+        self.store = MemoryClient(db_latency)
+        main.db = InstrumentedClient(self.store, [main.PRESSURE.observe_db, main.record_db_round_trip])
+        # The ledger flushes on its own thread; keep it off the measured store like the simulator does.
+        main.LEDGER = Ledger(SQLiteLedgerStore(':memory:'))
+        # Every bench row is written by the bot itself, keyed by telegram_id, so the legacy key lookups never apply.
+        main.SCHEMA_NORMALISED = True
+        main.PLAYER_CACHE.clear()
+        main.ELIGIBILITY.clear()
+        main.GLOBAL_GAME_STATE.clear()
+        if not shedding:
+            # Load shedding reacts to timing, which would make round-trip counts vary between runs.
+            main.PRESSURE.limits = {}
+
+        self.api = FakeBotAPI(api_latency)
+        main.get_application()
+        install_fake_bot_api(main.request_obj, self.api)
+        main.get_job_bot()
+        install_fake_bot_api(main.job_request_obj, self.api)
+        main.JOBS.path = None
+
+        self.admin_id = main.ADMIN_USER_ID
+        self.user_ids = [1000 + i for i in range(players)]
+        self.attacker, self.target, self.shopper = self.user_ids[:3]
+        card_ids = [cid for cid in main.POWER_CARDS if cid != 'god']
+        for user_id in [self.admin_id] + self.user_ids:
+            self.reset_player(user_id, cards=self.rng.sample(card_ids, 3))
+        self.update_id = 0
+
+    def reset_player(self, user_id: int, coins: int = 500, cards=(), status=None, username: str = None):
+        self.main.save_player_data(user_id, {
+            'username': username or f"bench_{user_id}",
+            'first_name': f"Bench {user_id}",
+            'coins': coins,
+            'cards': list(cards),
+            'status': {'chats': [GROUP_CHAT_ID], **(status or {})},
+            'msgc_registered': True,
+        })
+
+    def reset_events(self):
+        self.main.clear_event_timers(self.main.EVENT_TIMER_KEYS + ('inflation_until',))
+
+    # --- update builders ---
+    def _user(self, user_id: int) -> dict:
+        return {'id': user_id, 'is_bot': False, 'first_name': f"Bench {user_id}", 'username': f"bench_{user_id}"}
+
+    def _chat(self, user_id: int, group: bool) -> dict:
+        if group:
+            return {'id': GROUP_CHAT_ID, 'type': 'supergroup', 'title': 'Bench'}
+        return {'id': user_id, 'type': 'private', 'first_name': f"Bench {user_id}"}
+
+    def message_json(self, user_id: int, text: str, group: bool = True, reply_to: int = None) -> dict:
+        """Update JSON for a text message; commands get their bot_command entity."""
+        self.update_id += 1
+        message = {
+            'message_id': self.update_id, 'date': int(time.time()), 'text': text,
+            'chat': self._chat(user_id, group), 'from': self._user(user_id),
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        if reply_to is not None:
+            message['reply_to_message'] = {
+                'message_id': self.update_id - 1, 'date': int(time.time()), 'text': 'hi',
+                'chat': self._chat(reply_to, group), 'from': self._user(reply_to),
+            }
+        return {'update_id': self.update_id, 'message': message}
+
+    def button_json(self, user_id: int, data: str) -> dict:
+        """Update JSON for a press of an inline button carrying `data`, under a store message in private chat."""
+        self.update_id += 1
+        return {
+            'update_id': self.update_id,
+            'callback_query': {
+                'id': str(self.update_id), 'from': self._user(user_id), 'chat_instance': 'bench', 'data': data,
+                'message': {
+                    'message_id': self.update_id, 'date': int(time.time()), 'text': 'Power Store',
+                    'chat': self._chat(user_id, False), 'from': BOT_USER,
+                },
+            },
+        }
+
+    def parse(self, data: dict):
+        from telegram import Update
+        return Update.de_json(data, self.main.application.bot)
+
+    def command(self, user_id: int, text: str, group: bool = True, reply_to: int = None):
+        return self.parse(self.message_json(user_id, text, group, reply_to))
+
+    def button(self, user_id: int, data: str):
+        return self.parse(self.button_json(user_id, data))
+
+    # --- scenarios ---
+    def use_update(self, card_id: str):
+        if card_id == 'god':
+            return self.command(self.attacker, "/use god tribute")
+        if card_id == 'purge':
+            # Purge reads every argument as the card name, so its target comes from a reply.
+            return self.command(self.attacker, "/use purge Speed", reply_to=self.target)
+        if not self.main.POWER_CARDS[card_id]['requires_target']:
+            return self.command(self.attacker, f"/use {card_id}")
+        return self.command(self.attacker, f"/use {card_id} @bench_{self.target}")
+
+    def scenarios(self) -> list:
+        main = self.main
+        out = []
+
+        for card_id in main.POWER_CARDS:
+            def prepare(i, card_id=card_id):
+                self.reset_events()
+                # Dispel only works on a player under Shackle or Inflation.
+                status = {'shackled_until': time.time() + 3600} if card_id == 'dispel' else None
+                # Re-roll needs other cards in hand to discard.
+                self.reset_player(self.attacker, cards=[card_id, 'speed', 'vision'] if card_id == 'reroll' else [card_id], status=status)
+                self.reset_player(self.target, cards=['speed', 'flame', 'vision'])
+            out.append(Scenario(f"use:{card_id}", prepare, lambda i, card_id=card_id: self.use_update(card_id)))
+
+        def prepare_shopper(i):
+            self.reset_events()
+            self.reset_player(self.shopper, coins=1000)
+        cards = list(main.POWER_CARDS)
+        out.append(Scenario("store", prepare_shopper, lambda i: self.command(self.shopper, "/store", group=False)))
+        out.append(Scenario("store:inspect", prepare_shopper,
+                            lambda i: self.button(self.shopper, f"inspect_{cards[i % len(cards)]}")))
+        out.append(Scenario("store:back", prepare_shopper, lambda i: self.button(self.shopper, "back_to_store")))
+        for card_id in cards:
+            out.append(Scenario(f"buy:{card_id}", prepare_shopper,
+                                lambda i, card_id=card_id: self.button(self.shopper, f"buy_{card_id}")))
+
+        out.append(Scenario("awardall", lambda i: None,
+                            lambda i: self.command(self.admin_id, "/awardall 5", group=False)))
+        for event in ('bogo', 'secretsanta', 'rushhour', 'truce', 'gambit', 'coinrush', 'freebiefrenzy'):
+            out.append(Scenario(f"startevent:{event}", lambda i: self.reset_events(),
+                                lambda i, event=event: self.command(self.admin_id, f"/startevent {event}")))
+        return out
+
+
+# --- RUNNER ---
+
+async def run_scenario(world: BenchWorld, scenario: Scenario, iterations: int) -> dict:
+    """Processes `iterations` updates of one scenario, timing each from dispatch to drained side effects."""
+    main = world.main
+    latencies, db_calls, api_calls = [], 0, 0
+    errors = main.HANDLER_ERRORS.total()
+    for i in range(iterations):
+        scenario.prepare(i)
+        update = scenario.update(i)
+        db_before, api_before = world.store.calls, world.api.calls
+        start = time.perf_counter()
+        await main.application.process_update(update)
+        await main.drain_side_effects()
+        # Admin jobs (/awardall, Gambit, Secret Santa) finish on their own thread; their work counts too.
+        await asyncio.to_thread(main.JOBS.wait)
+        latencies.append(time.perf_counter() - start)
+        db_calls += world.store.calls - db_before
+        api_calls += world.api.calls - api_before
+    busy = sum(latencies)
+    return {
+        'updates': iterations,
+        'updates_per_second': round(iterations / busy, 1) if busy else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'db_per_update': round(db_calls / iterations, 2),
+        'api_per_update': round(api_calls / iterations, 2),
+        'errors': int(main.HANDLER_ERRORS.total() - errors),
+    }
+
+
+async def run_all(world: BenchWorld, scenarios: list, iterations: int) -> dict:
+    main = world.main
+    await main.application.initialize()
+    try:
+        return {s.name: await run_scenario(world, s, iterations) for s in scenarios}
+    finally:
+        await main.drain_side_effects()
+        await main.application.shutdown()
+
+
+def measure_cold_start(runs: int = 5) -> dict:
+    """Median time to `import main` in a fresh interpreter, net of the interpreter's own start-up."""
+    def median_seconds(code: str) -> float:
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], cwd=HERE, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            times.append(time.perf_counter() - start)
+        return statistics.median(times)
+    interpreter = median_seconds('pass')
+    return {'import_ms': round((median_seconds('import main') - interpreter) * 1000, 1), 'runs': runs}
+
+
+def compare(results: dict, baseline: dict, tolerance: float, cold_start: dict = None, budget_ms: float = IMPORT_BUDGET_MS) -> list:
+    """Scenarios that got slower than `tolerance` allows at p50 or make more round trips per update,
+    plus an import time over `budget_ms` or `tolerance` above the baseline's."""
+    regressions = []
+    if cold_start:
+        before = baseline.get('cold_start', {}).get('import_ms')
+        if cold_start['import_ms'] > budget_ms:
+            regressions.append(f"import main: {cold_start['import_ms']}ms is over the {budget_ms:g}ms budget")
+        elif before and cold_start['import_ms'] > before * (1 + tolerance):
+            regressions.append(f"import main: {before}ms -> {cold_start['import_ms']}ms")
+    for name, now in results.items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        for key in ('db_per_update', 'api_per_update'):
+            if now[key] > before[key] + 0.5:
+                regressions.append(f"{name}: {key} {before[key]} -> {now[key]}")
+        if before['p50_ms'] and now['p50_ms'] > before['p50_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p50 {before['p50_ms']}ms -> {now['p50_ms']}ms")
+    return regressions
+
+
+def format_report(results: dict, wall_seconds: float) -> str:
+    total = sum(r['updates'] for r in results.values())
+    lines = [
+        f"Scenarios: {len(results)}   Updates: {total:,}   Wall time: {wall_seconds:.1f}s",
+        "",
+        f"{'Scenario':<26} {'upd/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'db/upd':>7} {'api/upd':>8} {'errors':>7}",
+    ]
+    for name, r in results.items():
+        lines.append(
+            f"{name:<26} {r['updates_per_second']:>8.1f} {r['p50_ms']:>9.2f} {r['p99_ms']:>9.2f} "
+            f"{r['db_per_update']:>7.2f} {r['api_per_update']:>8.2f} {r['errors']:>7}"
+        )
+    return "\n".join(lines)
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the bot's handlers end to end against fake backends.")
+    parser.add_argument('--iterations', type=int, default=20, help="updates per scenario")
+    parser.add_argument('--players', type=int, default=200, help="registered players (fan-out size for events)")
+    parser.add_argument('--db-latency', type=float, default=0.0, help="seconds added to every Supabase round trip")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="seconds added to every Bot API call")
+    parser.add_argument('--only', action='append', default=[], help="run scenarios whose name starts with this (repeatable)")
+    parser.add_argument('--shedding', action='store_true', help="keep load shedding active (off by default for repeatable counts)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="baseline file to compare against or save to")
+    parser.add_argument('--save-baseline', action='store_true', help="write these results as the new baseline")
+    parser.add_argument('--compare', action='store_true', help="exit 1 if a scenario regressed against the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed p50 slowdown when comparing (0.25 = 25%%)")
+    parser.add_argument('--cold-start', action='store_true', help="also time `import main` in a fresh interpreter")
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET_MS, help="import time budget in ms (with --cold-start)")
+    parser.add_argument('--json', help="write the results to this file")
+    args = parser.parse_args(argv)
+
+    cold_start = None
+    if args.cold_start:
+        cold_start = measure_cold_start()
+        print(f"Cold start: import main in {cold_start['import_ms']:.0f} ms (budget {args.import_budget:g} ms)\n")
+
+    logging.disable(logging.WARNING)
+    world = BenchWorld(max(3, args.players), args.db_latency, args.api_latency, args.seed, args.shedding)
+    scenarios = [s for s in world.scenarios() if not args.only or any(s.name.startswith(p) for p in args.only)]
+
+    started = time.perf_counter()
+    results = asyncio.run(run_all(world, scenarios, max(1, args.iterations)))
+    wall = time.perf_counter() - started
+    print(format_report(results, wall))
+
+    config = {'iterations': args.iterations, 'players': args.players, 'db_latency': args.db_latency,
+              'api_latency': args.api_latency, 'seed': args.seed, 'shedding': args.shedding}
+    output = {'config': config, 'scenarios': results}
+    if cold_start:
+        output['cold_start'] = cold_start
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+    if args.compare:
+        try:
+            with open(args.baseline, encoding='utf-8') as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"\nCannot read baseline {args.baseline}: {e}")
+            return 2
+        regressions = compare(results, baseline, args.tolerance, cold_start, args.import_budget)
+        if regressions:
+            print("\nRegressions against the baseline:\n" + "\n".join(f"  {r}" for r in regressions))
+            return 1
+        print("\nNo regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,143 @@
+import json
+import logging
+import threading
+import time
+
+from models import PlayerStatus
+
+logger = logging.getLogger(__name__)
+
+
+def status_size(status: PlayerStatus) -> int:
+    """Bytes the status adds to every row read and write (compact JSON, as PostgREST ships it)."""
+    return len(json.dumps(status.encode(), separators=(',', ':'), default=str))
+
+
+class StatusSweeper:
+    """Background job that keeps player `status` blobs small (see PlayerStatus.compact).
+
+    A sweep lists every player id (`list_ids()`), then works through them `batch_size` at a time
+    with one `update(ids, compute)` call each, then sleeps `pause` seconds, so a sweep never bursts
+    against Supabase. `update` reads the players and hands their current records to `compute`, which
+    compacts a copy of each status and returns {user_id: {'status': ...}} for the ones that shrank;
+    `update` writes those and returns how many it wrote. The bot passes its own read-compute-write
+    helper, so a status change a handler makes meanwhile is compacted rather than overwritten.
+    While `busy()` is true (the bot is shedding load) the sweep waits. Status sizes seen during the
+    last sweep are kept for metrics.
+    """
+
+    TOP = 10
+
+    def __init__(self, list_ids, update, batch_size: int = 50, pause: float = 1.0,
+                 busy=lambda: False, clock=time.time):
+        self.list_ids = list_ids
+        self.update = update
+        self.batch_size = max(1, batch_size)
+        self.pause = pause
+        self.busy = busy
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.sizes = {}
+        self.stats = {'sweeps': 0, 'running': False, 'last_sweep_at': None, 'last_sweep_seconds': 0.0,
+                      'scanned': 0, 'compacted': 0, 'bytes_saved': 0, 'errors': 0}
+
+    # --- SWEEP ---
+    def sweep(self) -> dict:
+        """Runs one full sweep on the calling thread. Returns {'scanned', 'compacted', 'bytes_saved'}."""
+        if not self.lock.acquire(blocking=False):
+            return {'scanned': 0, 'compacted': 0, 'bytes_saved': 0}
+        started = time.perf_counter()
+        result = {'scanned': 0, 'compacted': 0, 'bytes_saved': 0}
+        self.stats['running'] = True
+        try:
+            ids = list(self.list_ids())
+            sizes = {}
+            for start in range(0, len(ids), self.batch_size):
+                while self.busy() and not self.stop_event.is_set():
+                    self.stop_event.wait(self.pause or 1.0)
+                if self.stop_event.is_set():
+                    break
+                self._sweep_batch(ids[start:start + self.batch_size], sizes, result)
+                if start + self.batch_size < len(ids):
+                    self.stop_event.wait(self.pause)
+            self.sizes = sizes
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"Status compaction sweep failed: {e}")
+        finally:
+            self.stats.update(
+                sweeps=self.stats['sweeps'] + 1, running=False, last_sweep_at=self.clock(),
+                last_sweep_seconds=round(time.perf_counter() - started, 3),
+                scanned=self.stats['scanned'] + result['scanned'], compacted=self.stats['compacted'] + result['compacted'],
+                bytes_saved=self.stats['bytes_saved'] + result['bytes_saved'],
+            )
+            self.lock.release()
+        logger.info(f"Status compaction: {result['compacted']} of {result['scanned']} players compacted, "
+                    f"{result['bytes_saved']:,} bytes saved.")
+        return result
+
+    def _sweep_batch(self, ids: list, sizes: dict, result: dict):
+        now = self.clock()
+        saved = {}
+
+        def compact(records):
+            changes = {}
+            for record in records.values():
+                status = PlayerStatus.decode(record.status.encode())
+                before = status_size(status)
+                if status.compact(record.cards, now):
+                    after = status_size(status)
+                    changes[record.user_id] = {'status': status}
+                    saved[record.user_id] = before - after
+                    sizes[record.user_id] = after
+                else:
+                    sizes[record.user_id] = before
+            return changes
+
+        result['scanned'] += len(ids)
+        try:
+            written = self.update(ids, compact)
+            result['compacted'] += written
+            if written:
+                result['bytes_saved'] += sum(saved.values())
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.warning(f"Status compaction write failed for {len(saved)} players: {e}")
+
+    # --- METRICS ---
+    def size_summary(self) -> dict:
+        """Status sizes in bytes over the players seen in the last sweep: mean, p50, p99, max and total."""
+        values = sorted(self.sizes.values())
+        if not values:
+            return {}
+        return {
+            'mean': round(sum(values) / len(values), 1), 'p50': values[len(values) // 2],
+            'p99': values[min(len(values) - 1, int(len(values) * 0.99))], 'max': values[-1], 'total': sum(values),
+        }
+
+    def largest(self, n: int = TOP) -> list:
+        """[(user_id, bytes)] of the biggest statuses seen in the last sweep."""
+        return sorted(self.sizes.items(), key=lambda item: -item[1])[:n]
+
+    def snapshot(self) -> dict:
+        return {**self.stats, 'status_bytes': self.size_summary(), 'largest': self.largest()}
+
+    # --- BACKGROUND THREAD ---
+    def start(self, interval: float, delay: float = 60.0):
+        """Sweeps every `interval` seconds from a daemon thread, the first time after `delay` seconds."""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, args=(interval, delay), name='status-sweeper', daemon=True)
+        self.thread.start()
+
+    def _run(self, interval: float, delay: float):
+        wait = delay
+        while not self.stop_event.wait(wait):
+            self.sweep()
+            wait = interval
+
+    def stop(self):
+        self.stop_event.set()
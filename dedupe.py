@@ -0,0 +1,126 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class RecentKeys:
+    """The keys seen in the last `window` seconds, at most `size` of them (the oldest are forgotten first)."""
+
+    def __init__(self, size: int = 10000, window: float = 600.0, clock=time.monotonic):
+        self.size = max(1, size)
+        self.window = window
+        self.clock = clock
+        self.keys = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _prune(self, now: float):
+        keys = self.keys
+        while keys and (len(keys) > self.size or next(iter(keys.values())) <= now - self.window):
+            keys.popitem(last=False)
+
+    def __contains__(self, key) -> bool:
+        with self.lock:
+            seen = self.keys.get(key)
+            return seen is not None and seen > self.clock() - self.window
+
+    def add(self, key) -> bool:
+        """Records the key. False if it was already seen within the window (the caller has a duplicate)."""
+        now = self.clock()
+        with self.lock:
+            self._prune(now)
+            if key in self.keys:
+                return False
+            self.keys[key] = now
+            return True
+
+
+class SupabaseUpdateStore:
+    """Shares seen update ids between processes (and across restarts) through a Supabase table:
+
+        create table processed_updates (update_id bigint primary key, seen_at double precision not null);
+
+    Claiming an id is one insert; the primary key makes a second claim fail. Rows older than the dedupe
+    window are deleted every `prune_every` claims.
+    """
+
+    def __init__(self, get_client, table: str = 'processed_updates', prune_every: int = 500):
+        # Looked up on every call so a replaced client (tests, simulator) is picked up.
+        self.get_client = get_client
+        self.table = table
+        self.prune_every = prune_every
+        self.claims = 0
+
+    def claim(self, update_id: int, window: float) -> bool:
+        """True if no other process has claimed the update yet."""
+        client = self.get_client()
+        if client is None:
+            return True
+        now = time.time()
+        try:
+            client.table(self.table).insert({'update_id': update_id, 'seen_at': now}).execute()
+        except Exception as e:
+            if 'duplicate' in str(e).lower() or '23505' in str(e):
+                return False
+            raise
+        self.claims += 1
+        if self.claims % self.prune_every == 0:
+            try:
+                client.table(self.table).delete().lt('seen_at', now - window).execute()
+            except Exception as e:
+                logger.warning(f"Could not prune {self.table}: {e}")
+        return True
+
+
+class UpdateDeduper:
+    """Drops updates that were already processed, and repeated taps of the same inline button.
+
+    Telegram re-sends a webhook update whose request was slow or failed, so an update id is claimed just before
+    it is dispatched: a second delivery within `window` seconds is dropped. With a shared `store` the claim
+    also holds across processes and restarts; if the store cannot be reached the update is processed. A
+    callback query with the same user, button data and message as one seen in the last `debounce` seconds
+    is a double tap and is dropped too.
+    """
+
+    def __init__(self, size: int = 10000, window: float = 600.0, debounce: float = 1.0, store=None):
+        self.window = window
+        self.store = store
+        self.updates = RecentKeys(size, window)
+        self.callbacks = RecentKeys(size, debounce) if debounce > 0 else None
+        self.stats = {'duplicate_updates': 0, 'debounced_callbacks': 0, 'store_errors': 0}
+
+    def seen(self, update_id) -> bool:
+        """Cheap early check (this process only) that does not claim the id."""
+        return update_id is not None and update_id in self.updates
+
+    def claim(self, update_id) -> bool:
+        """True if the update should be processed; False for a redelivery."""
+        if update_id is None:
+            return True
+        if not self.updates.add(update_id):
+            self.stats['duplicate_updates'] += 1
+            return False
+        if self.store is not None:
+            try:
+                if not self.store.claim(update_id, self.window):
+                    self.stats['duplicate_updates'] += 1
+                    return False
+            except Exception as e:
+                self.stats['store_errors'] += 1
+                logger.warning(f"Update dedupe store failed, processing update {update_id}: {e}")
+        return True
+
+    def debounce(self, user_id, data, chat_id, message_id) -> bool:
+        """True if this button tap should be handled; False for a repeat of the same tap."""
+        if self.callbacks is None or self.callbacks.add((user_id, data, chat_id, message_id)):
+            return True
+        self.stats['debounced_callbacks'] += 1
+        return False
+
+    def snapshot(self) -> dict:
+        return {**self.stats, 'tracked_updates': len(self.updates)}
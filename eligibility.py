@@ -0,0 +1,119 @@
+from leaderboard import IndexableSkipList
+
+
+class RandomSet:
+    """Set of ids with O(1) add, discard and uniform random choice."""
+
+    __slots__ = ('items', 'positions')
+
+    def __init__(self):
+        self.items = []
+        self.positions = {}
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __contains__(self, item) -> bool:
+        return item in self.positions
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def add(self, item):
+        if item not in self.positions:
+            self.positions[item] = len(self.items)
+            self.items.append(item)
+
+    def discard(self, item):
+        position = self.positions.pop(item, None)
+        if position is None:
+            return
+        last = self.items.pop()
+        if position < len(self.items):
+            self.items[position] = last
+            self.positions[last] = position
+
+    def choice(self, rng):
+        return self.items[rng.randrange(len(self.items))] if self.items else None
+
+
+class EligibilityIndex:
+    """Active (non-eliminated) players split by MSGC flag, for picking attack targets without a table scan.
+
+    Each pool is a RandomSet for O(1) uniform picks, plus a skip list ordered by coins so "at least N coins"
+    picks are a rank lookup. Picks that must also skip some ids or stay inside a chat are made by
+    rejection sampling, falling back to a filtered scan of the pool when few candidates qualify.
+    """
+
+    ATTEMPTS = 8
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.pools = {False: RandomSet(), True: RandomSet()}
+        self.by_coins = {False: IndexableSkipList(), True: IndexableSkipList()}
+        self.entries = {}
+        self.eliminated = set()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def update(self, user_id: int, msgc: bool, coins: int, eliminated: bool):
+        """Files a player under their current MSGC flag, coins and elimination state."""
+        msgc, coins = bool(msgc), int(coins or 0)
+        if eliminated:
+            self._remove(user_id)
+            self.eliminated.add(user_id)
+            return
+        self.eliminated.discard(user_id)
+        entry = self.entries.get(user_id)
+        if entry == (msgc, coins):
+            return
+        if entry is not None:
+            self._remove(user_id)
+        self.entries[user_id] = (msgc, coins)
+        self.pools[msgc].add(user_id)
+        self.by_coins[msgc].insert((coins, user_id))
+
+    def update_coins(self, user_id: int, coins: int):
+        entry = self.entries.get(user_id)
+        if entry is not None:
+            self.update(user_id, entry[0], coins, False)
+
+    def discard(self, user_id: int):
+        self._remove(user_id)
+        self.eliminated.discard(user_id)
+
+    def _remove(self, user_id: int):
+        entry = self.entries.pop(user_id, None)
+        if entry is not None:
+            msgc, coins = entry
+            self.pools[msgc].discard(user_id)
+            self.by_coins[msgc].remove((coins, user_id))
+
+    def members(self, msgc: bool, scope=None) -> list:
+        """Active player ids in a pool (optionally only those in `scope`), sorted for stable iteration."""
+        pool = self.pools[bool(msgc)]
+        if scope is not None and len(scope) < len(pool):
+            return sorted(uid for uid in scope if uid in pool)
+        return sorted(uid for uid in pool if scope is None or uid in scope)
+
+    def random_target(self, rng, msgc: bool, exclude=(), min_coins: int = 0, scope=None):
+        """A uniformly random active player id from the pool, or None if nobody qualifies."""
+        msgc = bool(msgc)
+        ranked = self.by_coins[msgc]
+        start = ranked.bisect_left((min_coins, float('-inf'))) if min_coins > 0 else 0
+        count = len(ranked) - start
+        if count <= 0:
+            return None
+
+        def allowed(uid):
+            return uid not in exclude and (scope is None or uid in scope)
+
+        for _ in range(self.ATTEMPTS):
+            uid = ranked[start + rng.randrange(count)][1] if min_coins > 0 else self.pools[msgc].choice(rng)
+            if allowed(uid):
+                return uid
+        candidates = [uid for uid in self.members(msgc, scope) if uid not in exclude and self.entries[uid][1] >= min_coins]
+        return rng.choice(candidates) if candidates else None
@@ -0,0 +1,259 @@
+import logging
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Bit of each timed event in the active-event mask. Inflation is started by its card, not by /startevent.
+BOGO, RUSH_HOUR, TRUCE, COIN_RUSH, FREEBIE_FRENZY, INFLATION = (1 << i for i in range(6))
+EVENT_FLAGS = {
+    'bogo_active_until': BOGO, 'rush_hour_until': RUSH_HOUR, 'truce_until': TRUCE,
+    'coin_rush_until': COIN_RUSH, 'freebie_frenzy_until': FREEBIE_FRENZY, 'inflation_until': INFLATION,
+}
+# Matches windows in every chat (and global ones) where a chat_id is taken below.
+ANY_CHAT = object()
+# An end notice more than this late (the bot was down) is dropped.
+LATE_NOTICE = 15 * 60
+
+
+@dataclass(frozen=True, slots=True)
+class TimedEvent:
+    name: str
+    key: str
+    label: str
+    duration: int
+
+
+TIMED_EVENTS = {event.name: event for event in (
+    TimedEvent('bogo', 'bogo_active_until', "BOGO Sale 🎁", 15 * 60),
+    TimedEvent('rushhour', 'rush_hour_until', "Rush Hour ⏰", 60 * 60),
+    TimedEvent('truce', 'truce_until', "Truce 🤝", 15 * 60),
+    TimedEvent('coinrush', 'coin_rush_until', "Coin Rush 💰", 10 * 60),
+    TimedEvent('freebiefrenzy', 'freebie_frenzy_until', "Freebie Frenzy 🎁", 15 * 60),
+)}
+
+
+@dataclass(slots=True)
+class EventWindow:
+    """One timed event on the schedule: `name` runs in `chat_id` (None for every chat) from `start` to `end`."""
+    window_id: str
+    name: str
+    chat_id: int
+    start: float
+    end: float
+    started: bool = False
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'EventWindow':
+        chat_id = data.get('chat_id')
+        return cls(str(data['window_id']), data['name'], int(chat_id) if chat_id is not None else None,
+                   float(data['start']), float(data['end']), bool(data.get('started')))
+
+
+def parse_start(text: str, now: float, tz) -> float:
+    """Start time of `/scheduleevent`: "HH:MM" (the next time the clock in `tz` shows it) or "+N" minutes from now.
+    Raises ValueError if the text is neither."""
+    text = text.strip().lower()
+    match = re.fullmatch(r'\+(\d+)(m|h)?', text)
+    if match:
+        minutes = int(match.group(1)) * (60 if match.group(2) == 'h' else 1)
+        return now + minutes * 60
+    match = re.fullmatch(r'(\d{1,2}):(\d{2})', text)
+    if not match or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+        raise ValueError(text)
+    local = datetime.fromtimestamp(now, tz)
+    start = local.replace(hour=int(match.group(1)), minute=int(match.group(2)), second=0, microsecond=0)
+    if start.timestamp() <= now:
+        start += timedelta(days=1)
+    return start.timestamp()
+
+
+def _timestamp(value) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class EventClock:
+    """Which timed events are running, as one cached bitmask per scope, plus the schedule of future ones.
+
+    `load(state)` is handed the game state whenever it is read or written and keeps the `*_until` timers of
+    the global scope (None) and of every chat. The masks are only recomputed once the earliest running
+    event ends, so `active()` is a comparison and a few dict lookups instead of a game-state read.
+
+    Scheduled windows are kept in memory (persist `dump()`, reload with `restore()`). The clock thread
+    sleeps until the next window starts or ends and hands the windows that are due to `on_due(starting,
+    ending)`; each window is handed over exactly once.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.ends = {}
+        self.masks = {}
+        self.next_flip = 0.0
+        self.loaded = False
+        self.windows = {}
+        self.lock = threading.Lock()
+        self.wake_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.on_due = None
+        self.stats = {'flips': 0, 'started': 0, 'ended': 0, 'missed': 0}
+
+    # --- ACTIVE FLAGS ---
+    def load(self, state: dict):
+        """Takes the event timers of the global state and of each chat in state['chats']."""
+        ends = {None: {key: _timestamp(state.get(key)) for key in EVENT_FLAGS}}
+        chats = state.get('chats')
+        for chat_id, chat_state in (chats.items() if isinstance(chats, dict) else ()):
+            try:
+                scope = int(chat_id)
+            except (TypeError, ValueError):
+                continue
+            if isinstance(chat_state, dict):
+                ends[scope] = {key: _timestamp(chat_state.get(key)) for key in EVENT_FLAGS}
+        self.ends = ends
+        self.loaded = True
+        self._flip(self.clock())
+
+    def _flip(self, now: float):
+        masks, next_flip = {}, float('inf')
+        for scope, timers in self.ends.items():
+            mask = 0
+            for key, end in timers.items():
+                if end > now:
+                    mask |= EVENT_FLAGS[key]
+                    next_flip = min(next_flip, end)
+            masks[scope] = mask
+        self.masks, self.next_flip = masks, next_flip
+        self.stats['flips'] += 1
+
+    def mask(self, chat_ids=()) -> int:
+        """Events running globally or in any of the given chats."""
+        now = self.clock()
+        if now >= self.next_flip:
+            self._flip(now)
+        masks = self.masks
+        mask = masks.get(None, 0)
+        for chat_id in chat_ids:
+            mask |= masks.get(int(chat_id), 0)
+        return mask
+
+    def active(self, flag: int, chat_ids=()) -> bool:
+        return bool(self.mask(chat_ids) & flag)
+
+    def running(self, chat_ids=()) -> list:
+        mask = self.mask(chat_ids)
+        return [key for key, flag in EVENT_FLAGS.items() if mask & flag]
+
+    # --- SCHEDULE ---
+    def schedule(self, name: str, chat_id: int, start: float, end: float, started: bool = False) -> EventWindow:
+        window = EventWindow(uuid.uuid4().hex[:6], name, chat_id, start, end, started)
+        with self.lock:
+            self.windows[window.window_id] = window
+        self.wake_event.set()
+        return window
+
+    def cancel(self, window_id: str, chat_id=ANY_CHAT):
+        """Removes a window (only from `chat_id`'s schedule if given). Returns it, or None if there was none."""
+        with self.lock:
+            window = self.windows.get(window_id)
+            if window is None or (chat_id is not ANY_CHAT and window.chat_id != chat_id):
+                return None
+            return self.windows.pop(window_id)
+
+    def discard(self, names, chat_id=ANY_CHAT) -> list:
+        """Removes the running windows of the named events, e.g. when an admin ends them early."""
+        with self.lock:
+            gone = [w for w in self.windows.values()
+                    if w.started and w.name in names and (chat_id is ANY_CHAT or w.chat_id == chat_id)]
+            for window in gone:
+                del self.windows[window.window_id]
+        return gone
+
+    def upcoming(self, chat_id=ANY_CHAT) -> list:
+        with self.lock:
+            windows = [w for w in self.windows.values() if chat_id is ANY_CHAT or w.chat_id == chat_id]
+        return sorted(windows, key=lambda w: (w.start, w.end))
+
+    def due(self, now: float):
+        """([windows starting], [windows ending]) at `now`. Starting ones are marked started, ending ones removed."""
+        starting, ending = [], []
+        with self.lock:
+            for window in list(self.windows.values()):
+                if not window.started and window.start <= now:
+                    window.started = True
+                    starting.append(window)
+                if window.started and window.end <= now:
+                    ending.append(self.windows.pop(window.window_id))
+        return starting, ending
+
+    def next_boundary(self, now: float) -> float:
+        with self.lock:
+            times = [w.end if w.started else w.start for w in self.windows.values()]
+        return min(times, default=now + 3600)
+
+    def dump(self) -> list:
+        with self.lock:
+            return [w.to_dict() for w in self.windows.values()]
+
+    def restore(self, entries) -> int:
+        """Loads persisted windows (see dump). Returns how many were restored."""
+        restored = 0
+        for data in entries if isinstance(entries, list) else ():
+            try:
+                window = EventWindow.from_dict(data)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable scheduled event {data!r}: {e}")
+                continue
+            if window.name in TIMED_EVENTS:
+                with self.lock:
+                    self.windows.setdefault(window.window_id, window)
+                restored += 1
+        self.wake_event.set()
+        return restored
+
+    def snapshot(self) -> dict:
+        return {**self.stats, 'running': self.running(), 'scheduled': len(self.windows),
+                'next_boundary': round(self.next_boundary(self.clock()), 1) if self.windows else None}
+
+    # --- BACKGROUND THREAD ---
+    def start(self, on_due):
+        """Hands due windows to `on_due(starting, ending)` from a daemon thread, waking at each window boundary."""
+        self.on_due = on_due
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name='event-clock', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            self.wake_event.clear()
+            now = self.clock()
+            starting, ending = self.due(now)
+            # Windows that ended while the bot was down are dropped unannounced.
+            missed = {w.window_id for w in starting if w.end <= now} | {w.window_id for w in ending if now - w.end > LATE_NOTICE}
+            starting = [w for w in starting if w.window_id not in missed]
+            ending = [w for w in ending if w.window_id not in missed]
+            if starting or ending or missed:
+                self.stats['started'] += len(starting)
+                self.stats['ended'] += len(ending)
+                self.stats['missed'] += len(missed)
+                try:
+                    self.on_due(starting, ending)
+                except Exception as e:
+                    logger.error(f"Scheduled event handling failed: {e}", exc_info=True)
+            self.wake_event.wait(max(0.0, self.next_boundary(self.clock()) - self.clock()))
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake_event.set()
@@ -0,0 +1,113 @@
+import functools
+import threading
+import time
+from contextvars import ContextVar
+
+# Name of the innermost data-access helper running, used to label the round trips it makes.
+_DB_HELPER = ContextVar('db_helper', default='other')
+
+
+def current_helper() -> str:
+    return _DB_HELPER.get()
+
+def db_helper(func):
+    """Labels every Supabase round trip made inside func with func's name."""
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _DB_HELPER.set(name)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _DB_HELPER.reset(token)
+    return wrapper
+
+
+class _InstrumentedQuery:
+    """Wraps a Supabase query builder so the round trip made by execute() is timed."""
+
+    __slots__ = ('_query', '_table', '_observers')
+
+    def __init__(self, query, table: str, observers: list):
+        self._query = query
+        self._table = table
+        self._observers = observers
+
+    def __getattr__(self, name):
+        attr = getattr(self._query, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if hasattr(result, 'execute') and not isinstance(result, _InstrumentedQuery):
+                return _InstrumentedQuery(result, self._table, self._observers)
+            return result
+        return call
+
+    def execute(self):
+        start = time.perf_counter()
+        ok = False
+        try:
+            result = self._query.execute()
+            ok = True
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            for observer in self._observers:
+                observer(self._table, elapsed, ok)
+
+
+class InstrumentedClient:
+    """Supabase client proxy that reports every table round trip to its observers.
+
+    Observers are called as observer(table, seconds, ok) after each execute(); everything else is
+    passed through to the wrapped client untouched.
+    """
+
+    def __init__(self, client, observers=None):
+        self._client = client
+        self.observers = list(observers or [])
+
+    def table(self, name: str):
+        return _InstrumentedQuery(self._client.table(name), name, self.observers)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class LazyClient:
+    """Builds a client on first use, so importing the bot opens no connections.
+
+    Truthy until the factory has been tried and failed, which keeps `if not db:` guards meaningful.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._failed = False
+        self._lock = threading.Lock()
+
+    def __bool__(self) -> bool:
+        return not self._failed
+
+    def connect(self):
+        """Creates the client now (e.g. from a warm-up thread) instead of on the first query."""
+        return self._get()
+
+    def _get(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None and not self._failed:
+                    try:
+                        self._client = self._factory()
+                    except Exception:
+                        self._failed = True
+                        raise
+        if self._client is None:
+            raise RuntimeError("client could not be created")
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
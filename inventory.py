@@ -0,0 +1,112 @@
+import random
+
+# --- CARD INDEX TABLE ---
+# Bit position of every card in an inventory mask. This table is persisted in the
+# `cards_mask` column, so entries must only ever be appended, never reordered or removed.
+CARD_INDEX_TABLE = (
+    # Tier 1
+    'speed', 'vision', 'angel', 'blackout', 'reroll', 'black_market', 'lottery_ticket', 'insurance',
+    # Tier 2
+    'flame', 'glitch', 'shackle', 'spotlight', 'time_warp', 'mirage', 'dispel', 'double_or_nothing',
+    # Tier 3
+    'forcefield', 'trap', 'ricochet', 'clairvoyance', 'devil', 'karma', 'swap', 'steal',
+    'inflation', 'purge', 'vortex', 'amnesia', 'frenzy',
+    # Tier 4
+    'god',
+)
+
+CARD_BITS = {card_id: 1 << i for i, card_id in enumerate(CARD_INDEX_TABLE)}
+MASK_WIDTH = 32
+
+if len(CARD_INDEX_TABLE) > MASK_WIDTH:
+    raise ValueError(f"Card index table has {len(CARD_INDEX_TABLE)} entries but inventory masks are {MASK_WIDTH}-bit.")
+
+
+class CardInventory:
+    """A set of held cards (at most one of each) stored as a 32-bit mask over CARD_INDEX_TABLE."""
+
+    __slots__ = ('mask',)
+
+    def __init__(self, mask: int = 0):
+        self.mask = int(mask) & 0xFFFFFFFF
+
+    @classmethod
+    def from_cards(cls, cards) -> 'CardInventory':
+        """Builds an inventory from a legacy list of card ids. Unknown ids and duplicates are dropped."""
+        mask = 0
+        for card_id in cards or []:
+            mask |= CARD_BITS.get(card_id, 0)
+        return cls(mask)
+
+    @classmethod
+    def of(cls, *card_ids) -> 'CardInventory':
+        return cls.from_cards(card_ids)
+
+    def to_list(self) -> list:
+        """Returns the legacy list form, in card-index order."""
+        return list(self)
+
+    def __contains__(self, card_id) -> bool:
+        return bool(self.mask & CARD_BITS.get(card_id, 0))
+
+    def __iter__(self):
+        mask = self.mask
+        while mask:
+            low = mask & -mask
+            yield CARD_INDEX_TABLE[low.bit_length() - 1]
+            mask ^= low
+
+    def __len__(self) -> int:
+        return bin(self.mask).count('1')
+
+    def __bool__(self) -> bool:
+        return self.mask != 0
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, CardInventory):
+            return self.mask == other.mask
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(self.mask)
+
+    def __repr__(self) -> str:
+        return f"CardInventory({self.to_list()!r})"
+
+    def __or__(self, other: 'CardInventory') -> 'CardInventory':
+        return CardInventory(self.mask | other.mask)
+
+    def __and__(self, other: 'CardInventory') -> 'CardInventory':
+        return CardInventory(self.mask & other.mask)
+
+    def __sub__(self, other: 'CardInventory') -> 'CardInventory':
+        return CardInventory(self.mask & ~other.mask)
+
+    def __xor__(self, other: 'CardInventory') -> 'CardInventory':
+        return CardInventory(self.mask ^ other.mask)
+
+    def add(self, card_id):
+        self.mask |= CARD_BITS[card_id]
+
+    def discard(self, card_id):
+        self.mask &= ~CARD_BITS.get(card_id, 0)
+
+    def remove(self, card_id):
+        if card_id not in self:
+            raise KeyError(card_id)
+        self.discard(card_id)
+
+    def without(self, *card_ids) -> 'CardInventory':
+        return self - CardInventory.of(*card_ids)
+
+    def copy(self) -> 'CardInventory':
+        return CardInventory(self.mask)
+
+    def choice(self, rng=random):
+        """Picks a uniformly random held card id."""
+        return rng.choice(self.to_list())
+
+
+def cards_mask(cards) -> int:
+    """Encodes a legacy card list into the integer `cards_mask` column value."""
+    return CardInventory.from_cards(cards).mask
@@ -0,0 +1,386 @@
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+logger = logging.getLogger(__name__)
+
+# Checkpointed job states; a 'failed' job stays in the checkpoint so it can be retried from its cursor.
+UNFINISHED = ('queued', 'running', 'failed')
+STATE_ICONS = {'queued': "🕒", 'running': "⏳", 'done': "✅", 'cancelled': "🛑", 'failed': "❌"}
+# Fields written to the checkpoint; the rest only describe the current process's run.
+PERSISTED = ('job_id', 'kind', 'title', 'params', 'items', 'event_id', 'chat_id', 'message_id', 'cursor',
+             'state', 'counts', 'notes', 'notes_omitted', 'created', 'finished', 'error', 'resumes', 'recovering')
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(max(0, seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+
+
+@dataclass(slots=True)
+class Job:
+    """One tracked admin operation over a fixed list of items (player ids, gift pairs), done in batches.
+
+    `cursor` is the index of the first item not processed yet; with `items` and `params` it is everything
+    needed to pick the job up again after a restart. `recovering` is set for the first batch after one,
+    which may have been partly applied before the process died.
+    """
+    job_id: str
+    kind: str
+    title: str
+    params: dict
+    items: list
+    event_id: str = None
+    chat_id: int = None
+    message_id: int = None
+    cursor: int = 0
+    state: str = 'queued'
+    counts: dict = field(default_factory=dict)
+    notes: list = field(default_factory=list)
+    notes_omitted: int = 0
+    created: float = field(default_factory=time.time)
+    finished: float = None
+    error: str = None
+    resumes: int = 0
+    recovering: bool = False
+    cancel_requested: bool = False
+    run_started: float = None
+    run_cursor: int = 0
+    last_edit: float = 0.0
+
+    MAX_NOTES = 50
+
+    @property
+    def total(self) -> int:
+        return len(self.items)
+
+    def add(self, key: str, amount: int = 1):
+        self.counts[key] = self.counts.get(key, 0) + amount
+
+    def note(self, line: str):
+        """Keeps a line for the job's final summary; past MAX_NOTES lines they are only counted."""
+        if len(self.notes) < self.MAX_NOTES:
+            self.notes.append(line)
+        else:
+            self.notes_omitted += 1
+
+    def summary(self, header: str) -> str:
+        lines = [header, *self.notes]
+        if self.notes_omitted:
+            lines.append(f"…and {self.notes_omitted} more.")
+        return "\n".join(lines)
+
+    def eta(self, now: float = None):
+        """Seconds left at the rate of the current run, or None before the first batch is done."""
+        done = self.cursor - self.run_cursor
+        if self.run_started is None or done <= 0:
+            return None
+        now = time.time() if now is None else now
+        return (self.total - self.cursor) * (now - self.run_started) / done
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in PERSISTED}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Job':
+        return cls(**{name: data[name] for name in PERSISTED if name in data})
+
+
+@dataclass(slots=True)
+class JobKind:
+    """`run_batch(bot, job, items)` applies one batch; `finish(bot, job)` runs once the job ends, however it ends."""
+    run_batch: object
+    finish: object = None
+
+
+class JobRunner:
+    """Runs long admin operations (see Job) as tracked background jobs on a dedicated event loop thread.
+
+    A handler builds a job with `create()`, posts its progress message and hands both to `submit()`, then
+    returns. Items are worked through `batch_size` at a time by the kind's `run_batch`, with at most
+    `max_concurrency` jobs running at once; the rest wait as queued. After every batch the cursor is
+    checkpointed to `path` and the progress message is edited in place (at most every `progress_interval`
+    seconds) with n/N, an ETA and a Cancel button. `cancel()` stops a job after its current batch.
+    `resume()` restarts the jobs a previous process left unfinished from their last checkpoint.
+
+    The thread has its own event loop so a long job never holds up the loop that handles updates;
+    `bot_factory()` builds the Bot used on it. `observe(kind, seconds)` is told each job's duration,
+    and `drain()` is awaited once a job has finished, before its final progress edit.
+    """
+
+    HISTORY = 20
+
+    def __init__(self, bot_factory, path: str = None, max_concurrency: int = 1, batch_size: int = 50,
+                 progress_interval: float = 3.0, observe=None, drain=None):
+        self.bot_factory = bot_factory
+        self.path = path
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.batch_size = max(1, int(batch_size))
+        self.progress_interval = progress_interval
+        self.observe = observe
+        self.drain = drain
+        self.kinds = {}
+        self.jobs = OrderedDict()
+        self.futures = {}
+        self.lock = threading.Lock()
+        self.loop = None
+        self.thread = None
+        self.bot = None
+        self._semaphore = None
+        self._bot_lock = None
+        self.stats = {'submitted': 0, 'resumed': 0, 'done': 0, 'cancelled': 0, 'failed': 0}
+
+    def register(self, kind: str, run_batch, finish=None):
+        self.kinds[kind] = JobKind(run_batch, finish)
+
+    # --- JOBS ---
+    def create(self, kind: str, title: str, items, params: dict = None, event_id: str = None) -> Job:
+        """A queued job, not started yet: render its progress message, then submit() it."""
+        if kind not in self.kinds:
+            raise KeyError(kind)
+        return Job(uuid.uuid4().hex[:8], kind, title, dict(params or {}), list(items), event_id=event_id)
+
+    def submit(self, job: Job, chat_id: int = None, message_id: int = None) -> Job:
+        job.chat_id, job.message_id = chat_id, message_id
+        if message_id is not None:
+            # The message was just posted with the job's current state; the first progress edit can wait.
+            job.last_edit = time.time()
+        with self.lock:
+            self.jobs[job.job_id] = job
+            self._prune()
+        self.stats['submitted'] += 1
+        self._schedule(job)
+        return job
+
+    def get(self, job_id: str):
+        return self.jobs.get(job_id)
+
+    def active(self) -> list:
+        return [job for job in self.jobs.values() if job.state in ('queued', 'running')]
+
+    def recent(self) -> list:
+        return list(reversed(self.jobs.values()))
+
+    def active_for_event(self, event_id: str):
+        """The queued or running job writing under `event_id`, if any."""
+        return next((job for job in self.active() if job.event_id == event_id), None)
+
+    def cancel(self, job_id: str):
+        """Asks a queued or running job to stop after its current batch. Returns the job, or None."""
+        job = self.jobs.get(job_id)
+        if job is None or job.state not in ('queued', 'running'):
+            return None
+        job.cancel_requested = True
+        return job
+
+    def retry(self, job_id: str):
+        """Restarts a failed job from its cursor. Returns the job, or None."""
+        job = self.jobs.get(job_id)
+        if job is None or job.state != 'failed':
+            return None
+        job.state, job.error, job.finished, job.recovering = 'queued', None, None, True
+        self._schedule(job)
+        return job
+
+    def wait(self, timeout: float = None) -> bool:
+        """Blocks until every submitted job has ended. Returns False on timeout."""
+        pending = [f for f in self.futures.values() if not f.done()]
+        if not pending:
+            return True
+        _, not_done = concurrent.futures.wait(pending, timeout=timeout)
+        return not not_done
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.state in ('done', 'cancelled')]
+        for job_id in finished[:max(0, len(finished) - self.HISTORY)]:
+            self.jobs.pop(job_id, None)
+            self.futures.pop(job_id, None)
+
+    # --- PROGRESS ---
+    def render(self, job: Job, now: float = None) -> str:
+        now = time.time() if now is None else now
+        total = job.total
+        filled = round(10 * job.cursor / total) if total else 10
+        percent = round(100 * job.cursor / total) if total else 100
+        lines = [
+            f"{STATE_ICONS.get(job.state, '⏳')} {job.title}",
+            f"{'▓' * filled}{'░' * (10 - filled)} {job.cursor:,}/{total:,} ({percent}%)",
+        ]
+        if job.counts:
+            lines.append(" · ".join(f"{key} {value:,}" for key, value in job.counts.items()))
+        if job.state == 'running':
+            eta = job.eta(now)
+            lines.append(f"ETA ~{format_duration(eta)}" if eta is not None else "ETA: estimating…")
+            if job.cancel_requested:
+                lines.append("Cancelling after this batch…")
+        elif job.state == 'queued':
+            lines.append("Waiting for another job to finish…" if self.loop else "Starting…")
+        elif job.state == 'done':
+            lines.append(f"Done in {format_duration((job.finished or now) - job.created)}.")
+        elif job.state == 'cancelled':
+            lines.append(f"Cancelled after {job.cursor:,} of {total:,}.")
+        elif job.state == 'failed':
+            lines.append(f"Failed: {job.error}. /jobs retry {job.job_id} resumes it.")
+        lines.append(f"Job {job.job_id}")
+        return "\n".join(lines)
+
+    def markup(self, job: Job):
+        if job.state not in ('queued', 'running') or job.cancel_requested:
+            return None
+        return InlineKeyboardMarkup([[InlineKeyboardButton("🛑 Cancel", callback_data=f"job:cancel:{job.job_id}")]])
+
+    async def _show(self, bot, job: Job, force: bool = False):
+        if job.chat_id is None or job.message_id is None:
+            return
+        now = time.time()
+        if not force and now - job.last_edit < self.progress_interval:
+            return
+        job.last_edit = now
+        try:
+            await bot.edit_message_text(chat_id=job.chat_id, message_id=job.message_id,
+                                        text=self.render(job, now), reply_markup=self.markup(job))
+        except Exception as e:
+            if 'not modified' not in str(e).lower():
+                logger.warning(f"Could not update progress of job {job.job_id}: {e}")
+
+    # --- CHECKPOINT ---
+    def save(self):
+        """Writes every unfinished job to the checkpoint, or removes it when there are none. Job thread only."""
+        if not self.path:
+            return
+        jobs = [job.to_dict() for job in self.jobs.values() if job.state in UNFINISHED]
+        try:
+            if not jobs:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                return
+            tmp = f"{self.path}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'jobs': jobs}, f, separators=(',', ':'), default=str)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write job checkpoint {self.path}: {e}")
+
+    def resume(self) -> int:
+        """Loads the checkpoint and restarts its queued and running jobs. Failed ones wait for /jobs retry."""
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                saved = [Job.from_dict(data) for data in json.load(f).get('jobs', [])]
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable job checkpoint {self.path}: {e}")
+            return 0
+        resumed = 0
+        for job in saved:
+            if job.kind not in self.kinds or job.job_id in self.jobs:
+                continue
+            with self.lock:
+                self.jobs[job.job_id] = job
+            if job.state in ('queued', 'running'):
+                job.state, job.recovering = 'queued', True
+                job.resumes += 1
+                resumed += 1
+                self._schedule(job)
+        self.stats['resumed'] += resumed
+        if resumed:
+            logger.info(f"Resuming {resumed} admin jobs from {self.path}.")
+        return resumed
+
+    # --- EVENT LOOP THREAD ---
+    def call(self, func, *args) -> concurrent.futures.Future:
+        """Runs `await func(bot, *args)` on the job thread's loop, for other background work that talks to Telegram."""
+        self._ensure_loop()
+
+        async def run():
+            return await func(await self._get_bot(), *args)
+        return asyncio.run_coroutine_threadsafe(run(), self.loop)
+
+    def _schedule(self, job: Job):
+        self._ensure_loop()
+        self.futures[job.job_id] = asyncio.run_coroutine_threadsafe(self._run(job), self.loop)
+
+    def _ensure_loop(self):
+        with self.lock:
+            if self.loop is not None:
+                return
+            ready = threading.Event()
+            self.thread = threading.Thread(target=self._loop_main, args=(ready,), name='jobs', daemon=True)
+            self.thread.start()
+            ready.wait()
+
+    def _loop_main(self, ready: threading.Event):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._bot_lock = asyncio.Lock()
+        self.loop = loop
+        ready.set()
+        loop.run_forever()
+
+    async def _get_bot(self):
+        async with self._bot_lock:
+            if self.bot is None:
+                bot = self.bot_factory()
+                await bot.initialize()
+                self.bot = bot
+        return self.bot
+
+    async def _run(self, job: Job):
+        kind = self.kinds[job.kind]
+        self.save()
+        bot = None
+        try:
+            bot = await self._get_bot()
+            async with self._semaphore:
+                if not job.cancel_requested:
+                    job.state, job.run_started, job.run_cursor = 'running', time.time(), job.cursor
+                    await self._show(bot, job)
+                    while job.cursor < job.total and not job.cancel_requested:
+                        batch = job.items[job.cursor:job.cursor + self.batch_size]
+                        await kind.run_batch(bot, job, batch)
+                        job.cursor += len(batch)
+                        job.recovering = False
+                        self.save()
+                        await self._show(bot, job)
+                job.state = 'done' if job.cursor >= job.total else 'cancelled'
+        except Exception as e:
+            job.state, job.error = 'failed', str(e) or type(e).__name__
+            logger.error(f"Job {job.job_id} ({job.kind}) failed at {job.cursor}/{job.total}: {e}", exc_info=True)
+        job.finished = time.time()
+        self.stats[job.state] += 1
+        if self.observe:
+            self.observe(job.kind, job.finished - (job.run_started or job.finished))
+        if bot is not None:
+            if kind.finish:
+                try:
+                    await kind.finish(bot, job)
+                except Exception as e:
+                    logger.error(f"Finishing job {job.job_id} ({job.kind}) failed: {e}", exc_info=True)
+            if self.drain:
+                try:
+                    await self.drain()
+                except Exception as e:
+                    logger.warning(f"Draining after job {job.job_id} failed: {e}")
+            await self._show(bot, job, force=True)
+        self.save()
+        logger.info(f"Job {job.job_id} ({job.title}) {job.state} at {job.cursor}/{job.total}.")
+
+    def snapshot(self) -> dict:
+        return {**self.stats, 'active': [
+            {'job_id': job.job_id, 'kind': job.kind, 'state': job.state, 'done': job.cursor, 'total': job.total}
+            for job in self.active()
+        ]}
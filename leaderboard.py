@@ -0,0 +1,152 @@
+import math
+import random
+
+
+class _Node:
+    __slots__ = ('value', 'next', 'width')
+
+    def __init__(self, value, levels: int):
+        self.value = value
+        self.next = [None] * levels
+        self.width = [1] * levels
+
+
+class IndexableSkipList:
+    """Sorted container with O(log n) insert, remove, rank lookup and positional access."""
+
+    MAX_LEVELS = 24
+
+    def __init__(self):
+        self.head = _Node(None, self.MAX_LEVELS)
+        self.size = 0
+        # Private RNG so level draws never disturb the game's random streams.
+        self._rng = random.Random()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def insert(self, value):
+        chain = [None] * self.MAX_LEVELS
+        steps_at_level = [0] * self.MAX_LEVELS
+        node = self.head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].value <= value:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        levels = min(self.MAX_LEVELS, 1 - int(math.log(1.0 - self._rng.random(), 2.0)))
+        new_node = _Node(value, levels)
+        steps = 0
+        for level in range(levels):
+            prev = chain[level]
+            new_node.next[level] = prev.next[level]
+            prev.next[level] = new_node
+            new_node.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(levels, self.MAX_LEVELS):
+            chain[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, value):
+        chain = [None] * self.MAX_LEVELS
+        node = self.head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].value < value:
+                node = node.next[level]
+            chain[level] = node
+
+        target = chain[0].next[0]
+        if target is None or target.value != value:
+            raise KeyError(value)
+        for level in range(len(target.next)):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(len(target.next), self.MAX_LEVELS):
+            chain[level].width[level] -= 1
+        self.size -= 1
+
+    def bisect_left(self, value) -> int:
+        """Returns the position of the first element >= value."""
+        node = self.head
+        position = 0
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].value < value:
+                position += node.width[level]
+                node = node.next[level]
+        return position
+
+    def index(self, value) -> int:
+        """Returns the 0-based position of value."""
+        position = self.bisect_left(value)
+        if position >= self.size or self[position] != value:
+            raise ValueError(value)
+        return position
+
+    def __getitem__(self, i: int):
+        if i < 0:
+            i += self.size
+        if not 0 <= i < self.size:
+            raise IndexError(i)
+        node = self.head
+        i += 1
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and node.width[level] <= i:
+                i -= node.width[level]
+                node = node.next[level]
+        return node.value
+
+    def __iter__(self):
+        node = self.head.next[0]
+        while node is not None:
+            yield node.value
+            node = node.next[0]
+
+
+class Leaderboard:
+    """Ranks user ids by a score (highest first, ties broken by lowest user id)."""
+
+    def __init__(self):
+        self._entries = IndexableSkipList()
+        self._scores = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, user_id) -> bool:
+        return user_id in self._scores
+
+    def update(self, user_id, score):
+        old = self._scores.get(user_id)
+        if old == score:
+            return
+        if old is not None:
+            self._entries.remove((-old, user_id))
+        self._entries.insert((-score, user_id))
+        self._scores[user_id] = score
+
+    def discard(self, user_id):
+        old = self._scores.pop(user_id, None)
+        if old is not None:
+            self._entries.remove((-old, user_id))
+
+    def score(self, user_id):
+        return self._scores.get(user_id)
+
+    def rank(self, user_id):
+        """Returns the 1-based rank of user_id, or None if they are not ranked."""
+        score = self._scores.get(user_id)
+        if score is None:
+            return None
+        return self._entries.index((-score, user_id)) + 1
+
+    def top(self, n: int = 10) -> list:
+        """Returns up to n (user_id, score) pairs, best first."""
+        out = []
+        for neg_score, user_id in self._entries:
+            if len(out) >= n:
+                break
+            out.append((user_id, -neg_score))
+        return out
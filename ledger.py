@@ -0,0 +1,230 @@
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# (event_id, reason) for the code currently running; every balance or inventory change is filed under it.
+_CURRENT_EVENT = ContextVar('ledger_event', default=('unscoped', ''))
+
+
+def new_event_id(kind: str) -> str:
+    return f"{kind}:{uuid.uuid4().hex[:12]}"
+
+def current_event() -> tuple:
+    return _CURRENT_EVENT.get()
+
+def set_event(event_id: str, reason: str = ''):
+    """Sets the current event for the rest of this context. Returns a token for ContextVar.reset()."""
+    return _CURRENT_EVENT.set((event_id, reason))
+
+@contextmanager
+def ledger_event(kind: str, reason: str = '', event_id: str = None):
+    """Files every change made inside the block under one new event id, which is yielded."""
+    event_id = event_id or new_event_id(kind)
+    token = _CURRENT_EVENT.set((event_id, reason or kind))
+    try:
+        yield event_id
+    finally:
+        _CURRENT_EVENT.reset(token)
+
+
+@dataclass(slots=True)
+class LedgerEntry:
+    """One coin delta (`coins`) or one card gained/lost (`card_id`, `card_delta` of +1/-1) for a player."""
+    event_id: str
+    user_id: int
+    coins: int = 0
+    card_id: Optional[str] = None
+    card_delta: int = 0
+    reason: str = ''
+    ts: float = field(default_factory=time.time)
+
+    def to_row(self) -> dict:
+        return {
+            'event_id': self.event_id, 'user_id': self.user_id, 'coins': self.coins,
+            'card_id': self.card_id, 'card_delta': self.card_delta, 'reason': self.reason, 'ts': self.ts,
+        }
+
+    @classmethod
+    def from_row(cls, row: dict) -> 'LedgerEntry':
+        return cls(
+            event_id=row.get('event_id') or '', user_id=int(row.get('user_id') or 0), coins=int(row.get('coins') or 0),
+            card_id=row.get('card_id'), card_delta=int(row.get('card_delta') or 0), reason=row.get('reason') or '',
+            ts=float(row.get('ts') or 0),
+        )
+
+
+# --- STORES ---
+
+class SupabaseLedgerStore:
+    """Stores entries in a Supabase `ledger` table:
+
+        create table ledger (id bigserial primary key, event_id text not null, user_id bigint not null,
+                             coins integer default 0, card_id text, card_delta integer default 0,
+                             reason text, ts double precision not null);
+        create index on ledger (user_id, ts desc);
+        create index on ledger (event_id);
+    """
+
+    def __init__(self, get_client):
+        # Looked up on every call so a replaced client (tests, simulator) is picked up.
+        self.get_client = get_client
+
+    def write(self, rows: list):
+        client = self.get_client()
+        if client is None:
+            raise RuntimeError("Database not available.")
+        client.table('ledger').insert(rows).execute()
+
+    def by_user(self, user_id: int, limit: int) -> list:
+        res = self.get_client().table('ledger').select('*').eq('user_id', user_id).order('ts', desc=True).limit(limit).execute()
+        return res.data or []
+
+    def by_event(self, event_id: str) -> list:
+        res = self.get_client().table('ledger').select('*').eq('event_id', event_id).execute()
+        return res.data or []
+
+
+class SQLiteLedgerStore:
+    """Stores entries in a local SQLite journal file."""
+
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            self.conn.execute(
+                "create table if not exists ledger (id integer primary key, event_id text not null, user_id integer not null, "
+                "coins integer default 0, card_id text, card_delta integer default 0, reason text, ts real not null)"
+            )
+            self.conn.execute("create index if not exists ledger_user on ledger (user_id, ts)")
+            self.conn.execute("create index if not exists ledger_event on ledger (event_id)")
+
+    def write(self, rows: list):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "insert into ledger (event_id, user_id, coins, card_id, card_delta, reason, ts) "
+                "values (:event_id, :user_id, :coins, :card_id, :card_delta, :reason, :ts)",
+                rows,
+            )
+
+    def by_user(self, user_id: int, limit: int) -> list:
+        with self.lock:
+            cur = self.conn.execute("select * from ledger where user_id = ? order by ts desc, id desc limit ?", (int(user_id), limit))
+            return [dict(row) for row in cur.fetchall()]
+
+    def by_event(self, event_id: str) -> list:
+        with self.lock:
+            cur = self.conn.execute("select * from ledger where event_id = ? order by id", (event_id,))
+            return [dict(row) for row in cur.fetchall()]
+
+
+# --- LEDGER ---
+
+class Ledger:
+    """Append-only journal of coin and card changes.
+
+    Entries are buffered and written in batches by a daemon thread, so recording a change never adds a
+    round trip to the handler that made it. Reads flush the buffer first so they always see every entry.
+    """
+
+    MAX_BUFFER = 10000
+
+    def __init__(self, store, flush_interval: float = 2.0, batch_size: int = 500):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def record_change(self, user_id: int, old_coins: int, new_coins: int, old_cards, new_cards):
+        """Journals the difference between two snapshots of a player's coins and CardInventory."""
+        event_id, reason = _CURRENT_EVENT.get()
+        now = time.time()
+        entries = []
+        if new_coins != old_coins:
+            entries.append(LedgerEntry(event_id, user_id, coins=new_coins - old_coins, reason=reason, ts=now))
+        for card_id in new_cards - old_cards:
+            entries.append(LedgerEntry(event_id, user_id, card_id=card_id, card_delta=1, reason=reason, ts=now))
+        for card_id in old_cards - new_cards:
+            entries.append(LedgerEntry(event_id, user_id, card_id=card_id, card_delta=-1, reason=reason, ts=now))
+        if entries:
+            self.append(*entries)
+
+    def append(self, *entries: LedgerEntry):
+        with self.lock:
+            self.buffer.extend(entries)
+            overflow = len(self.buffer) - self.MAX_BUFFER
+            if overflow > 0:
+                del self.buffer[:overflow]
+                logger.error(f"Ledger buffer full; dropped {overflow} oldest entries.")
+            full = len(self.buffer) >= self.batch_size
+        self._ensure_thread()
+        if full:
+            self.wakeup.set()
+
+    def flush(self) -> int:
+        """Writes all buffered entries. On failure they stay buffered for the next attempt."""
+        with self.flush_lock:
+            with self.lock:
+                batch, self.buffer = self.buffer, []
+            if not batch:
+                return 0
+            written = 0
+            try:
+                while written < len(batch):
+                    chunk = batch[written:written + self.batch_size]
+                    self.store.write([entry.to_row() for entry in chunk])
+                    written += len(chunk)
+            except Exception as e:
+                logger.warning(f"Ledger flush failed, will retry: {e}")
+                with self.lock:
+                    self.buffer[:0] = batch[written:]
+            return written
+
+    def _ensure_thread(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, name='ledger-flush', daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    # --- QUERIES ---
+    def history(self, user_id: int, limit: int = 20) -> list:
+        """Most recent entries for a player, newest first."""
+        self.flush()
+        return [LedgerEntry.from_row(row) for row in self.store.by_user(user_id, limit)]
+
+    def event_entries(self, event_id: str) -> list:
+        self.flush()
+        return [LedgerEntry.from_row(row) for row in self.store.by_event(event_id)]
+
+    def inverse(self, event_id: str) -> dict:
+        """Net change per player needed to undo an event: {user_id: {'coins': int, 'add': set, 'remove': set}}."""
+        net = {}
+        for entry in self.event_entries(event_id):
+            change = net.setdefault(entry.user_id, {'coins': 0, 'cards': {}})
+            change['coins'] -= entry.coins
+            if entry.card_id:
+                change['cards'][entry.card_id] = change['cards'].get(entry.card_id, 0) - entry.card_delta
+        out = {}
+        for user_id, change in net.items():
+            add = {cid for cid, d in change['cards'].items() if d > 0}
+            remove = {cid for cid, d in change['cards'].items() if d < 0}
+            if change['coins'] or add or remove:
+                out[user_id] = {'coins': change['coins'], 'add': add, 'remove': remove}
+        return out
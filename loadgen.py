@@ -0,0 +1,360 @@
+"""Webhook load generator.
+
+Replays Telegram updates against /webhook at increasing rates and reports the throughput/latency
+curve and the saturation point: the highest offered rate the bot keeps up with inside the latency
+SLO, which is roughly where Telegram would start timing out and retrying deliveries.
+
+Updates come from a recording or are synthesised from a mix of group chatter, /use, button presses
+and admin commands. By default the bot runs in-process behind the same threaded Flask server as
+production, with the fake Supabase and Bot API from bench.py; --url targets a running deployment.
+
+Recording: set UPDATE_RECORD_PATH on the bot and every webhook update is appended there as one JSON
+line, sanitised (ids pseudonymised, names replaced, free text blanked; commands and buttons kept).
+
+Usage:
+    python loadgen.py --rates 5,10,20,40,80 --duration 10 --concurrency 40
+    python loadgen.py --mix chatter=0.7,use=0.2,callback=0.08,admin=0.02 --db-latency 0.02 --api-latency 0.05
+    python loadgen.py --replay updates.jsonl --rates 10,20,40 --json curve.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import sys
+import threading
+import time
+
+import httpx
+
+DEFAULT_MIX = {'chatter': 0.7, 'use': 0.2, 'callback': 0.08, 'admin': 0.02}
+CHATTER = ("gm", "lol", "who has a Devil card?", "gg", "nice one", "store is open", "brb", "😂", "rush hour when?")
+
+
+def parse_mix(text: str) -> dict:
+    """Parses "chatter=0.7,use=0.2" into normalised weights over the known update kinds."""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown update kind {name!r} (choose from {', '.join(DEFAULT_MIX)})")
+        mix[name] = float(weight or 1)
+    total = sum(mix.values())
+    if total <= 0:
+        raise argparse.ArgumentTypeError("mix weights must add up to more than 0")
+    return {name: weight / total for name, weight in mix.items()}
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+# --- RECORDING ---
+
+class UpdateRecorder:
+    """Appends sanitised copies of webhook updates to a JSON-lines file.
+
+    User and chat ids are replaced by a keyed hash (stable within one salt, so a player keeps the same
+    pseudonym across the recording), usernames are derived from the pseudonymous id, names are
+    replaced and free text is blanked to 'x's of the same length. Commands and button data are kept;
+    @mentions of players seen earlier in the recording point at their pseudonyms. `keep_ids` (the
+    admins) keep their real ids so admin commands still authorise on replay.
+    """
+
+    NAME_KEYS = ('first_name', 'last_name', 'title')
+    DROP_KEYS = ('photo', 'document', 'animation', 'sticker', 'voice', 'video', 'contact', 'location', 'phone_number')
+
+    def __init__(self, path: str, salt: str, keep_ids=()):
+        self.path = path
+        self.salt = salt.encode()
+        self.keep_ids = {int(i) for i in keep_ids}
+        self.usernames = {}
+        self.lock = threading.Lock()
+
+    def pseudonym(self, value: int) -> int:
+        value = int(value)
+        if value in self.keep_ids:
+            return value
+        digest = hashlib.blake2b(str(abs(value)).encode(), key=self.salt[:64], digest_size=6).digest()
+        mapped = 10_000_000 + int.from_bytes(digest, 'big') % 1_000_000_000
+        return -mapped if value < 0 else mapped
+
+    def _text(self, text: str) -> str:
+        if not text.startswith('/'):
+            return ''.join(c if c.isspace() else 'x' for c in text)
+        words = text.split()
+        for i, word in enumerate(words[1:], start=1):
+            if word.startswith('@'):
+                known = self.usernames.get(word[1:].lower())
+                words[i] = f"@user_{abs(known)}" if known else '@user'
+        return ' '.join(words)
+
+    def sanitise(self, value):
+        if isinstance(value, list):
+            return [self.sanitise(v) for v in value]
+        if not isinstance(value, dict):
+            return value
+        if 'is_bot' in value and value.get('username') and isinstance(value.get('id'), int):
+            self.usernames[value['username'].lower()] = self.pseudonym(value['id'])
+        out = {}
+        for key, v in value.items():
+            if key in self.DROP_KEYS:
+                continue
+            if key == 'id' and isinstance(v, int) and ('is_bot' in value or 'type' in value):
+                out[key] = self.pseudonym(v)
+            elif key in self.NAME_KEYS and isinstance(v, str):
+                out[key] = "Player" if key != 'title' else "Group"
+            elif key == 'username' and isinstance(v, str):
+                out[key] = None
+            elif key in ('text', 'caption') and isinstance(v, str):
+                out[key] = self._text(v)
+            elif key == 'entities':
+                out[key] = [e for e in v if e.get('type') == 'bot_command' and e.get('offset') == 0]
+            else:
+                out[key] = self.sanitise(v)
+        # Usernames follow the pseudonymous id, so @mentions can be re-pointed at known players on replay.
+        if 'is_bot' in out and 'id' in out:
+            out['username'] = f"user_{abs(out['id'])}"
+        return out
+
+    def record(self, data: dict):
+        try:
+            line = json.dumps(self.sanitise(data), ensure_ascii=False)
+            with self.lock, open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"Could not record update: {e}")
+
+
+# --- UPDATE SOURCES ---
+
+class SyntheticUpdates:
+    """Realistic update mixes built on a BenchWorld's population of players."""
+
+    def __init__(self, world, mix: dict, seed: int):
+        self.world = world
+        self.mix = mix
+        self.rng = random.Random(seed)
+        self.kinds, self.weights = list(mix), list(mix.values())
+        cards = world.main.POWER_CARDS
+        self.card_ids = [cid for cid in cards if cid != 'god']
+        self.targeted = {cid for cid in self.card_ids if cards[cid]['requires_target']}
+        # Everybody starts with coins and a hand, so /use and buys reach the card rules instead of bouncing.
+        for user_id in world.user_ids:
+            world.reset_player(user_id, coins=1000, cards=self.rng.sample(self.card_ids, 5))
+
+    def player(self) -> int:
+        return self.rng.choice(self.world.user_ids)
+
+    def chatter(self) -> dict:
+        return self.world.message_json(self.player(), self.rng.choice(CHATTER))
+
+    def use(self) -> dict:
+        user_id, card_id = self.player(), self.rng.choice(self.card_ids)
+        if card_id in self.targeted and card_id != 'purge':
+            target = self.rng.choice([uid for uid in self.world.user_ids[:50] if uid != user_id])
+            return self.world.message_json(user_id, f"/use {card_id} @bench_{target}")
+        if card_id == 'purge':
+            return self.world.message_json(user_id, "/use purge Speed", reply_to=self.player())
+        return self.world.message_json(user_id, f"/use {card_id}")
+
+    def callback(self) -> dict:
+        roll, card_id = self.rng.random(), self.rng.choice(self.card_ids)
+        data = f"inspect_{card_id}" if roll < 0.7 else "back_to_store" if roll < 0.9 else f"buy_{card_id}"
+        return self.world.button_json(self.player(), data)
+
+    def admin(self) -> dict:
+        target = self.player()
+        if self.rng.random() < 0.7:
+            return self.world.message_json(self.world.admin_id, f"/award 5 @bench_{target}", group=False)
+        return self.world.message_json(self.world.admin_id, f"/givecard Speed @bench_{target}", group=False)
+
+    def take(self, count: int) -> list:
+        return [getattr(self, self.rng.choices(self.kinds, self.weights)[0])() for _ in range(count)]
+
+
+class RecordedUpdates:
+    """Cycles through a recording, renumbering update ids so replays never repeat one."""
+
+    def __init__(self, path: str, world=None):
+        with open(path, encoding='utf-8') as f:
+            self.updates = [json.loads(line) for line in f if line.strip()]
+        if not self.updates:
+            raise ValueError(f"{path} holds no updates")
+        self.position = 0
+        self.next_id = 1
+        if world is not None:
+            self._register(world)
+
+    def _register(self, world):
+        """Registers every sender of the recording as a player, under its pseudonymous username."""
+        seen = set()
+        for data in self.updates:
+            for kind in ('message', 'edited_message', 'callback_query'):
+                user = (data.get(kind) or {}).get('from')
+                if user and not user.get('is_bot') and user['id'] not in seen:
+                    seen.add(user['id'])
+                    world.reset_player(user['id'], coins=1000, username=user.get('username') or f"user_{user['id']}")
+
+    def take(self, count: int) -> list:
+        out = []
+        for _ in range(count):
+            data = dict(self.updates[self.position % len(self.updates)])
+            data['update_id'] = self.next_id
+            self.position += 1
+            self.next_id += 1
+            out.append(data)
+        return out
+
+
+# --- LOAD ---
+
+async def run_step(url: str, updates: list, rate: float, concurrency: int, timeout: float) -> dict:
+    """Offers `updates` at `rate` per second with at most `concurrency` requests in flight.
+
+    Latency runs from an update's scheduled send time to its response, so time spent waiting for a
+    free connection counts, as it does for Telegram's delivery queue.
+    """
+    limit = asyncio.Semaphore(concurrency)
+    latencies, failures = [], {'errors': 0, 'timeouts': 0}
+    started = time.perf_counter()
+
+    async def send(client, data, scheduled):
+        async with limit:
+            try:
+                res = await client.post(url, json=data)
+                if res.status_code != 200:
+                    failures['errors'] += 1
+                    return
+            except httpx.TimeoutException:
+                failures['timeouts'] += 1
+                return
+            except httpx.HTTPError:
+                failures['errors'] += 1
+                return
+        latencies.append(time.perf_counter() - scheduled)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        tasks = []
+        for i, data in enumerate(updates):
+            scheduled = started + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send(client, data, scheduled)))
+        await asyncio.gather(*tasks)
+
+    elapsed = time.perf_counter() - started
+    failed = failures['errors'] + failures['timeouts']
+    return {
+        'rate': rate,
+        'sent': len(updates),
+        'ok': len(latencies),
+        **failures,
+        'throughput': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        'max_ms': round(max(latencies, default=0.0) * 1000, 1),
+        'error_rate': round(failed / len(updates), 4) if updates else 0.0,
+    }
+
+
+def saturation_point(steps: list, slo_ms: float, keep_up: float = 0.9, max_error_rate: float = 0.01):
+    """(highest sustained rate, first saturated rate). A step is sustained if the bot kept up with at
+    least `keep_up` of the offered rate, met the p99 SLO and failed under `max_error_rate` of updates."""
+    sustained = None
+    for step in steps:
+        if step['throughput'] >= keep_up * step['rate'] and step['p99_ms'] <= slo_ms and step['error_rate'] <= max_error_rate:
+            sustained = step['rate']
+        else:
+            return sustained, step['rate']
+    return sustained, None
+
+
+def start_local_server(main):
+    """Serves the bot's Flask app on a free localhost port with the production threaded server."""
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, main.get_web_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, name='loadgen-server', daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/webhook"
+
+
+def format_report(steps: list, sustained, saturated, slo_ms: float) -> str:
+    lines = [f"{'rate/s':>8} {'sent':>6} {'ok':>6} {'thru/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} {'errors':>7} {'timeouts':>9}"]
+    for s in steps:
+        lines.append(
+            f"{s['rate']:>8g} {s['sent']:>6} {s['ok']:>6} {s['throughput']:>8.1f} {s['p50_ms']:>9.1f} "
+            f"{s['p99_ms']:>9.1f} {s['max_ms']:>9.1f} {s['errors']:>7} {s['timeouts']:>9}"
+        )
+    lines.append("")
+    if sustained is None:
+        lines.append(f"Saturated at the lowest rate tried ({saturated}/s) with a p99 SLO of {slo_ms:g} ms.")
+    elif saturated is None:
+        lines.append(f"Sustained every rate tried (up to {sustained}/s) within a p99 SLO of {slo_ms:g} ms.")
+    else:
+        lines.append(f"Sustains {sustained} updates/s; saturates at {saturated}/s (p99 SLO {slo_ms:g} ms).")
+    return "\n".join(lines)
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Replay Telegram updates against /webhook and find the saturation point.")
+    parser.add_argument('--rates', default='5,10,20,40', help="comma-separated offered rates (updates/s), one step each")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds per step")
+    parser.add_argument('--concurrency', type=int, default=40, help="requests in flight (Telegram's max_connections)")
+    parser.add_argument('--timeout', type=float, default=60.0, help="seconds before a webhook request counts as timed out")
+    parser.add_argument('--slo', type=float, default=1000.0, help="p99 latency (ms) a sustained step must stay under")
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX, help="synthetic mix, e.g. chatter=0.7,use=0.2,callback=0.08,admin=0.02")
+    parser.add_argument('--replay', help="JSON-lines recording (see UPDATE_RECORD_PATH) to replay instead of a synthetic mix")
+    parser.add_argument('--url', help="webhook URL of a running bot; by default the bot runs in-process on fake backends")
+    parser.add_argument('--players', type=int, default=200, help="players in the fake backend")
+    parser.add_argument('--db-latency', type=float, default=0.0, help="seconds added to every fake Supabase round trip")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="seconds added to every fake Bot API call")
+    parser.add_argument('--no-shedding', action='store_true', help="turn load shedding off in the in-process bot")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help="write the curve and saturation point to this file")
+    args = parser.parse_args(argv)
+
+    rates = [float(r) for r in args.rates.split(',') if r.strip()]
+    logging.disable(logging.WARNING)
+
+    world = server = None
+    url = args.url
+    if not url:
+        from bench import BenchWorld
+        world = BenchWorld(max(3, args.players), args.db_latency, args.api_latency, args.seed, shedding=not args.no_shedding)
+        server, url = start_local_server(world.main)
+    if args.replay:
+        source = RecordedUpdates(args.replay, world)
+    elif world is not None:
+        source = SyntheticUpdates(world, args.mix, args.seed)
+    else:
+        parser.error("--url needs --replay: synthetic updates refer to players that only exist in the fake backend")
+
+    steps = []
+    try:
+        for rate in rates:
+            updates = source.take(max(1, int(rate * args.duration)))
+            step = asyncio.run(run_step(url, updates, rate, args.concurrency, args.timeout))
+            steps.append(step)
+            print(f"  {rate:g}/s: {step['throughput']:.1f}/s done, p99 {step['p99_ms']:.0f} ms", file=sys.stderr)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    sustained, saturated = saturation_point(steps, args.slo)
+    print(format_report(steps, sustained, saturated, args.slo))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'config': {k: v for k, v in vars(args).items() if k != 'json'}, 'steps': steps,
+                       'sustained_rate': sustained, 'saturated_rate': saturated}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -1,14 +1,43 @@
 import logging
 import os
 import re
-import random
 import time
 import asyncio
-from flask import Flask, request
+import atexit
+import functools
+import io
+import json
+import signal
+import sys
+import threading
+import datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+IMPORT_STARTED = time.perf_counter()
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Bot
-from telegram.ext import Application, CommandHandler, ContextTypes, CallbackQueryHandler, MessageHandler, filters
+from telegram.ext import Application, CommandHandler, ContextTypes, CallbackQueryHandler, MessageHandler, TypeHandler, filters
 from telegram.request import HTTPXRequest
-from supabase import create_client, Client
+from inventory import CardInventory, CARD_INDEX_TABLE, cards_mask
+from models import Player, PlayerStatus, parse_json_dict, parse_json_list, extract_telegram_id
+from leaderboard import Leaderboard
+from eligibility import EligibilityIndex
+from rng import RNGService
+from ledger import Ledger, SupabaseLedgerStore, SQLiteLedgerStore, ledger_event, set_event, current_event, new_event_id
+from notify import Notifier
+from tasks import BackgroundTasks
+from instrument import InstrumentedClient, LazyClient, db_helper, current_helper
+from metrics import MetricsRegistry
+from tracing import Tracer
+from profiler import SamplingProfiler
+from pressure import PressureMonitor, parse_limits
+from partitions import PartitionRegistry, PARTITION_STATE_KEYS, EVENT_TIMER_KEYS, current_chat, set_current_chat
+from snapshot import SnapshotStore
+from compaction import StatusSweeper
+from jobs import JobRunner, STATE_ICONS, format_duration
+from events import EventClock, TIMED_EVENTS, ANY_CHAT, BOGO, RUSH_HOUR, TRUCE, COIN_RUSH, FREEBIE_FRENZY, INFLATION, parse_start
+from payouts import PAYOUT_USAGE, MAX_BYTES as PAYOUT_MAX_BYTES, card_index, parse_payout_file, player_ref, write_report
+from dedupe import UpdateDeduper, SupabaseUpdateStore
+from roster import ReportCache, ReportQuery, Report, REPORT_USAGE, active_effects, write_export
 
 # --- CONFIGURATION (Environment variables with config.py fallback) ---
 try:
@@ -21,6 +50,55 @@ ADMIN_USER_ID_VAL = os.environ.get("ADMIN_USER_ID") or getattr(config, "ADMIN_US
 SUPABASE_URL = os.environ.get("SUPABASE_URL") or getattr(config, "SUPABASE_URL", None)
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY") or getattr(config, "SUPABASE_KEY", None)
 LOG_CHANNEL_ID = os.environ.get("LOG_CHANNEL_ID") or getattr(config, "LOG_CHANNEL_ID", None)
+# Mirror inventories into the integer `cards_mask` column while the legacy `cards` list is migrated.
+WRITE_CARDS_MASK = str(os.environ.get("WRITE_CARDS_MASK") or getattr(config, "WRITE_CARDS_MASK", "")).lower() in ("1", "true", "yes")
+# Set once `python migrate.py` reports every `users` row canonical: players are then looked up by telegram_id alone.
+SCHEMA_NORMALISED = str(os.environ.get("SCHEMA_NORMALISED") or getattr(config, "SCHEMA_NORMALISED", "")).lower() in ("1", "true", "yes")
+# Master seed for card and event outcomes. Leave unset in production; set it to make a run reproducible.
+RNG_SEED = os.environ.get("RNG_SEED") or getattr(config, "RNG_SEED", None)
+# Coin/card ledger location: a local SQLite file if set, otherwise the Supabase `ledger` table.
+LEDGER_PATH = os.environ.get("LEDGER_PATH") or getattr(config, "LEDGER_PATH", None)
+# Seconds player DMs wait to be merged into one digest message (0 sends every DM on its own).
+NOTIFY_WINDOW = float(os.environ.get("NOTIFY_WINDOW") or getattr(config, "NOTIFY_WINDOW", 2.0))
+# Side effects (DMs, log posts) run in the background after the reply, at most this many at once.
+BACKGROUND_CONCURRENCY = int(os.environ.get("BACKGROUND_CONCURRENCY") or getattr(config, "BACKGROUND_CONCURRENCY", 8))
+# Updates slower than this many seconds, or making more round trips than this, go to the slow-update log.
+TRACE_SLOW_SECONDS = float(os.environ.get("TRACE_SLOW_SECONDS") or getattr(config, "TRACE_SLOW_SECONDS", 2.0))
+TRACE_SLOW_ROUND_TRIPS = int(os.environ.get("TRACE_SLOW_ROUND_TRIPS") or getattr(config, "TRACE_SLOW_ROUND_TRIPS", 15))
+# A /profile_bot session samples every thread's stack this often, and stops on its own after PROFILE_MAX_SECONDS.
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS") or getattr(config, "PROFILE_INTERVAL_MS", 5))
+PROFILE_MAX_SECONDS = float(os.environ.get("PROFILE_MAX_SECONDS") or getattr(config, "PROFILE_MAX_SECONDS", 300))
+RUN_MODE = (os.environ.get("RUN_MODE") or getattr(config, "RUN_MODE", "polling")).lower()
+# Update ids are remembered for UPDATE_DEDUPE_WINDOW seconds (at most UPDATE_DEDUPE_SIZE of them) so a redelivered
+# update is dropped; set UPDATE_DEDUPE_TABLE to share them between processes through that Supabase table.
+UPDATE_DEDUPE_WINDOW = float(os.environ.get("UPDATE_DEDUPE_WINDOW") or getattr(config, "UPDATE_DEDUPE_WINDOW", 600))
+UPDATE_DEDUPE_SIZE = int(os.environ.get("UPDATE_DEDUPE_SIZE") or getattr(config, "UPDATE_DEDUPE_SIZE", 10000))
+UPDATE_DEDUPE_TABLE = os.environ.get("UPDATE_DEDUPE_TABLE") or getattr(config, "UPDATE_DEDUPE_TABLE", None)
+# Repeated taps of the same button on the same message within this many seconds are dropped (0 disables).
+CALLBACK_DEBOUNCE = float(os.environ.get("CALLBACK_DEBOUNCE") or getattr(config, "CALLBACK_DEBOUNCE", 1.0))
+# When set, sanitised copies of incoming webhook updates are appended here for replay with loadgen.py.
+UPDATE_RECORD_PATH = os.environ.get("UPDATE_RECORD_PATH") or getattr(config, "UPDATE_RECORD_PATH", None)
+# Warm-start snapshot of players, indexes and game state, rewritten every SNAPSHOT_INTERVAL seconds when it changes.
+SNAPSHOT_PATH = os.environ.get("SNAPSHOT_PATH") or getattr(config, "SNAPSHOT_PATH", None)
+SNAPSHOT_INTERVAL = float(os.environ.get("SNAPSHOT_INTERVAL") or getattr(config, "SNAPSHOT_INTERVAL", 60))
+SNAPSHOT_MAX_AGE = float(os.environ.get("SNAPSHOT_MAX_AGE") or getattr(config, "SNAPSHOT_MAX_AGE", 3600))
+# Player statuses are compacted every STATUS_SWEEP_INTERVAL seconds (0 disables), in batches of STATUS_SWEEP_BATCH
+# players with STATUS_SWEEP_PAUSE seconds between batch writes.
+STATUS_SWEEP_INTERVAL = float(os.environ.get("STATUS_SWEEP_INTERVAL") or getattr(config, "STATUS_SWEEP_INTERVAL", 21600))
+STATUS_SWEEP_BATCH = int(os.environ.get("STATUS_SWEEP_BATCH") or getattr(config, "STATUS_SWEEP_BATCH", 50))
+STATUS_SWEEP_PAUSE = float(os.environ.get("STATUS_SWEEP_PAUSE") or getattr(config, "STATUS_SWEEP_PAUSE", 1.0))
+# Fleet-wide admin jobs (/awardall, /resetallcoins, Gambit, Secret Santa, reverts): at most JOB_CONCURRENCY run at once,
+# JOB_BATCH_SIZE players per batch, with the cursor of unfinished jobs checkpointed to JOB_CHECKPOINT_PATH.
+JOB_CHECKPOINT_PATH = os.environ.get("JOB_CHECKPOINT_PATH") or getattr(config, "JOB_CHECKPOINT_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jobs_checkpoint.json'))
+JOB_CONCURRENCY = int(os.environ.get("JOB_CONCURRENCY") or getattr(config, "JOB_CONCURRENCY", 1))
+JOB_BATCH_SIZE = int(os.environ.get("JOB_BATCH_SIZE") or getattr(config, "JOB_BATCH_SIZE", 50))
+# Time zone /scheduleevent reads HH:MM start times in (an IANA name such as Europe/London).
+EVENT_TIMEZONE = os.environ.get("EVENT_TIMEZONE") or getattr(config, "EVENT_TIMEZONE", "UTC")
+# Load-shedding thresholds, one per degradation level (text only, essential DMs, sampled logs, deferred reports).
+PRESSURE_OUTBOUND_LIMITS = parse_limits(os.environ.get("PRESSURE_OUTBOUND_LIMITS") or getattr(config, "PRESSURE_OUTBOUND_LIMITS", None), (30, 80, 200, 500))
+PRESSURE_DB_LATENCY_LIMITS = parse_limits(os.environ.get("PRESSURE_DB_LATENCY_LIMITS") or getattr(config, "PRESSURE_DB_LATENCY_LIMITS", None), (0.8, 1.5, 3.0, 6.0))
+PRESSURE_PENDING_LIMITS = parse_limits(os.environ.get("PRESSURE_PENDING_LIMITS") or getattr(config, "PRESSURE_PENDING_LIMITS", None), (20, 50, 120, 300))
+PRESSURE_RECOVER_SECONDS = float(os.environ.get("PRESSURE_RECOVER_SECONDS") or getattr(config, "PRESSURE_RECOVER_SECONDS", 30))
 
 if not TELEGRAM_BOT_TOKEN:
     raise ValueError("Missing required environment variable: TELEGRAM_BOT_TOKEN")
@@ -52,6 +130,8 @@ def is_user_exempt_from_inflation(user_id: int, player_status: dict = None) -> b
             return True
     except (ValueError, TypeError):
         pass
+    if isinstance(player_status, PlayerStatus):
+        return player_status.inflation_immunity_until > time.time()
     if isinstance(player_status, dict) and player_status.get('inflation_immunity_until', 0) > time.time():
         return True
     return False
@@ -93,17 +173,86 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-db: Client = None
-try:
-    if SUPABASE_URL and SUPABASE_KEY and SUPABASE_URL != "YOUR_SUPABASE_URL" and SUPABASE_KEY != "YOUR_SUPABASE_KEY":
-        db = create_client(SUPABASE_URL, SUPABASE_KEY)
-        key_prefix = SUPABASE_KEY[:12] if len(SUPABASE_KEY) >= 12 else SUPABASE_KEY
-        logger.info(f"Supabase initialized successfully with key prefix: {key_prefix}...")
-    else:
-        logger.warning("Supabase URL or Key not fully configured. Using placeholder database state.")
-except Exception as e:
-    logger.error(f"FATAL: Failed to initialize Supabase: {e}")
-    db = None
+# --- METRICS ---
+# Exported on GET /metrics in the Prometheus text format. Recording is a dict update per event.
+METRICS = MetricsRegistry('powerstore_')
+HANDLER_SECONDS = METRICS.histogram('handler_seconds', 'Update handler latency by handler.', ('handler',))
+HANDLER_ERRORS = METRICS.counter('handler_errors_total', 'Update handlers that raised.', ('handler',))
+DB_SECONDS = METRICS.histogram('supabase_request_seconds', 'Supabase round-trip latency by helper and table.', ('helper', 'table'))
+DB_ERRORS = METRICS.counter('supabase_errors_total', 'Supabase round trips that failed.', ('helper', 'table'))
+TELEGRAM_SECONDS = METRICS.histogram('telegram_request_seconds', 'Bot API call latency by method.', ('method',))
+TELEGRAM_ERRORS = METRICS.counter('telegram_errors_total', 'Bot API calls that failed, by method and HTTP status.', ('method', 'status'))
+TELEGRAM_RETRY_AFTER = METRICS.counter('telegram_retry_after_seconds_total', 'Seconds Telegram asked us to back off (HTTP 429).', ('method',))
+CACHE_LOOKUPS = METRICS.counter('cache_lookups_total', 'Cache lookups by cache and result.', ('cache', 'result'))
+FANOUT_SECONDS = METRICS.histogram('fanout_seconds', 'Duration of card and event fan-outs.', ('kind',))
+
+def cache_hit_ratios() -> dict:
+    ratios = {}
+    for cache in {labels[0] for labels in CACHE_LOOKUPS.values}:
+        hits, misses = CACHE_LOOKUPS.get(cache, 'hit'), CACHE_LOOKUPS.get(cache, 'miss')
+        ratios[cache] = hits / (hits + misses) if hits + misses else 0.0
+    return ratios
+
+# Per-update attribution of the same round trips; one structured record is logged per update.
+TRACER = Tracer(TRACE_SLOW_SECONDS, TRACE_SLOW_ROUND_TRIPS)
+
+# On-demand sampling profiler driven by /profile_bot; idle until an admin starts a session.
+PROFILER = SamplingProfiler(PROFILE_INTERVAL_MS / 1000, PROFILE_MAX_SECONDS)
+
+def handler_timings() -> dict:
+    """{handler: (calls, seconds)} so far, for the profiler's per-handler breakdown."""
+    return {labels[0]: totals for labels, totals in HANDLER_SECONDS.totals().items()}
+
+def record_db_round_trip(table: str, seconds: float, ok: bool):
+    """InstrumentedClient observer: feeds the metrics and the current update's trace."""
+    helper = current_helper()
+    DB_SECONDS.observe(seconds, helper, table)
+    if not ok:
+        DB_ERRORS.inc(helper, table)
+    TRACER.observe_db(table, seconds, ok, helper)
+
+def timed_fanout(kind: str):
+    """Records how long an async fan-out (broadcast, event, DM loop) takes in FANOUT_SECONDS."""
+    def decorate(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with FANOUT_SECONDS.time(kind):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+METRICS.gauge('cache_hit_ratio', 'Hit ratio per cache since start.', cache_hit_ratios, labelname='cache')
+
+# Watches outbound queue depth, database latency and pending updates, and picks how much work to shed.
+PRESSURE = PressureMonitor(
+    {'outbound': PRESSURE_OUTBOUND_LIMITS, 'db_latency': PRESSURE_DB_LATENCY_LIMITS, 'pending_updates': PRESSURE_PENDING_LIMITS},
+    recover_after=PRESSURE_RECOVER_SECONDS,
+)
+
+def connect_supabase():
+    """Creates the Supabase client; called by `db` on first use."""
+    from supabase import create_client
+    try:
+        client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    except Exception as e:
+        logger.error(f"FATAL: Failed to initialize Supabase: {e}")
+        raise
+    key_prefix = SUPABASE_KEY[:12] if len(SUPABASE_KEY) >= 12 else SUPABASE_KEY
+    logger.info(f"Supabase initialized successfully with key prefix: {key_prefix}...")
+    return InstrumentedClient(client, [PRESSURE.observe_db, record_db_round_trip])
+
+# The client (and the supabase package) is only loaded when the first query runs.
+db = None
+if SUPABASE_URL and SUPABASE_KEY and SUPABASE_URL != "YOUR_SUPABASE_URL" and SUPABASE_KEY != "YOUR_SUPABASE_KEY":
+    db = LazyClient(connect_supabase)
+else:
+    logger.warning("Supabase URL or Key not fully configured. Using placeholder database state.")
+
+# Every random card or event outcome draws from its own RNG derived here, and its seed is logged with the outcome.
+RNG_SERVICE = RNGService(RNG_SEED)
+
+# Append-only journal of every coin and card change, written in background batches.
+LEDGER = Ledger(SQLiteLedgerStore(LEDGER_PATH) if LEDGER_PATH else SupabaseLedgerStore(lambda: db))
 
 
 # --- CARD DEFINITIONS ---
@@ -149,42 +298,19 @@ POWER_CARDS = {
 
 NEGATIVE_CARDS = {'flame', 'glitch', 'devil', 'swap', 'spotlight', 'purge', 'amnesia', 'shackle', 'steal', 'double_or_nothing'}
 
-import json
-import ast
+_unindexed_cards = set(POWER_CARDS) - set(CARD_INDEX_TABLE)
+if _unindexed_cards:
+    raise ValueError(f"Cards missing from inventory.CARD_INDEX_TABLE: {sorted(_unindexed_cards)}")
 
-def parse_json_dict(val) -> dict:
-    if isinstance(val, dict):
-        return val
-    if isinstance(val, str) and val.strip():
-        try:
-            res = json.loads(val)
-            if isinstance(res, dict): return res
-        except Exception:
-            try:
-                res = ast.literal_eval(val)
-                if isinstance(res, dict): return res
-            except Exception:
-                pass
-        if val.strip().lower() == 'eliminated':
-            return {'eliminated': True, 'state': 'eliminated'}
-        if val.strip().lower() == 'active':
-            return {'eliminated': False, 'state': 'active'}
-    return {}
-
-def parse_json_list(val) -> list:
-    if isinstance(val, list):
-        return val
-    if isinstance(val, str) and val.strip():
-        try:
-            res = json.loads(val)
-            if isinstance(res, list): return res
-        except Exception:
-            try:
-                res = ast.literal_eval(val)
-                if isinstance(res, list): return res
-            except Exception:
-                pass
-    return []
+# Precomputed inventory pools for BOGO, Secret Santa and Gambit draws.
+TIER_1_2_POOL = CardInventory.from_cards(cid for cid, c in POWER_CARDS.items() if c.get('tier') in [1, 2])
+GAMBIT_POOL = CardInventory.from_cards(cid for cid in POWER_CARDS if cid != 'god')
+
+def with_cards_mask(payload: dict) -> dict:
+    """Adds the `cards_mask` column to a write payload that carries a `cards` list."""
+    if WRITE_CARDS_MASK and 'cards' in payload:
+        payload['cards_mask'] = cards_mask(payload['cards'])
+    return payload
 
 def escape_markdown_v2(text) -> str:
     """Escapes characters for Telegram's MarkdownV2 parse mode."""
@@ -238,6 +364,8 @@ async def safe_reply_animation(update: Update, animation, caption=None, parse_mo
     """Safely sends an animation reply using update.effective_message or update.effective_chat, falling back to safe_reply text."""
     if not update:
         return None
+    if not PRESSURE.allows_gifs():
+        return await safe_reply(update, caption, parse_mode=parse_mode) if caption else None
     msg = update.effective_message
     if msg and hasattr(msg, 'reply_animation') and callable(getattr(msg, 'reply_animation', None)):
         try:
@@ -254,43 +382,228 @@ async def safe_reply_animation(update: Update, animation, caption=None, parse_mo
         return await safe_reply(update, caption, parse_mode=parse_mode)
     return None
 
-def extract_telegram_id(data: dict):
-    if not isinstance(data, dict): return None
-    for key in ['Telegram_id', 'telegram_id', 'user_id', 'id', 'Telegram_Id']:
-        if key in data and data[key] is not None:
-            return data[key]
-    return None
+# --- PLAYER RECORD CACHE ---
+# Decoded Player records keyed by user id. Writes go through the cache so only changed columns are sent,
+# and reads within PLAYER_CACHE_TTL seconds are served without a Supabase round trip.
+PLAYER_CACHE = {}
+PLAYER_CACHE_TTL = float(os.environ.get("PLAYER_CACHE_TTL") or getattr(config, "PLAYER_CACHE_TTL", 30))
+
+# The cache and the indexes built from it (usernames, leaderboards, eligibility, chat partitions) are changed from
+# the update loop, the jobs thread, the status sweeper and warm-up, and this lock serialises those changes. It is
+# never held across a read: reads run unlocked and cache_player() keeps whichever of a fetched row and a record
+# written since the query went out is newer. Writes (update_player_data, update_players) compute the new values
+# from the cached record under the lock and send them before releasing it, so a writer on another thread never
+# works from a record that is missing a write this process has already made. That is the whole guarantee: a
+# handler that reads a player, awaits, then passes values computed from that read can still overwrite a change
+# made in between (only a coins change is rebased, see update_player_data), and a write holds the lock, and
+# with it any other thread's write, for its round trip.
+PLAYER_LOCK = threading.RLock()
+
+def holds_player_lock(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with PLAYER_LOCK:
+            return func(*args, **kwargs)
+    return wrapper
+
+# Lower-cased username -> user id for every cached player, so @mentions resolve without a full scan.
+USERNAME_INDEX = {}
+
+def normalise_username(username) -> str:
+    return str(username or '').lstrip('@').lower().strip()
+
+@holds_player_lock
+def cache_player(record: Player, read_at: float = None) -> Player:
+    """Stores a freshly decoded record in the player cache and returns the one now cached.
+
+    `read_at` is when the query that fetched it was sent: a cached record loaded or written after that is
+    newer than the row and is kept.
+    """
+    if record is not None and isinstance(record.user_id, int):
+        if read_at is not None:
+            SNAPSHOT_RESTORED.discard(record.user_id)
+            cached = PLAYER_CACHE.get(record.user_id)
+            if cached is not None and cached.loaded_at > read_at:
+                return cached
+            record.loaded_at = read_at
+        PLAYER_CACHE[record.user_id] = record
+        if record.username:
+            USERNAME_INDEX[normalise_username(record.username)] = record.user_id
+        track_leaderboards(record)
+        track_eligibility(record)
+        if record.user_id != 0:
+            PARTITIONS.index_player(record.user_id, record.status.chats)
+    return record
+
+# --- CHAT PARTITIONS ---
+# Each group chat has its own members and event timers. Fan-outs (Vortex, Tribute, Ricochet, event
+# broadcasts) only touch the members of the chat the action happened in.
+PARTITIONS = PartitionRegistry()
+
+# --- EVENT CLOCK ---
+# Running timed events (BOGO, Rush Hour, Truce, Coin Rush, Freebie Frenzy, Inflation) as cached bit flags per
+# chat, kept in step with every game-state read and write, so hot paths test a flag instead of reading the game
+# state. Events scheduled with /scheduleevent are started (and Coin Rush's end announced) by the clock thread.
+EVENT_CLOCK = EventClock()
+try:
+    EVENT_TZ = ZoneInfo(EVENT_TIMEZONE)
+except (ZoneInfoNotFoundError, ValueError):
+    logger.warning(f"Unknown EVENT_TIMEZONE {EVENT_TIMEZONE!r}, using UTC.")
+    EVENT_TZ = datetime.timezone.utc
+
+def event_scope(user_id: int = None) -> list:
+    """Chats whose event timers apply: the current group chat, or in a private chat every group user_id plays in."""
+    chat_id = current_chat()
+    if chat_id is not None:
+        return [chat_id]
+    if user_id is not None:
+        return list(PARTITIONS.chat_ids_for(int(user_id)))
+    return []
 
-def get_player_data(user_id: int) -> dict:
-    """Retrieves player data from Supabase using telegram_id, Telegram_id or user_id."""
+def schedule_scope():
+    """Whose scheduled events a command sees: the current group chat's, or every chat's outside a group."""
+    chat_id = current_chat()
+    return chat_id if chat_id is not None else ANY_CHAT
+
+def event_active(flag: int, user_id: int = None) -> bool:
+    """Whether a timed event (events.BOGO, RUSH_HOUR, ...) is running where the current update happens."""
+    if not EVENT_CLOCK.loaded:
+        get_game_state()
+    return EVENT_CLOCK.active(flag, event_scope(user_id))
+
+# --- TARGET ELIGIBILITY ---
+# Active players by MSGC pool, kept current by every player read and write, so Ricochet, Vortex, Tribute
+# and Inflation pick or list their targets without scanning the users table.
+ELIGIBILITY = EligibilityIndex()
+
+def track_eligibility(record: Player):
+    if not isinstance(record.user_id, int) or record.user_id == 0:
+        return
+    ELIGIBILITY.update(record.user_id, record.msgc_registered, record.coins, record.is_eliminated)
+
+def track_eligibility_updates(user_id: int, updates: dict):
+    """Updates the index from a raw column update when no cached record is available."""
+    if 'status' in updates and PlayerStatus.decode(updates['status']).is_eliminated:
+        ELIGIBILITY.update(user_id, False, 0, True)
+    elif 'coins' in updates:
+        ELIGIBILITY.update_coins(user_id, updates['coins'])
+
+# --- LEADERBOARDS ---
+# In-memory rankings kept current by every player read and write, so /leaderboard never scans the table.
+LEADERBOARDS = {
+    'coins': Leaderboard(),
+    'cards': Leaderboard(),
+    'attacks': Leaderboard(),
+}
+LEADERBOARD_TITLES = {
+    'coins': '💰 Top Coins',
+    'cards': '🎴 Most Cards',
+    'attacks': '⚔️ Most Attacks Landed',
+}
+LEADERBOARDS_LOADED = False
+
+def track_leaderboards(record: Player):
+    """Updates every leaderboard from a player record."""
+    if not isinstance(record.user_id, int):
+        return
+    if record.user_id == 0 or record.is_eliminated:
+        for board in LEADERBOARDS.values():
+            board.discard(record.user_id)
+        return
+    LEADERBOARDS['coins'].update(record.user_id, record.coins)
+    LEADERBOARDS['cards'].update(record.user_id, len(record.cards))
+    LEADERBOARDS['attacks'].update(record.user_id, int(record.status.attacks_landed or 0))
+
+def track_leaderboard_updates(user_id: int, updates: dict):
+    """Updates leaderboards from a raw column update when no cached record is available."""
+    if 'status' in updates:
+        status = PlayerStatus.decode(updates['status'])
+        if status.is_eliminated:
+            for board in LEADERBOARDS.values():
+                board.discard(user_id)
+            return
+        if user_id in LEADERBOARDS['coins']:
+            LEADERBOARDS['attacks'].update(user_id, int(status.attacks_landed or 0))
+    if 'coins' in updates and user_id in LEADERBOARDS['coins']:
+        LEADERBOARDS['coins'].update(user_id, updates['coins'])
+    if 'cards' in updates and user_id in LEADERBOARDS['cards']:
+        LEADERBOARDS['cards'].update(user_id, len(CardInventory.from_cards(parse_json_list(updates['cards']))))
+
+def ensure_leaderboards_loaded():
+    """Populates the leaderboards with one full scan the first time they are needed."""
+    if not LEADERBOARDS_LOADED:
+        get_all_player_records_debug()
+
+def ensure_partitions_loaded():
+    """Populates chat membership and target eligibility with one full scan the first time they are needed."""
+    if not PARTITIONS.loaded:
+        get_all_player_records_debug()
+
+def player_id_lookups(user_id: int) -> list:
+    """(column, value) pairs a player's row may be keyed by, most likely first. After the schema migration
+    (SCHEMA_NORMALISED) every row is keyed by telegram_id alone."""
+    if SCHEMA_NORMALISED:
+        return [('telegram_id', str(user_id))]
+    return [(col, val) for col in ('telegram_id', 'Telegram_id', 'user_id') for val in (str(user_id), int(user_id))]
+
+def write_player_columns(user_id: int, payload: dict) -> bool:
+    """Updates columns of a player's row, trying each key the row may have (see player_id_lookups).
+    True once a row was written."""
+    for col, val in player_id_lookups(user_id):
+        try:
+            res = db.table('users').update(payload).eq(col, val).execute()
+            if res is not None and res.data:
+                return True
+        except Exception:
+            pass
+    return False
+
+def is_cache_fresh(record: Player, max_age: float, now: float) -> bool:
+    """Whether a cached record may answer a read that accepts data up to `max_age` seconds old (0 never does).
+    A player restored from the snapshot counts as fresh until Supabase has been read for them."""
+    return now - record.loaded_at < max_age or (max_age > 0 and record.user_id in SNAPSHOT_RESTORED)
+
+@db_helper
+def get_player_record(user_id: int, max_age: float = None) -> Player:
+    """Retrieves a Player record from the cache or from Supabase using telegram_id, Telegram_id or user_id.
+
+    Cached records are served for up to `max_age` seconds (PLAYER_CACHE_TTL by default); 0 always reads Supabase.
+    """
+    max_age = PLAYER_CACHE_TTL if max_age is None else max_age
+    cached = PLAYER_CACHE.get(int(user_id))
+    if cached and is_cache_fresh(cached, max_age, time.time()):
+        CACHE_LOOKUPS.inc('player', 'hit')
+        return cached
+    CACHE_LOOKUPS.inc('player', 'miss')
     if not db: return None
     try:
         response = None
-        for col in ['telegram_id', 'Telegram_id', 'user_id']:
-            for val in [str(user_id), int(user_id)]:
-                try:
-                    res = db.table('users').select('*').eq(col, val).execute()
-                    if res and res.data and len(res.data) > 0:
-                        response = res
-                        break
-                except Exception:
-                    pass
-            if response: break
+        read_at = time.time()
+        for col, val in player_id_lookups(user_id):
+            try:
+                res = db.table('users').select('*').eq(col, val).execute()
+                if res and res.data and len(res.data) > 0:
+                    response = res
+                    break
+            except Exception:
+                pass
 
         if response and response.data and len(response.data) > 0:
-            data = response.data[0]
-            tid = extract_telegram_id(data) or user_id
-            data['user_id'] = int(tid)
-            data['status'] = parse_json_dict(data.get('status'))
-            data['cards'] = parse_json_list(data.get('cards'))
-            return data
+            return cache_player(Player.from_row(response.data[0], fallback_id=user_id), read_at)
         return None
     except Exception as e:
         logger.error(f"Error fetching player data for {user_id}: {e}")
         return None
 
+def get_player_data(user_id: int) -> dict:
+    """Retrieves player data as a plain dict (see get_player_record)."""
+    record = get_player_record(user_id)
+    return record.to_dict() if record else None
+
 def is_player_eliminated(player_data: dict) -> bool:
     """Returns True if a player's status is set to eliminated."""
+    if isinstance(player_data, Player):
+        return player_data.is_eliminated
     if not player_data or not isinstance(player_data, dict):
         return False
     status = player_data.get('status', {})
@@ -307,31 +620,32 @@ def is_player_eliminated(player_data: dict) -> bool:
         return True
     return False
 
+@db_helper
 def get_player_by_username(username: str) -> dict:
     """Retrieves player data by Telegram username, first_name, in_game_name or ID."""
     if not db: return None
     clean_username = username.lstrip('@').lower().strip()
     try:
-        all_players = get_all_players()
-        for p in all_players:
-            p_uname = str(p.get('username') or '').lstrip('@').lower().strip()
-            p_fname = str(p.get('first_name') or '').lower().strip()
-            p_gname = str(p.get('in_game_name') or '').lower().strip()
-            p_uid = str(p.get('user_id') or '').lower().strip()
+        indexed = USERNAME_INDEX.get(clean_username)
+        if indexed is not None:
+            record = get_player_record(indexed)
+            if record and normalise_username(record.username) == clean_username:
+                return record.to_dict()
+
+        for p in get_all_player_records():
+            p_uname = normalise_username(p.username)
+            p_fname = str(p.first_name or '').lower().strip()
+            p_gname = str(p.in_game_name or '').lower().strip()
+            p_uid = str(p.user_id or '').lower().strip()
             if clean_username in [p_uname, p_fname, p_gname, p_uid] or (clean_username and clean_username in p_uname):
-                return p
+                return p.to_dict()
 
         for col in ['username', 'first_name', 'in_game_name']:
             for pattern in [username.lstrip('@'), f"@{username.lstrip('@')}"]:
                 try:
                     res = db.table('users').select('*').ilike(col, pattern).execute()
                     if res and res.data and len(res.data) > 0:
-                        data = res.data[0]
-                        tid = extract_telegram_id(data)
-                        if tid: data['user_id'] = int(tid)
-                        data['status'] = parse_json_dict(data.get('status'))
-                        data['cards'] = parse_json_list(data.get('cards'))
-                        return data
+                        return cache_player(Player.from_row(res.data[0])).to_dict()
                 except Exception:
                     pass
         return None
@@ -339,50 +653,125 @@ def get_player_by_username(username: str) -> dict:
         logger.error(f"Error fetching player by username {username}: {e}")
         return None
 
-def get_all_players_debug() -> tuple:
-    """Retrieves all players from Supabase and returns debug details."""
+@db_helper
+def get_all_player_records_debug() -> tuple:
+    """Retrieves all players from Supabase as Player records and returns debug details."""
     if not db:
         return [], "Database client is None"
     try:
+        read_at = time.time()
         res = db.table('users').select('*').execute()
         rows = res.data if res and hasattr(res, 'data') and res.data is not None else []
-        players = []
-        for data in rows:
-            tid = extract_telegram_id(data)
-            if tid is not None:
-                try:
-                    data['user_id'] = int(tid)
-                except (ValueError, TypeError):
-                    data['user_id'] = tid
-            data['status'] = parse_json_dict(data.get('status'))
-            data['cards'] = parse_json_list(data.get('cards'))
-            players.append(data)
+        players = [cache_player(Player.from_row(data), read_at) for data in rows]
+        # A full scan has now fed every player into the leaderboards and the chat membership index.
+        global LEADERBOARDS_LOADED
+        LEADERBOARDS_LOADED = PARTITIONS.loaded = bool(players)
         return players, f"Success (returned {len(rows)} rows)"
     except Exception as e:
         return [], f"Exception: {e}"
 
+def get_all_player_records() -> list:
+    players, _ = get_all_player_records_debug()
+    return players
+
+def get_all_players_debug() -> tuple:
+    """Retrieves all players from Supabase as plain dicts and returns debug details."""
+    players, debug_info = get_all_player_records_debug()
+    return [p.to_dict() for p in players], debug_info
+
 def get_all_players() -> list:
     players, _ = get_all_players_debug()
     return players
 
+@db_helper
+def get_player_records(user_ids, max_age: float = None) -> list:
+    """Player records for many ids: cache entries younger than `max_age` (see get_player_record) plus one
+    batched Supabase query for the rest."""
+    max_age = PLAYER_CACHE_TTL if max_age is None else max_age
+    now = time.time()
+    records, missing = [], []
+    for uid in user_ids:
+        cached = PLAYER_CACHE.get(uid)
+        if cached and is_cache_fresh(cached, max_age, now):
+            records.append(cached)
+        else:
+            missing.append(uid)
+    CACHE_LOOKUPS.inc('player', 'hit', amount=len(records))
+    CACHE_LOOKUPS.inc('player', 'miss', amount=len(missing))
+    if missing and db:
+        try:
+            read_at = time.time()
+            res = db.table('users').select('*').in_('telegram_id', [str(uid) for uid in missing]).execute()
+            found = [cache_player(Player.from_row(row), read_at) for row in (res.data or [])]
+            records.extend(found)
+            if not SCHEMA_NORMALISED:
+                # Legacy rows keyed by Telegram_id or user_id are not matched by the batched query.
+                found_ids = {r.user_id for r in found}
+                records.extend(r for r in (get_player_record(uid, max_age) for uid in missing if int(uid) not in found_ids) if r)
+        except Exception as e:
+            logger.warning(f"Batched player lookup failed, falling back to single reads: {e}")
+            records.extend(r for r in (get_player_record(uid, max_age) for uid in missing) if r)
+    return records
+
+def get_scope_ids(user_id: int = None):
+    """Ids of the players an action can reach: members of the current group chat or, outside a group,
+    of every group user_id plays in. None means everyone (no chat membership known)."""
+    ensure_partitions_loaded()
+    chat_id = current_chat()
+    if chat_id is not None:
+        chat_ids = [chat_id]
+    elif user_id is not None:
+        chat_ids = PARTITIONS.chat_ids_for(int(user_id))
+    else:
+        chat_ids = []
+    return PARTITIONS.members(*chat_ids) if chat_ids else None
+
+def get_scope_player_records(user_id: int = None) -> list:
+    scope = get_scope_ids(user_id)
+    if scope is None:
+        return [p for p in get_all_player_records() if p.user_id != 0]
+    return get_player_records(scope)
+
+def get_eligible_player_records(msgc: bool, user_id: int = None) -> list:
+    """Active players of one MSGC pool within the scope of user_id, in user id order."""
+    return sorted(get_player_records(ELIGIBILITY.members(msgc, get_scope_ids(user_id))), key=lambda p: p.user_id)
+
+def pick_eligible_target(rng, msgc: bool, user_id: int, exclude=(), min_coins: int = 0):
+    """A random active player of one MSGC pool within the scope of user_id, as a dict, or None."""
+    target_id = ELIGIBILITY.random_target(rng, msgc, exclude=set(exclude), min_coins=min_coins, scope=get_scope_ids(user_id))
+    return get_player_data(target_id) if target_id is not None else None
+
+def get_scope_players(user_id: int = None) -> list:
+    return [p.to_dict() for p in get_scope_player_records(user_id)]
+
+@db_helper
 def save_player_data(user_id: int, player_data: dict):
     """Upserts full player profile into Supabase."""
     if not db: return
     try:
-        payload = {
+        record = Player.from_row({
+            **player_data,
             'telegram_id': str(user_id),
             'username': player_data.get('username') or f"user_{user_id}",
             'first_name': player_data.get('first_name') or "Player",
             'in_game_name': player_data.get('in_game_name') or player_data.get('first_name') or "Player",
             'coins': player_data.get('coins', 5),
-            'cards': player_data.get('cards', []),
-            'status': player_data.get('status', {}),
-            'msgc_registered': player_data.get('msgc_registered', False)
-        }
-        
+        })
+        payload = with_cards_mask(record.to_row())
+        # The ledger journals the difference to what the player had; None only for a new player.
+        previous = get_player_record(user_id)
+
+        def saved():
+            cache_player(record)
+            LEDGER.record_change(
+                record.user_id, previous.coins if previous else 0, record.coins,
+                previous.cards if previous else CardInventory(), record.cards,
+            )
+
         try:
             res = db.table('users').upsert(payload, on_conflict='telegram_id').execute()
             if res and hasattr(res, 'data') and res.data:
+                saved()
                 logger.info(f"Successfully saved player {user_id} in Supabase via telegram_id.")
                 return
         except Exception as e1:
@@ -393,6 +782,7 @@ def save_player_data(user_id: int, player_data: dict):
             payload_fallback.pop('telegram_id', None)
             res = db.table('users').upsert(payload_fallback, on_conflict='Telegram_id').execute()
             if res and hasattr(res, 'data') and res.data:
+                saved()
                 logger.info(f"Successfully saved player {user_id} with Telegram_id.")
                 return
         except Exception as e2:
@@ -400,29 +790,142 @@ def save_player_data(user_id: int, player_data: dict):
 
         try:
             res = db.table('users').insert(payload).execute()
+            saved()
             logger.info(f"Successfully inserted player {user_id} directly.")
         except Exception as e3:
             logger.error(f"Direct insert failed for user {user_id}: {e3}")
     except Exception as e:
         logger.error(f"Error saving player data for {user_id}: {e}")
 
+@db_helper
 def update_player_data(user_id: int, updates: dict):
-    """Updates specific fields of a player profile in Supabase."""
+    """Updates specific fields of a player profile in Supabase, sending only columns that actually changed.
+
+    The row is read fresh first, so the diff is against what Supabase holds now (or a newer write by this
+    process, see PLAYER_LOCK). Callers compute `coins` from the cached balance; if the balance has moved since
+    (another process, the dashboard, a job), their change is kept as a delta on top of it instead of
+    overwriting it. Other columns are written as given.
+    Coin and card changes are journaled in the LEDGER under the current ledger event.
+    """
     if not db: return
-    try:
-        payload = {**updates}
-        payload.pop('user_id', None)
-        for col in ['telegram_id', 'Telegram_id', 'user_id']:
-            for val in [str(user_id), int(user_id)]:
-                try:
-                    res = db.table('users').update(payload).eq(col, val).execute()
-                    if res is not None:
-                        return
-                except Exception:
-                    pass
-    except Exception as e:
-        logger.error(f"Error updating player data for {user_id}: {e}")
-
+    cached = PLAYER_CACHE.get(int(user_id))
+    seen_coins = cached.coins if cached else None
+    get_player_record(user_id, max_age=0)
+    with PLAYER_LOCK:
+        record = PLAYER_CACHE.get(int(user_id))
+        try:
+            if record:
+                if 'coins' in updates and seen_coins is not None and record.coins != seen_coins:
+                    updates = {**updates, 'coins': max(0, record.coins + int(updates['coins'] or 0) - seen_coins)}
+                old_coins, old_cards = record.coins, record.cards.copy()
+                passthrough = record.apply(updates)
+                payload = {**record.dirty_payload(), **passthrough}
+                if not payload:
+                    return
+            else:
+                payload = {**updates}
+                payload.pop('user_id', None)
+            with_cards_mask(payload)
+            if write_player_columns(user_id, payload):
+                if record:
+                    record.mark_clean()
+                    record.loaded_at = time.time()
+                    track_leaderboards(record)
+                    track_eligibility(record)
+                    LEDGER.record_change(record.user_id, old_coins, record.coins, old_cards, record.cards)
+                else:
+                    track_leaderboard_updates(int(user_id), updates)
+                    track_eligibility_updates(int(user_id), updates)
+                return
+            PLAYER_CACHE.pop(int(user_id), None)
+        except Exception as e:
+            PLAYER_CACHE.pop(int(user_id), None)
+            logger.error(f"Error updating player data for {user_id}: {e}")
+
+@db_helper
+def update_players(user_ids, compute) -> int:
+    """Read-modify-write for many players: one batched read of their rows, then one batched write.
+
+    The rows are read without PLAYER_LOCK. Under it, compute({user_id: Player}) is handed the cached records,
+    which are those rows or newer writes by this process (it must not change them), and returns
+    {user_id: column updates} worked out from them; the write goes out before the lock is released. Once
+    every row is keyed by telegram_id (SCHEMA_NORMALISED) the write is one upsert round trip; before that,
+    each player's changed columns are written through the keys its row may have, like update_player_data.
+    Returns players written.
+    """
+    if not db or not user_ids: return 0
+    found = [r.user_id for r in get_player_records([int(uid) for uid in user_ids], max_age=0)]
+    with PLAYER_LOCK:
+        records = {uid: PLAYER_CACHE[uid] for uid in found if uid in PLAYER_CACHE}
+        pending = []
+        for user_id, updates in compute(records).items():
+            record = records.get(int(user_id))
+            if not record:
+                continue
+            snapshot = (record.coins, record.cards.copy())
+            record.apply(updates)
+            if record.dirty_fields:
+                pending.append((record, snapshot))
+        if not pending:
+            return 0
+
+        bulk_written = False
+        if SCHEMA_NORMALISED:
+            try:
+                db.table('users').upsert([with_cards_mask(r.to_row()) for r, _ in pending], on_conflict='telegram_id').execute()
+                bulk_written = True
+            except Exception as e:
+                logger.warning(f"Bulk player upsert failed, falling back to single updates: {e}")
+        if not bulk_written:
+            written = []
+            for record, snapshot in pending:
+                if write_player_columns(record.user_id, with_cards_mask(record.dirty_payload())):
+                    written.append((record, snapshot))
+                else:
+                    PLAYER_CACHE.pop(record.user_id, None)
+                    logger.error(f"Error updating player data for {record.user_id}")
+            pending = written
+
+        written_at = time.time()
+        for record, (old_coins, old_cards) in pending:
+            record.mark_clean()
+            record.loaded_at = written_at
+            track_leaderboards(record)
+            track_eligibility(record)
+            LEDGER.record_change(record.user_id, old_coins, record.coins, old_cards, record.cards)
+        return len(pending)
+
+def bulk_update_players(changes: dict) -> int:
+    """Sets {user_id: column updates} for many players (see update_players). Returns players written."""
+    return update_players(list(changes), lambda records: changes)
+
+def pending_revert(event_id: str):
+    """Net change per player still needed to undo event_id ({user_id: {'coins', 'add', 'remove'}}, see Ledger.inverse).
+
+    Players already reverted under `revert:<event_id>` (by a revert that was cancelled or interrupted) are left
+    out. Returns None if every player has been reverted already.
+    """
+    reverted = {entry.user_id for entry in LEDGER.event_entries(f"revert:{event_id}")}
+    inverse = LEDGER.inverse(event_id)
+    if reverted and not inverse.keys() - reverted:
+        return None
+    return {user_id: change for user_id, change in inverse.items() if user_id not in reverted}
+
+def apply_revert(inverse: dict) -> int:
+    """Applies part of an inverse with one batched write, under the current ledger event. Returns players written.
+
+    Cards a player no longer holds are skipped and coin balances never go below zero.
+    """
+    def revert(records):
+        changes = {}
+        for record in records.values():
+            change = inverse[record.user_id]
+            cards = (record.cards - CardInventory.from_cards(change['remove'])) | CardInventory.from_cards(change['add'])
+            changes[record.user_id] = {'coins': max(0, record.coins + change['coins']), 'cards': cards}
+        return changes
+    return update_players(list(inverse), revert)
+
+@db_helper
 def ensure_player_registered(user_id: int, telegram_user=None) -> dict:
     """Ensures player is registered in Supabase. Auto-registers if missing."""
     player_data = get_player_data(user_id)
@@ -458,10 +961,19 @@ def ensure_player_registered(user_id: int, telegram_user=None) -> dict:
     return player_data
 
 GLOBAL_GAME_STATE = {}
-
+# Guards GLOBAL_GAME_STATE and the system row's merge-and-write, apart from PLAYER_LOCK so player traffic never
+# waits on it. Reads run unlocked. GAME_STATE_WRITES counts writes started and GAME_STATE_OPEN those not yet
+# landed: a read that overlapped a write is not merged over the newer in-memory state, and a write that
+# overlapped another re-reads the system row under the lock before merging into it.
+GAME_STATE_LOCK = threading.RLock()
+GAME_STATE_WRITES = 0
+GAME_STATE_OPEN = 0
+
+@db_helper
 def get_game_state() -> dict:
     """Retrieves global game state, merging in-memory state with Supabase system row."""
-    state = {**GLOBAL_GAME_STATE}
+    seen, busy = GAME_STATE_WRITES, GAME_STATE_OPEN
+    state = {}
     if db:
         try:
             sys_res = db.table('users').select('*').eq('telegram_id', '0').execute()
@@ -483,48 +995,258 @@ def get_game_state() -> dict:
                         state.update(row)
         except Exception as e:
             logger.warning(f"Failed to fetch game_state from Supabase: {e}")
-    GLOBAL_GAME_STATE.update(state)
+    with GAME_STATE_LOCK:
+        if GAME_STATE_WRITES == seen and not busy:
+            GLOBAL_GAME_STATE.update(state)
+        state = {**GLOBAL_GAME_STATE}
+        EVENT_CLOCK.load(state)
     return state
 
+def get_scoped_game_state(user_id: int = None) -> dict:
+    """Game state as seen from the current chat: global state overlaid with that chat's event timers.
+    In a private chat, the timers of every group user_id plays in apply."""
+    state = get_game_state()
+    PARTITIONS.load_states(state.get('chats'))
+    return PARTITIONS.merged_state(state, event_scope(user_id))
+
+@db_helper
+def update_scoped_game_state(updates: dict):
+    """Like update_game_state, but per-chat keys (event timers, inflation) go to the current chat's partition."""
+    chat_id = current_chat()
+    scoped = {k: v for k, v in updates.items() if k in PARTITION_STATE_KEYS}
+    if chat_id is None or not scoped:
+        update_game_state(updates)
+        return
+    get_game_state()
+    with GAME_STATE_LOCK:
+        # Merged into the chats as held in memory, which include other chats' changes not yet written.
+        chats = dict(GLOBAL_GAME_STATE.get('chats') or {})
+        chat_state = dict(chats.get(str(chat_id)) or {})
+        chat_state.update(scoped)
+        chats[str(chat_id)] = chat_state
+        GLOBAL_GAME_STATE['chats'] = chats
+        PARTITIONS.get(chat_id).state.update(scoped)
+    update_game_state({**{k: v for k, v in updates.items() if k not in scoped}, 'chats': chats})
+
+def clear_event_timers(keys=EVENT_TIMER_KEYS):
+    """Ends timed events in the current chat, or everywhere (globally and in every chat) outside a group."""
+    cleared = {key: 0 for key in keys}
+    # Their windows go too, so no end notice follows; events scheduled for later stay on the schedule.
+    schedule = {}
+    if EVENT_CLOCK.discard([event.name for event in TIMED_EVENTS.values() if event.key in keys], schedule_scope()):
+        schedule = {'event_schedule': EVENT_CLOCK.dump()}
+    if current_chat() is not None:
+        update_scoped_game_state({**cleared, **schedule})
+        return
+    chats = {cid: {**(st if isinstance(st, dict) else {}), **cleared} for cid, st in (get_game_state().get('chats') or {}).items()}
+    for partition in PARTITIONS.partitions.values():
+        partition.state.update(cleared)
+    update_game_state({**cleared, **schedule, 'chats': chats} if chats else {**cleared, **schedule})
+
+def open_event_window(name: str, start: float, end: float):
+    """Starts a timed event in the current chat until `end`, replacing a running one; its window stays on the
+    schedule until then so its end is announced even after a restart."""
+    chat_id = current_chat()
+    EVENT_CLOCK.discard([name], chat_id)
+    EVENT_CLOCK.schedule(name, chat_id, start, end, started=True)
+    update_scoped_game_state({TIMED_EVENTS[name].key: end, 'event_schedule': EVENT_CLOCK.dump()})
+
+def read_system_status() -> dict:
+    """The status blob of the Supabase system row, or {}."""
+    cur_sys = {}
+    try:
+        sys_res = db.table('users').select('*').eq('telegram_id', '0').execute()
+        if sys_res and sys_res.data and len(sys_res.data) > 0:
+            cur_sys = parse_json_dict(sys_res.data[0].get('status'))
+    except Exception:
+        pass
+    return cur_sys if isinstance(cur_sys, dict) else {}
+
+@db_helper
 def update_game_state(updates: dict):
     """Updates global game state both in-memory and in Supabase system row."""
-    GLOBAL_GAME_STATE.update(updates)
-    if not db: return
+    global GAME_STATE_WRITES, GAME_STATE_OPEN
+    with GAME_STATE_LOCK:
+        GLOBAL_GAME_STATE.update(updates)
+        EVENT_CLOCK.load(GLOBAL_GAME_STATE)
+        if not db: return
+        busy = GAME_STATE_OPEN
+        GAME_STATE_WRITES += 1
+        GAME_STATE_OPEN += 1
+        seen = GAME_STATE_WRITES
     try:
-        cur_sys = {}
-        try:
-            sys_res = db.table('users').select('*').eq('telegram_id', '0').execute()
-            if sys_res and sys_res.data and len(sys_res.data) > 0:
-                cur_sys = parse_json_dict(sys_res.data[0].get('status'))
-        except Exception:
-            pass
-        if not isinstance(cur_sys, dict): cur_sys = {}
-        cur_sys.update(updates)
-
-        sys_payload = {
-            'telegram_id': '0',
-            'username': 'GLOBAL_SYSTEM_STATE',
-            'first_name': 'System State',
-            'in_game_name': 'System State',
-            'coins': 0,
-            'cards': [],
-            'status': cur_sys,
-            'msgc_registered': False
-        }
-        db.table('users').upsert(sys_payload, on_conflict='telegram_id').execute()
+        cur_sys = read_system_status()
+        with GAME_STATE_LOCK:
+            if busy or GAME_STATE_WRITES != seen:
+                cur_sys = read_system_status()
+            # The values as held in memory now, so a write that lands after a later one cannot undo it.
+            written = {k: GLOBAL_GAME_STATE.get(k, v) for k, v in updates.items()}
+            cur_sys.update(written)
+
+            sys_payload = {
+                'telegram_id': '0',
+                'username': 'GLOBAL_SYSTEM_STATE',
+                'first_name': 'System State',
+                'in_game_name': 'System State',
+                'coins': 0,
+                'cards': [],
+                'status': cur_sys,
+                'msgc_registered': False
+            }
+            db.table('users').upsert(sys_payload, on_conflict='telegram_id').execute()
 
-        payload = {'id': 'game_data', **updates}
-        try:
-            db.table('game_state').upsert(payload, on_conflict='id').execute()
-        except Exception:
-            pass
+            payload = {'id': 'game_data', **written}
+            try:
+                db.table('game_state').upsert(payload, on_conflict='id').execute()
+            except Exception:
+                pass
     except Exception as e:
         logger.error(f"Error updating game state: {e}")
+    finally:
+        with GAME_STATE_LOCK:
+            GAME_STATE_OPEN -= 1
+
+# --- WARM-START SNAPSHOT ---
+# With SNAPSHOT_PATH set, the player cache, the username index, the game state and the known group chats
+# are written to local disk periodically and at exit, and loaded before the bot starts serving. Restored
+# records count as fresh, however old the snapshot, until reconcile_snapshot() has re-read everything from
+# Supabase in the background, so the first burst after a restart is answered from memory. A player read
+# before that is served like any other from then on; if the reconcile scan fails, the rest age from the
+# snapshot's save time and are re-read on first use.
+SNAPSHOT = SnapshotStore(SNAPSHOT_PATH, SNAPSHOT_MAX_AGE) if SNAPSHOT_PATH else None
+# Group chats the bot has seen messages in; the Application's bot_data['group_chat_ids'] is this same set.
+GROUP_CHAT_IDS = set()
+SNAPSHOT_RESTORED = set()
+
+@holds_player_lock
+def collect_snapshot() -> dict:
+    """The state written to the snapshot. Runs on the writer thread, so it only takes copies."""
+    records = list(PLAYER_CACHE.values())
+    with GAME_STATE_LOCK:
+        game_state = dict(GLOBAL_GAME_STATE)
+    return {
+        'players': [p.to_dict() for p in records if p.user_id != 0],
+        'usernames': dict(USERNAME_INDEX),
+        'game_state': game_state,
+        'group_chat_ids': sorted(set(GROUP_CHAT_IDS)),
+        'complete': LEADERBOARDS_LOADED and PARTITIONS.loaded,
+    }
+
+@holds_player_lock
+def restore_snapshot() -> bool:
+    """Loads the snapshot into the caches and indexes. True if one was restored."""
+    global LEADERBOARDS_LOADED
+    data = SNAPSHOT.load() if SNAPSHOT else None
+    if not data:
+        return False
+    started = time.perf_counter()
+    saved_at = SNAPSHOT.stats['saved_at']
+    for row in data.get('players') or []:
+        record = Player.from_row(row)
+        # Stamped with the snapshot's age, which counts only once SNAPSHOT_RESTORED no longer holds the player.
+        record.loaded_at = saved_at
+        cache_player(record)
+        SNAPSHOT_RESTORED.add(record.user_id)
+    for name, user_id in (data.get('usernames') or {}).items():
+        USERNAME_INDEX.setdefault(name, user_id)
+    GLOBAL_GAME_STATE.update(data.get('game_state') or {})
+    PARTITIONS.load_states(GLOBAL_GAME_STATE.get('chats'))
+    EVENT_CLOCK.load(GLOBAL_GAME_STATE)
+    GROUP_CHAT_IDS.update(int(cid) for cid in data.get('group_chat_ids') or [])
+    if data.get('complete') and SNAPSHOT_RESTORED:
+        # The snapshot held every player, so the first /leaderboard or group update needs no full scan.
+        LEADERBOARDS_LOADED = PARTITIONS.loaded = True
+    age = time.time() - saved_at
+    logger.info(f"Restored {len(SNAPSHOT_RESTORED)} players and {len(GROUP_CHAT_IDS)} group chats "
+                f"from a {age:.0f}s old snapshot in {(time.perf_counter() - started) * 1000:.0f} ms.")
+    return True
+
+def reconcile_snapshot():
+    """Replaces restored state with Supabase's: one full player scan plus the game state.
+
+    Players that were in the snapshot but are gone from Supabase are dropped from the caches and indexes.
+    """
+    players, debug_info = get_all_player_records_debug()
+    if not players:
+        SNAPSHOT_RESTORED.clear()
+        logger.warning(f"Snapshot reconcile skipped, player scan failed: {debug_info}")
+        return
+    get_game_state()
+    with PLAYER_LOCK:
+        gone = SNAPSHOT_RESTORED - {p.user_id for p in players}
+        for user_id in gone:
+            PLAYER_CACHE.pop(user_id, None)
+            ELIGIBILITY.discard(user_id)
+            PARTITIONS.forget_player(user_id)
+            for board in LEADERBOARDS.values():
+                board.discard(user_id)
+        for name, user_id in list(USERNAME_INDEX.items()):
+            if user_id in gone:
+                USERNAME_INDEX.pop(name, None)
+        SNAPSHOT_RESTORED.clear()
+    logger.info(f"Snapshot reconciled with Supabase: {len(players)} players, {len(gone)} dropped.")
+
+# --- STATUS COMPACTION ---
+# Statuses only grow during play (repeat-attack entries, card costs of cards long gone, expired timers), and the
+# whole blob travels with every read and write. The sweeper prunes what no rule reads any more, off the hot path,
+# and stands down while the bot is shedding load.
+STATUS_SWEEPER = StatusSweeper(
+    lambda: [p.user_id for p in get_all_player_records() if isinstance(p.user_id, int) and p.user_id != 0],
+    update_players,
+    batch_size=STATUS_SWEEP_BATCH,
+    pause=STATUS_SWEEP_PAUSE,
+    busy=lambda: PRESSURE.level > 0,
+)
+
+# --- PLAYER NOTIFICATIONS ---
+# DMs to players go through NOTIFIER so bursts (Vortex + Tribute + event broadcast) arrive as one digest.
+NOTIFIER = Notifier(NOTIFY_WINDOW, policy=PRESSURE)
+
+async def notify_players(bot: Bot, messages, priority: bool = False, notifier: Notifier = None):
+    """Queues one DM per (user_id, text) pair, logging the ones that cannot be sent."""
+    for user_id, text in messages:
+        try:
+            await (notifier or NOTIFIER).notify(bot, user_id, text, priority=priority)
+        except Exception as e:
+            logger.warning(f"Could not send DM to user {user_id}: {e}")
+
+# --- BACKGROUND SIDE EFFECTS ---
+# Work that follows a handler's reply is spawned here so the player sees the reply without waiting for it.
+BACKGROUND = BackgroundTasks(BACKGROUND_CONCURRENCY)
+BACKGROUND_DRAIN_SECONDS = 30
+
+async def drain_side_effects(application: Application = None):
+    """Finishes background side effects, then delivers every pending DM digest."""
+    await BACKGROUND.drain(BACKGROUND_DRAIN_SECONDS)
+    await NOTIFIER.flush_all()
+
+# --- LOAD SHEDDING ---
+DEFERRED_REPORT_TASKS = set()
+DEFERRED_REPORT_RETRY_SECONDS = 5
+
+async def defer_report_under_load(update: Update, context: ContextTypes.DEFAULT_TYPE, command) -> bool:
+    """Postpones an expensive admin report while load shedding is at its highest level. Returns True if deferred."""
+    if not PRESSURE.defers_reports():
+        return False
+    if RUN_MODE == "webhook":
+        await safe_reply(update, "⏳ The bot is under heavy load right now. Please run this report again in a few minutes.")
+        return True
+
+    async def run_when_calm():
+        while PRESSURE.defers_reports():
+            await asyncio.sleep(DEFERRED_REPORT_RETRY_SECONDS)
+        await command(update, context)
+
+    await safe_reply(update, "⏳ The bot is under heavy load. This report will be sent as soon as things calm down.")
+    task = asyncio.get_running_loop().create_task(run_when_calm())
+    DEFERRED_REPORT_TASKS.add(task)
+    task.add_done_callback(DEFERRED_REPORT_TASKS.discard)
+    return True
 
 async def log_activity(bot: Bot, message: str, title: str = "Power Store Logs"):
     """Logs an activity message to python logger and Telegram channel if configured."""
     logger.info(f"ACTIVITY: {message}")
-    if LOG_CHANNEL_ID and bot:
+    if LOG_CHANNEL_ID and bot and PRESSURE.allows_log_post():
         try:
             formatted_text = f"<b>{title}</b>\n{message}"
             await bot.send_message(chat_id=LOG_CHANNEL_ID, text=formatted_text, parse_mode='HTML')
@@ -599,6 +1321,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "• /profile — Check coins, cards & status (DM only)\n"
         "• /store — Open interactive card store (DM only)\n"
         "• /use <CardName> [@target] — Activate a card power\n"
+        "• /leaderboard [coins|cards|attacks] — Top 10 players and your rank\n"
+        "• /history — Your recent coin and card changes\n"
         "• /help — Display this help menu\n"
     )
 
@@ -608,9 +1332,11 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             "• /closestore — Close the store (blocks buying & using cards)\n"
             "• /openstore — Reopen the store for all players\n"
             "• /startevent <name> — Launch event (bogo, secretsanta, rushhour, truce, gambit, coinrush, freebiefrenzy)\n"
+            "• /scheduleevent <name> <HH:MM|+minutes> — Schedule a timed event for later; alone, list the schedule (cancel <id> to drop one)\n"
             "• /endevent [name] — Stop active events (or specific event)\n"
             "• /revertevent <name> — Revert event effects (/revertgambit, /revertsecretsanta)\n"
-            "• /players — View all players report with coins, cards & live status\n"
+            "• /players [coins|cards|name|id] [active|eliminated] [msgc|nomsgc] [effects] [min=N] — Page through players with coins, cards & live status\n"
+            "• /players export csv|json — Get the (filtered) player table as a file in DM\n"
             "• /disablecard <card> — Disable a card from store & usage\n"
             "• /enablecard <card> — Re-enable a disabled card\n"
             "• /disabledcards — View currently disabled cards\n"
@@ -619,7 +1345,11 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             "• /award <amount> <@user> — Award or deduct coins\n"
             "• /awardall <amount> — Award or deduct coins across all players\n"
             "• /givecard <CardName> <@user> — Gift a card directly to a player\n"
+            "• /payout — Send a CSV/JSON file of players, coins and cards in DM to award many players at once\n"
             "• /resetallcoins [amount] — Reset all players to 0 PC (or specified amount) and clear hands\n"
+            "• /jobs [cancel|retry <id>] — List long-running admin jobs (/awardall, /resetallcoins, Gambit, Secret Santa, reverts), or stop or resume one\n"
+            "• /trace last [n] — Show the most recent slow updates and their DB/API round trips\n"
+            "• /profile_bot start [seconds] | stop | dump — Profile the bot and get the report as a file in DM\n"
         )
 
     await safe_reply(update, text)
@@ -676,9 +1406,8 @@ async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         rem_mins = max(1, int((status['attack_grace_until'] - now) // 60))
         status_list.append(f"Grace Period Active 🛡️ ({rem_mins}m left)")
 
-    game_state = get_game_state()
-    inflation_active = game_state.get('inflation_until', 0) > time.time()
-    inflation_user_id = game_state.get('inflation_user_id')
+    inflation_active = event_active(INFLATION, user_id)
+    inflation_user_id = get_scoped_game_state(user_id).get('inflation_user_id') if inflation_active else None
     user_exempt_inflation = is_user_exempt_from_inflation(user_id, status)
     is_affected_by_inflation = inflation_active and user_id != inflation_user_id and not user_exempt_inflation
     if user_exempt_inflation and inflation_active:
@@ -703,19 +1432,80 @@ async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 # --- INTERACTIVE STORE ---
 
+def get_card_price(card_id: str, user_id: int, player_status: dict, game_state: dict) -> int:
+    """Current store price of a card for a player, applying Freebie Frenzy, Black Market and Inflation."""
+    now = time.time()
+    card = POWER_CARDS[card_id]
+    player_status = player_status or {}
+    inflation_active = event_active(INFLATION, user_id)
+    is_affected_by_inflation = inflation_active and user_id != game_state.get('inflation_user_id') and not is_user_exempt_from_inflation(user_id, player_status)
+
+    price = card['price']
+    if event_active(FREEBIE_FRENZY, user_id) and card.get('tier') == 1 and card_id != 'angel':
+        price = 0
+    elif player_status.get('black_market_until', 0) > now:
+        price = int(price * 0.5)
+    elif is_affected_by_inflation:
+        price = int(price * 2)
+    return price
+
+def process_buy_card(user_id: int, player_data: dict, card_id: str, game_state: dict) -> dict:
+    """Core logic for buying a card. Returns {'error': ...} if the purchase is refused, else {'public': ...}."""
+    card = POWER_CARDS[card_id]
+    current_inv = CardInventory.from_cards(player_data.get('cards', []))
+    if card_id in current_inv:
+        return {'error': f"You already have a {card['name']} card. Use it before buying another one."}
+
+    disabled_cards = game_state.get('disabled_cards', [])
+    if card_id in disabled_cards:
+        return {'error': f"🛑 The '{card['name']}' card is currently disabled by the Admin and cannot be purchased!"}
+
+    player_status = player_data.get('status', {}) or {}
+    price = get_card_price(card_id, user_id, player_status, game_state)
+
+    current_coins = player_data.get('coins', 0)
+    if current_coins < price:
+        return {'error': f"Insufficient funds! You need {price} PC but only have {current_coins} PC."}
+
+    new_coins = current_coins - price
+    new_inv = current_inv | CardInventory.of(card_id)
+
+    bogo_active = event_active(BOGO, user_id)
+    bonus_card_msg = ""
+    bogo_bonus_card = None
+    if bogo_active:
+        eligible_bogo = TIER_1_2_POOL - new_inv
+        if eligible_bogo:
+            rng = RNG_SERVICE.derive('bogo', user_id=user_id, card_id=card_id)
+            bogo_bonus_card = eligible_bogo.choice(rng)
+            RNG_SERVICE.record(rng, bogo_bonus_card)
+            new_inv.add(bogo_bonus_card)
+            bonus_card_name = POWER_CARDS[bogo_bonus_card]['name']
+            bonus_card_msg = f"\n🎁 BOGO Bonus! You also received a FREE {bonus_card_name} card!"
+
+    card_costs = parse_json_dict(player_status.get('card_costs', {}))
+    card_costs[card_id] = price
+    if bogo_bonus_card:
+        card_costs[bogo_bonus_card] = 0
+
+    player_status['card_costs'] = card_costs
+    update_player_data(user_id, {'coins': new_coins, 'cards': new_inv.to_list(), 'status': player_status})
+
+    return {'public': f"✅ Success! You bought a {card['name']} card for {price} PC.{bonus_card_msg}", 'price': price, 'bonus_card': bogo_bonus_card}
+
 def build_store_menu(user_id, telegram_user=None):
     """Builds the main store menu text and keyboard markup, considering inflation and black market."""
-    game_state = get_game_state()
+    game_state = get_scoped_game_state(user_id)
     player_data = ensure_player_registered(user_id, telegram_user)
     player_status = player_data.get('status', {}) if player_data else {}
 
-    inflation_active = game_state.get('inflation_until', 0) > time.time()
+    inflation_active = event_active(INFLATION, user_id)
     inflation_user_id = game_state.get('inflation_user_id')
     black_market_active = player_status.get('black_market_until', 0) > time.time()
     is_affected_by_inflation = inflation_active and user_id != inflation_user_id and not is_user_exempt_from_inflation(user_id, player_status)
 
-    freebie_frenzy_active = game_state.get('freebie_frenzy_until', 0) > time.time()
-    bogo_active = game_state.get('bogo_active_until', 0) > time.time()
+    freebie_frenzy_active = event_active(FREEBIE_FRENZY, user_id)
+    bogo_active = event_active(BOGO, user_id)
     store_closed = game_state.get('store_closed', False)
 
     text = "🛒 *Welcome to the Power Store\\!* \nSelect a card to view its details:"
@@ -733,13 +1523,7 @@ def build_store_menu(user_id, telegram_user=None):
     keyboard = []
     disabled_cards = game_state.get('disabled_cards', [])
     for card_id, card in POWER_CARDS.items():
-        c_price = card['price']
-        if freebie_frenzy_active and card.get('tier') == 1 and card_id != 'angel':
-            c_price = 0
-        elif black_market_active:
-            c_price = int(c_price * 0.5)
-        elif is_affected_by_inflation:
-            c_price = int(c_price * 2)
+        c_price = get_card_price(card_id, user_id, player_status, game_state)
 
         if card_id in disabled_cards:
             button_text = f"{card['icon']} {card['name']} (DISABLED)"
@@ -795,7 +1579,7 @@ async def handle_inspect_callback(update: Update, context: ContextTypes.DEFAULT_
     card = POWER_CARDS[card_id]
     user_id = query.from_user.id
 
-    game_state = get_game_state()
+    game_state = get_scoped_game_state(user_id)
     if game_state.get('store_closed', False) and not is_admin(user_id):
         await query.edit_message_text("🔒 The Power Store is currently CLOSED by the Admin. You cannot view or buy cards at this time.")
         return
@@ -807,20 +1591,7 @@ async def handle_inspect_callback(update: Update, context: ContextTypes.DEFAULT_
 
     player_data = ensure_player_registered(user_id, query.from_user)
     player_status = player_data.get('status', {}) if player_data else {}
-
-    inflation_active = game_state.get('inflation_until', 0) > time.time()
-    inflation_user_id = game_state.get('inflation_user_id')
-    black_market_active = player_status.get('black_market_until', 0) > time.time()
-    is_affected_by_inflation = inflation_active and user_id != inflation_user_id and not is_user_exempt_from_inflation(user_id, player_status)
-    freebie_frenzy_active = game_state.get('freebie_frenzy_until', 0) > time.time()
-
-    price = card['price']
-    if freebie_frenzy_active and card.get('tier') == 1 and card_id != 'angel':
-        price = 0
-    elif black_market_active:
-        price = int(price * 0.5)
-    elif is_affected_by_inflation:
-        price = int(price * 2)
+    price = get_card_price(card_id, user_id, player_status, game_state)
 
     disabled_cards = game_state.get('disabled_cards', [])
     is_disabled = card_id in disabled_cards
@@ -867,7 +1638,7 @@ async def handle_buy_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
         await query.edit_message_text("Database not available.")
         return
 
-    game_state = get_game_state()
+    game_state = get_scoped_game_state(user_id)
     if game_state.get('store_closed', False) and not is_admin(user_id):
         await query.edit_message_text("🔒 The Power Store is currently CLOSED by the Admin. You cannot purchase cards at this time.")
         return
@@ -881,64 +1652,56 @@ async def handle_buy_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
         await query.edit_message_text("💀 You have been eliminated from the game and cannot purchase cards.")
         return
 
-    current_cards = player_data.get('cards', [])
-    if card_id in current_cards:
-        await query.edit_message_text(f"You already have a {card['name']} card. Use it before buying another one.")
+    result = process_buy_card(user_id, player_data, card_id, game_state)
+    if 'error' in result:
+        await query.edit_message_text(result['error'])
         return
 
-    game_state = get_game_state()
-    disabled_cards = game_state.get('disabled_cards', [])
-    if card_id in disabled_cards:
-        await query.edit_message_text(f"🛑 The '{card['name']}' card is currently disabled by the Admin and cannot be purchased!")
-        return
+    await query.edit_message_text(text=result['public'])
+    await log_activity(context.bot, f"🛒 {query.from_user.first_name} bought a {card['name']} card.")
 
-    player_status = player_data.get('status', {}) or {}
 
-    inflation_active = game_state.get('inflation_until', 0) > time.time()
-    inflation_user_id = game_state.get('inflation_user_id')
-    black_market_active = player_status.get('black_market_until', 0) > time.time()
-    is_affected_by_inflation = inflation_active and user_id != inflation_user_id and not is_user_exempt_from_inflation(user_id, player_status)
-    freebie_frenzy_active = game_state.get('freebie_frenzy_until', 0) > time.time()
+def get_card_use_block(user_id: int, player_data: dict, card_id: str, game_state: dict):
+    """Returns the reason a player cannot use a card right now (store lock, disabled card, cooldown, truce, shackle, not held), or None."""
+    now = time.time()
+    status = player_data.get('status', {}) or {}
 
-    price = card['price']
-    if freebie_frenzy_active and card.get('tier') == 1 and card_id != 'angel':
-        price = 0
-    elif black_market_active:
-        price = int(price * 0.5)
-    elif is_affected_by_inflation:
-        price = int(price * 2)
+    if game_state.get('store_closed', False) and not is_admin(user_id):
+        return "🔒 The Power Store is currently CLOSED by the Admin. Cards cannot be used right now."
 
-    current_coins = player_data.get('coins', 0)
-    if current_coins < price:
-        await query.edit_message_text(f"Insufficient funds! You need {price} PC but only have {current_coins} PC.")
-        return
+    disabled_cards = game_state.get('disabled_cards', [])
+    if card_id in disabled_cards:
+        card_name = POWER_CARDS[card_id]['name']
+        return f"🛑 The '{card_name}' card is currently disabled by the Admin and cannot be used!"
 
-    new_coins = current_coins - price
-    new_cards = current_cards + [card_id]
+    # Rush Hour & Exemption check: Disable card cooldown
+    rush_hour_active = event_active(RUSH_HOUR, user_id)
+    user_exempt_cooldown = user_id in NO_COOLDOWN_USER_IDS or status.get('no_cooldown', False)
+    
+    if status.get('frenzy_active', 0) == 0 and not rush_hour_active and not user_exempt_cooldown:
+        last_use = status.get('last_card_use_time', 0)
+        cooldown = 5 * 60
 
-    bogo_active = game_state.get('bogo_active_until', 0) > time.time()
-    bonus_card_msg = ""
-    bogo_bonus_card = None
-    if bogo_active:
-        eligible_bogo = [cid for cid, c in POWER_CARDS.items() if c.get('tier') in [1, 2] and cid not in new_cards]
-        if eligible_bogo:
-            bogo_bonus_card = random.choice(eligible_bogo)
-            new_cards.append(bogo_bonus_card)
-            bonus_card_name = POWER_CARDS[bogo_bonus_card]['name']
-            bonus_card_msg = f"\n🎁 BOGO Bonus! You also received a FREE {bonus_card_name} card!"
+        if status.get('speed_active_until', 0) > now:
+            cooldown /= 2
 
-    card_costs = parse_json_dict(player_status.get('card_costs', {}))
-    card_costs[card_id] = price
-    if bogo_bonus_card:
-        card_costs[bogo_bonus_card] = 0
+        if now - last_use < cooldown:
+            remaining_time = int(cooldown - (now - last_use))
+            mins = remaining_time // 60
+            secs = remaining_time % 60
+            return f"You must wait {mins}m {secs}s before using another card."
 
-    player_status['card_costs'] = card_costs
-    update_player_data(user_id, {'coins': new_coins, 'cards': new_cards, 'status': player_status})
+    # Truce check: Disable negative/targeted cards
+    truce_active = event_active(TRUCE, user_id)
+    if truce_active and (card_id in NEGATIVE_CARDS or POWER_CARDS[card_id].get('requires_target')):
+        return "🤝 A Truce has been called! Negative cards are disabled right now."
 
-    result = f"✅ Success! You bought a {card['name']} card for {price} PC.{bonus_card_msg}"
-    await query.edit_message_text(text=result)
-    await log_activity(context.bot, f"🛒 {query.from_user.first_name} bought a {card['name']} card.")
+    if status.get('shackled_until', 0) > now and card_id != 'dispel':
+        return "⛓️ You are shackled! You cannot use any cards right now (except Dispel)."
 
+    if card_id not in player_data.get('cards', []):
+        return f"You don't have a {POWER_CARDS[card_id]['name']} card."
+    return None
 
 async def use_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handles the /use command."""
@@ -982,57 +1745,17 @@ async def use_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         await safe_reply(update, "💀 You have been eliminated from the game and cannot use cards.")
         return
 
-    now = time.time()
-    status = player_data.get('status', {}) or {}
-    game_state = get_game_state()
-
-    if game_state.get('store_closed', False) and not is_admin(user.id):
-        await safe_reply(update, "🔒 The Power Store is currently CLOSED by the Admin. Cards cannot be used right now.")
-        return
-
-    disabled_cards = game_state.get('disabled_cards', [])
-    if card_id in disabled_cards:
-        card_name = POWER_CARDS[card_id]['name']
-        await safe_reply(update, f"🛑 The '{card_name}' card is currently disabled by the Admin and cannot be used!")
+    game_state = get_scoped_game_state(user.id)
+    blocked = get_card_use_block(user.id, player_data, card_id, game_state)
+    if blocked:
+        await safe_reply(update, blocked)
         return
-
-    # Rush Hour & Exemption check: Disable card cooldown
-    rush_hour_active = game_state.get('rush_hour_until', 0) > now
-    user_exempt_cooldown = user.id in NO_COOLDOWN_USER_IDS or status.get('no_cooldown', False)
     
-    if status.get('frenzy_active', 0) == 0 and not rush_hour_active and not user_exempt_cooldown:
-        last_use = status.get('last_card_use_time', 0)
-        cooldown = 5 * 60
-
-        if status.get('speed_active_until', 0) > now:
-            cooldown /= 2
+    card = POWER_CARDS[card_id]
 
-        if now - last_use < cooldown:
-            remaining_time = int(cooldown - (now - last_use))
-            mins = remaining_time // 60
-            secs = remaining_time % 60
-            await safe_reply(update, f"You must wait {mins}m {secs}s before using another card.")
-            return
-
-    # Truce check: Disable negative/targeted cards
-    truce_active = game_state.get('truce_until', 0) > now
-    if truce_active and (card_id in NEGATIVE_CARDS or POWER_CARDS[card_id].get('requires_target')):
-        await safe_reply(update, "🤝 A Truce has been called! Negative cards are disabled right now.")
-        return
-
-    if status.get('shackled_until', 0) > time.time() and card_id != 'dispel':
-        await safe_reply(update, "⛓️ You are shackled! You cannot use any cards right now (except Dispel).")
-        return
-
-    if card_id not in player_data.get('cards', []):
-        await safe_reply(update, f"You don't have a {POWER_CARDS[card_id]['name']} card.")
-        return
-    
-    card = POWER_CARDS[card_id]
-
-    if chat.type == 'private':
-        if card_id in NEGATIVE_CARDS or card.get('requires_target') or card_id == 'god':
-            await safe_reply(update, "❌ Attacking or targeted cards can only be used in group chats!")
+    if chat.type == 'private':
+        if card_id in NEGATIVE_CARDS or card.get('requires_target') or card_id == 'god':
+            await safe_reply(update, "❌ Attacking or targeted cards can only be used in group chats!")
             return
 
     if card_id == 'god':
@@ -1100,18 +1823,31 @@ async def use_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         await safe_reply(update, f"Action failed: {e}")
 
 
-def process_use_card(user_data, target_data, card_id, card_args=None):
-    """Core logic for executing card effect."""
+def process_use_card(user_data, target_data, card_id, card_args=None, rng=None):
+    """Core logic for executing card effect.
+
+    Random draws come from `rng`, a fresh RNG_SERVICE event unless one is passed in (e.g. a replay).
+    The event seed is returned in the result under 'seed'.
+    """
+    if rng is None:
+        rng = RNG_SERVICE.derive(f"card:{card_id}", user_id=user_data.get('user_id'), target_id=target_data.get('user_id') if target_data else None)
+    result = resolve_card_effect(user_data, target_data, card_id, card_args, rng)
+    result['seed'] = rng.event_seed
+    RNG_SERVICE.record(rng, result.get('public') or result.get('private') or result.get('action'))
+    return result
+
+def resolve_card_effect(user_data, target_data, card_id, card_args, rng):
+    """Applies a card's effect, drawing every random outcome from rng."""
     card = POWER_CARDS[card_id]
     user_id = user_data['user_id']
     user_name = user_data.get('first_name', 'A player')
     user_status = user_data.get('status', {}) or {}
-    user_cards = list(user_data.get('cards', []))
+    user_inv = CardInventory.from_cards(user_data.get('cards', []))
 
     target_id = target_data.get('user_id') if target_data else None
     target_name = target_data.get('first_name', 'another player') if target_data else ""
     target_status = target_data.get('status', {}) if target_data else {}
-    target_cards = list(target_data.get('cards', [])) if target_data else []
+    target_inv = CardInventory.from_cards(target_data.get('cards', [])) if target_data else CardInventory()
 
     if target_data:
         user_is_msgc = bool(user_data.get('msgc_registered', False))
@@ -1155,11 +1891,11 @@ def process_use_card(user_data, target_data, card_id, card_args=None):
         if target_status.get('trap_active'):
             target_status['trap_active'] = False
             user_coins = max(0, user_data.get('coins', 0) - 15)
-            if card_id in user_cards: user_cards.remove(card_id)
+            user_inv.discard(card_id)
             user_status['last_card_use_time'] = time.time()
             
             update_player_data(target_id, {'status': target_status})
-            update_player_data(user_id, {'coins': user_coins, 'cards': user_cards, 'status': user_status})
+            update_player_data(user_id, {'coins': user_coins, 'cards': user_inv.to_list(), 'status': user_status})
             return {
                 'public': f"🪤 Sprung! {target_name}'s Trap nullified the {card['name']} card and made {user_name} lose 15 coins!",
                 'override_gif': 'https://media.giphy.com/media/v1.Y2lkPTc5MGI3NjExam55aGthejd1ano0Mm1uY3FqNzFvZjV2b2xzcnA3OGc1ajZ5a2dzbCZlcD12MV9naWZzX3NlYXJjaCZjdD1n/26vUSsA7qFftHrgCk/giphy.gif'
@@ -1167,11 +1903,11 @@ def process_use_card(user_data, target_data, card_id, card_args=None):
 
         if target_status.get('ricochet_active_until', 0) > time.time():
             target_status['ricochet_active_until'] = 0
-            if card_id in user_cards: user_cards.remove(card_id)
+            user_inv.discard(card_id)
             user_status['last_card_use_time'] = time.time()
 
             update_player_data(target_id, {'status': target_status})
-            update_player_data(user_id, {'cards': user_cards, 'status': user_status})
+            update_player_data(user_id, {'cards': user_inv.to_list(), 'status': user_status})
             return {
                 'action': 'trigger_ricochet',
                 'data': {
@@ -1195,66 +1931,67 @@ def process_use_card(user_data, target_data, card_id, card_args=None):
                 update_player_data(target_id, {'coins': target_data['coins']})
                 reflected_message = f"⚖️ Karma! {target_name}'s karma reversed the Devil card! Instead, {target_name} stole {stolen_amount} Power Coins from {user_name}!"
             elif card_id == 'glitch':
-                disc_pool = [c for c in user_cards if c != 'glitch']
+                disc_pool = user_inv.without('glitch')
                 if disc_pool:
-                    c_disc = random.choice(disc_pool)
-                    user_cards.remove(c_disc)
+                    c_disc = disc_pool.choice(rng)
+                    user_inv.discard(c_disc)
                     reflected_message = f"⚖️ Karma! {target_name}'s karma reflected Glitch back onto {user_name}, forcing them to discard a {POWER_CARDS.get(c_disc, {}).get('name', c_disc)} card!"
                 else:
                     reflected_message = f"⚖️ Karma! {target_name}'s karma reflected Glitch back onto {user_name}, but they had no other cards to discard!"
             elif card_id == 'steal':
-                stealable = [c for c in user_cards if c != 'steal' and c not in target_cards]
+                stealable = user_inv.without('steal') - target_inv
                 if stealable:
-                    stolen = random.choice(stealable)
-                    user_cards.remove(stolen)
-                    target_cards.append(stolen)
-                    update_player_data(target_id, {'cards': target_cards})
+                    stolen = stealable.choice(rng)
+                    user_inv.discard(stolen)
+                    target_inv.add(stolen)
+                    update_player_data(target_id, {'cards': target_inv.to_list()})
                     reflected_message = f"⚖️ Karma! {target_name}'s karma reversed the Steal! Instead, {target_name} stole a {POWER_CARDS[stolen]['name']} card from {user_name}!"
                 else:
                     reflected_message = f"⚖️ Karma! {target_name}'s karma reversed the Steal back onto {user_name}, but there were no cards to take!"
             elif card_id == 'swap':
-                user_swaps = [c for c in user_cards if c != 'swap']
+                # Only a card the target does not hold yet can move, or it would vanish into their set.
+                user_swaps = user_inv.without('swap') - target_inv
                 if user_swaps:
-                    c_taken = random.choice(user_swaps)
-                    user_cards.remove(c_taken)
-                    target_cards.append(c_taken)
-                    update_player_data(target_id, {'cards': target_cards})
+                    c_taken = user_swaps.choice(rng)
+                    user_inv.discard(c_taken)
+                    target_inv.add(c_taken)
+                    update_player_data(target_id, {'cards': target_inv.to_list()})
                     reflected_message = f"⚖️ Karma! {target_name}'s karma reflected the Swap back onto {user_name}! {target_name} seized a {POWER_CARDS.get(c_taken, {}).get('name', c_taken)} card from {user_name}!"
                 else:
-                    reflected_message = f"⚖️ Karma! {target_name}'s karma reflected the Swap back onto {user_name}, but they had no cards to give!"
+                    reflected_message = f"⚖️ Karma! {target_name}'s karma reflected the Swap back onto {user_name}, but they had no card {target_name} doesn't already hold!"
             elif card_id == 'spotlight':
-                c_disp = [c for c in user_cards if c != 'spotlight']
-                cards_str = ", ".join([POWER_CARDS[cid]['name'] for cid in c_disp if cid in POWER_CARDS]) if c_disp else "None"
+                c_disp = user_inv.without('spotlight')
+                cards_str = ", ".join([POWER_CARDS[cid]['name'] for cid in c_disp]) if c_disp else "None"
                 reflected_message = f"⚖️ Karma! {target_name}'s karma reflected the Spotlight back onto {user_name}!\n💡 Their cards are: {cards_str}"
             elif card_id == 'purge':
                 p_args = [a for a in (card_args or []) if not a.startswith('@')]
                 p_name = " ".join(p_args).strip()
                 p_id = next((cid for cid, c in POWER_CARDS.items() if c['name'].lower() == p_name.lower()), None)
-                if p_id and p_id in user_cards:
-                    user_cards.remove(p_id)
+                if p_id and p_id in user_inv:
+                    user_inv.discard(p_id)
                     reflected_message = f"⚖️ Karma! {target_name}'s karma reflected Purge back onto {user_name}, forcing them to discard their own {POWER_CARDS[p_id]['name']} card!"
                 elif p_id:
                     reflected_message = f"⚖️ Karma! {target_name}'s karma reflected Purge back onto {user_name}, but {user_name} did not have a {POWER_CARDS[p_id]['name']} card!"
                 else:
                     reflected_message = f"⚖️ Karma! {target_name}'s karma reflected Purge back onto {user_name}!"
             elif card_id == 'amnesia':
-                user_cards = []
+                user_inv = CardInventory()
                 reflected_message = f"⚖️ Karma! {target_name}'s karma reflected Amnesia back onto {user_name}, forcing them to discard their entire hand!"
             elif card_id == 'shackle':
                 user_status['shackled_until'] = time.time() + (1 * 60 * 60)
                 reflected_message = f"⚖️ Karma! {target_name}'s karma reflected the Shackle back onto {user_name}! They are shackled for 1 hour."
 
-            if card_id in user_cards: user_cards.remove(card_id)
+            user_inv.discard(card_id)
             user_status['last_card_use_time'] = time.time()
-            update_player_data(user_id, {'coins': user_data.get('coins', 0), 'cards': user_cards, 'status': user_status})
+            update_player_data(user_id, {'coins': user_data.get('coins', 0), 'cards': user_inv.to_list(), 'status': user_status})
             return {'public': reflected_message}
 
         if target_status.get('protected'):
             target_status['protected'] = False
-            if card_id in user_cards: user_cards.remove(card_id)
+            user_inv.discard(card_id)
             user_status['last_card_use_time'] = time.time()
             update_player_data(target_id, {'status': target_status})
-            update_player_data(user_id, {'cards': user_cards, 'status': user_status})
+            update_player_data(user_id, {'cards': user_inv.to_list(), 'status': user_status})
             return {'public': f"🛡️ Blocked! {target_name}'s Forcefield deflected the {card['name']} card!"}
 
     effect_message = ""
@@ -1264,7 +2001,7 @@ def process_use_card(user_data, target_data, card_id, card_args=None):
         user_status['speed_active_until'] = time.time() + (1 * 60 * 60)
         effect_message = f"⚡️ {user_name} activated Speed! Your card cooldown is halved for 1 hour."
     elif card_id == 'reroll':
-        cards_to_reroll = [c for c in user_cards if c != 'reroll']
+        cards_to_reroll = user_inv.without('reroll')
         if not cards_to_reroll:
             raise Exception("You have no other cards to re-roll!")
         
@@ -1277,7 +2014,7 @@ def process_use_card(user_data, target_data, card_id, card_args=None):
             card_costs.pop(c, None)
         user_status['card_costs'] = card_costs
 
-        user_cards = [c for c in user_cards if c not in cards_to_reroll]
+        user_inv = user_inv - cards_to_reroll
         user_data['coins'] = user_data.get('coins', 0) + gained
         effect_message = f"♻️ {user_name} used Re-roll, discarded {len(cards_to_reroll)} cards, and regained {gained} coins!"
     elif card_id == 'flame':
@@ -1287,7 +2024,7 @@ def process_use_card(user_data, target_data, card_id, card_args=None):
         target_status['attack_grace_until'] = time.time() + (30 * 60)
         update_player_data(target_id, {'coins': target_coins, 'status': target_status})
         effect_message = f"🔥 {user_name} used Flame on {target_name}, burning {burned} Power Coins!"
-        if 'insurance' in target_cards and burned > 0:
+        if 'insurance' in target_inv and burned > 0:
             refund = int(burned * 0.5)
             target_coins += refund
             update_player_data(target_id, {'coins': target_coins})
@@ -1323,7 +2060,7 @@ def process_use_card(user_data, target_data, card_id, card_args=None):
         update_player_data(target_id, {'coins': target_coins, 'status': target_status})
         user_data['coins'] = user_data.get('coins', 0) + stolen
         effect_message = f"😈 {user_name} used a Devil card and stole {stolen} Power Coins from {target_name}!"
-        if 'insurance' in target_cards and stolen > 0:
+        if 'insurance' in target_inv and stolen > 0:
             refund = int(stolen * 0.5)
             target_coins += refund
             update_player_data(target_id, {'coins': target_coins})
@@ -1344,15 +2081,15 @@ def process_use_card(user_data, target_data, card_id, card_args=None):
         if target_status.get('blackout_until', 0) > time.time():
             return {'private': f"🕶️ Your Vision was blocked! {target_name} is under a Blackout.", 'public': f"👁️ {user_name} used a Vision card on another player."}
         if target_status.get('mirage_until', 0) > time.time():
-            fake = [random.choice(list(POWER_CARDS.keys())) for _ in range(random.randint(1, 3))]
+            fake = [rng.choice(list(POWER_CARDS.keys())) for _ in range(rng.randint(1, 3))]
             cstr = ", ".join([POWER_CARDS[cid]['name'] for cid in fake])
             return {'private': f"🏜️ You used Vision on {target_name}. A mirage shows they are holding: {cstr}.", 'public': f"👁️ {user_name} used a Vision card on another player."}
-        cstr = ", ".join([POWER_CARDS[cid]['name'] for cid in target_cards if cid in POWER_CARDS]) if target_cards else "None"
+        cstr = ", ".join([POWER_CARDS[cid]['name'] for cid in target_inv]) if target_inv else "None"
         return {'private': f"👁️ You used Vision on {target_name}. They are holding: {cstr}.", 'public': f"👁️ {user_name} used a Vision card on another player."}
     elif card_id == 'clairvoyance':
         if target_status.get('blackout_until', 0) > time.time():
             return {'private': f"🕶️ Your Clairvoyance was blocked! {target_name} is under a Blackout.", 'public': f"🔮 {user_name} used a Clairvoyance card on another player."}
-        cstr = ", ".join([POWER_CARDS[cid]['name'] for cid in target_cards if cid in POWER_CARDS]) if target_cards else "None"
+        cstr = ", ".join([POWER_CARDS[cid]['name'] for cid in target_inv]) if target_inv else "None"
         return {'private': f"🔮 You used Clairvoyance on {target_name}. Their true cards are: {cstr}.", 'public': f"🔮 {user_name} used a Clairvoyance card on another player."}
     elif card_id == 'spotlight':
         target_status['attack_grace_until'] = time.time() + (30 * 60)
@@ -1360,11 +2097,11 @@ def process_use_card(user_data, target_data, card_id, card_args=None):
         if target_status.get('blackout_until', 0) > time.time():
             effect_message = f"🕶️ {user_name}'s Spotlight was blocked! {target_name} is under a Blackout."
         elif target_status.get('mirage_until', 0) > time.time():
-            fake = [random.choice(list(POWER_CARDS.keys())) for _ in range(random.randint(1, 3))]
+            fake = [rng.choice(list(POWER_CARDS.keys())) for _ in range(rng.randint(1, 3))]
             cstr = ", ".join([POWER_CARDS[cid]['name'] for cid in fake])
             effect_message = f"💡 {user_name} used Spotlight on {target_name}! A mirage shows their cards are: {cstr}"
         else:
-            cstr = ", ".join([POWER_CARDS[cid]['name'] for cid in target_cards if cid in POWER_CARDS]) if target_cards else "None"
+            cstr = ", ".join([POWER_CARDS[cid]['name'] for cid in target_inv]) if target_inv else "None"
             effect_message = f"💡 {user_name} used Spotlight on {target_name}! Their cards are: {cstr}"
     elif card_id == 'blackout':
         user_status['blackout_until'] = time.time() + (4 * 60 * 60)
@@ -1379,43 +2116,45 @@ def process_use_card(user_data, target_data, card_id, card_args=None):
         effect_message = f"⏳ {user_name} used Time Warp on {target_name}, ending their Karma or Shackle effect immediately!"
     elif card_id == 'glitch':
         target_status['attack_grace_until'] = time.time() + (30 * 60)
-        if not target_cards:
+        if not target_inv:
             update_player_data(target_id, {'status': target_status})
             effect_message = f"🌀 {user_name} tried to glitch {target_name}, but they had no cards to discard!"
         else:
-            disc = random.choice(target_cards)
-            target_cards.remove(disc)
-            update_player_data(target_id, {'cards': target_cards, 'status': target_status})
+            disc = target_inv.choice(rng)
+            target_inv.discard(disc)
+            update_player_data(target_id, {'cards': target_inv.to_list(), 'status': target_status})
             effect_message = f"🌀 {user_name} glitched {target_name}'s hand, forcing them to discard a {POWER_CARDS[disc]['name']} card!"
     elif card_id == 'swap':
         target_status['attack_grace_until'] = time.time() + (30 * 60)
-        user_swaps = [c for c in user_cards if c != 'swap']
-        if not user_swaps or not target_cards:
+        # Each side gives a card the other does not hold, so no card is lost to the set-backed inventories.
+        user_swaps = user_inv.without('swap') - target_inv
+        target_swaps = target_inv - user_inv
+        if not user_swaps or not target_swaps:
             update_player_data(target_id, {'status': target_status})
-            effect_message = f"🔄 {user_name} tried to swap cards with {target_name}, but the swap failed because one player had no cards to trade!"
+            effect_message = f"🔄 {user_name} tried to swap cards with {target_name}, but the swap failed because one player had no card the other doesn't already hold!"
         else:
-            c_u = random.choice(user_swaps)
-            c_t = random.choice(target_cards)
-            user_cards.remove(c_u)
-            user_cards.append(c_t)
-            target_cards.remove(c_t)
-            target_cards.append(c_u)
-            update_player_data(target_id, {'cards': target_cards, 'status': target_status})
+            c_u = user_swaps.choice(rng)
+            c_t = target_swaps.choice(rng)
+            user_inv.discard(c_u)
+            user_inv.add(c_t)
+            target_inv.discard(c_t)
+            target_inv.add(c_u)
+            update_player_data(target_id, {'cards': target_inv.to_list(), 'status': target_status})
             effect_message = f"🔄 {user_name} used a Swap card on {target_name}! A random card was exchanged between them."
     elif card_id == 'steal':
         target_status['attack_grace_until'] = time.time() + (30 * 60)
-        stealable = [c for c in target_cards if c not in user_cards]
+        stealable = target_inv - user_inv
         if not stealable:
             update_player_data(target_id, {'status': target_status})
             effect_message = f"🥷 {user_name} tried to steal from {target_name}, but there were no cards they could take!"
         else:
-            stolen = random.choice(stealable)
-            target_cards.remove(stolen)
-            user_cards.append(stolen)
-            update_player_data(target_id, {'cards': target_cards, 'status': target_status})
+            stolen = stealable.choice(rng)
+            target_inv.discard(stolen)
+            user_inv.add(stolen)
+            update_player_data(target_id, {'cards': target_inv.to_list(), 'status': target_status})
             effect_message = f"🥷 {user_name} used Steal on {target_name} and took their {POWER_CARDS[stolen]['name']} card!"
     elif card_id == 'inflation':
-        update_game_state({
+        update_scoped_game_state({
             'inflation_until': time.time() + (1 * 60 * 60),
             'inflation_user_id': user_id
         })
@@ -1433,9 +2172,9 @@ def process_use_card(user_data, target_data, card_id, card_args=None):
         if not p_id:
             raise Exception(f"The card '{p_name}' does not exist.")
         target_status['attack_grace_until'] = time.time() + (30 * 60)
-        if p_id in target_cards:
-            target_cards.remove(p_id)
-            update_player_data(target_id, {'cards': target_cards, 'status': target_status})
+        if p_id in target_inv:
+            target_inv.discard(p_id)
+            update_player_data(target_id, {'cards': target_inv.to_list(), 'status': target_status})
             effect_message = f"🎯 {user_name} used Purge on {target_name} and successfully discarded their {POWER_CARDS[p_id]['name']} card!"
         else:
             update_player_data(target_id, {'status': target_status})
@@ -1455,13 +2194,13 @@ def process_use_card(user_data, target_data, card_id, card_args=None):
     elif card_id == 'frenzy':
         effect_message = f"🔀 {user_name} activated Frenzy! Your next two cards have no cooldown."
     elif card_id == 'dispel':
-        game_state = get_game_state()
+        game_state = get_scoped_game_state(user_id)
         now = time.time()
         removed = []
         if user_status.get('shackled_until', 0) > now:
             removed.append('Shackle')
             user_status['shackled_until'] = 0
-        inflation_active = game_state.get('inflation_until', 0) > now
+        inflation_active = event_active(INFLATION, user_id)
         if inflation_active and user_id != game_state.get('inflation_user_id'):
             removed.append('Inflation')
             user_status['inflation_immunity_until'] = game_state.get('inflation_until', 0)
@@ -1469,14 +2208,13 @@ def process_use_card(user_data, target_data, card_id, card_args=None):
             raise Exception("You are not affected by Shackle or Inflation.")
         effect_message = f"💨 {user_name} used Dispel and removed the following effects: {', '.join(removed)}!"
     elif card_id == 'lottery_ticket':
-        if random.random() < 0.02:
+        if rng.random() < 0.02:
             user_data['coins'] = user_data.get('coins', 0) + 100
             effect_message = f"🎟️ Unbelievable! {user_name}'s Lottery Ticket was a winner! They won 100 coins!"
         else:
             effect_message = f"🎟️ {user_name} scratched their Lottery Ticket... but it wasn't a winner. Better luck next time!"
 
-    if card_id in user_cards:
-        user_cards.remove(card_id)
+    user_inv.discard(card_id)
 
     # Process repeat attack surcharge and update history
     if card_id in NEGATIVE_CARDS and target_data:
@@ -1487,6 +2225,7 @@ def process_use_card(user_data, target_data, card_id, card_args=None):
         repeat_key = f"{target_id}_{card_id}"
         repeat_attacks[repeat_key] = {'count': repeat_count + 1, 'last_time': time.time()}
         user_status['repeat_attacks'] = repeat_attacks
+        user_status['attacks_landed'] = user_status.get('attacks_landed', 0) + 1
 
     if card_id == 'frenzy':
         user_status['frenzy_active'] = 2
@@ -1496,7 +2235,7 @@ def process_use_card(user_data, target_data, card_id, card_args=None):
     else:
         user_status['last_card_use_time'] = time.time()
 
-    update_player_data(user_id, {'coins': user_data.get('coins', 0), 'cards': user_cards, 'status': user_status})
+    update_player_data(user_id, {'coins': user_data.get('coins', 0), 'cards': user_inv.to_list(), 'status': user_status})
     return {'public': effect_message, 'action': special_action, 'data': user_data}
 
 
@@ -1523,23 +2262,18 @@ async def execute_card_effect(update: Update, context: ContextTypes.DEFAULT_TYPE
         original_target_data = get_player_data(result['data']['original_target_id'])
         card_name = POWER_CARDS[result['data']['card_id']]['name']
         
-        all_players = get_all_players()
         attacker_is_msgc = bool(attacker_data.get('msgc_registered', False)) if attacker_data else False
-        potential_targets = [
-            p for p in all_players
-            if p.get('user_id')
-            and str(p.get('user_id')) != '0'
-            and p['user_id'] != result['data']['attacker_id']
-            and p['user_id'] != result['data']['original_target_id']
-            and not is_player_eliminated(p)
-            and bool(p.get('msgc_registered', False)) == attacker_is_msgc
-        ]
+        rng = RNG_SERVICE.derive('ricochet', attacker_id=result['data']['attacker_id'], card_id=result['data']['card_id'])
+        new_target_data = pick_eligible_target(
+            rng, attacker_is_msgc, user.id,
+            exclude=(result['data']['attacker_id'], result['data']['original_target_id']),
+        )
 
-        if not potential_targets:
+        if not new_target_data:
             await safe_reply(update, f"↪️ {original_target_data['first_name']}'s Ricochet activated, but there was no other valid player to redirect the {card_name} card to!")
             return
 
-        new_target_data = random.choice(potential_targets)
+        RNG_SERVICE.record(rng, new_target_data['user_id'])
         ricochet_header = f"↪️ {original_target_data['first_name']}'s Ricochet redirected the {card_name} card from {attacker_data['first_name']} to {new_target_data['first_name']}!"
         
         ricochet_gif = POWER_CARDS['ricochet'].get('gif')
@@ -1552,17 +2286,14 @@ async def execute_card_effect(update: Update, context: ContextTypes.DEFAULT_TYPE
 
         if 'public' in redirect_result and redirect_result['public']:
             await safe_reply(update, redirect_result['public'])
-        if 'private' in redirect_result and redirect_result['private']:
-            await context.bot.send_message(chat_id=result['data']['attacker_id'], text=redirect_result['private'])
 
+        dms = []
+        if 'private' in redirect_result and redirect_result['private']:
+            dms.append((result['data']['attacker_id'], redirect_result['private']))
         if new_target_data and new_target_data.get('user_id') and new_target_data['user_id'] != result['data']['attacker_id']:
-            try:
-                redirect_dm = f"↪️ A {card_name} card was redirected onto you!\n\nEffect: {redirect_result.get('public', '')}"
-                await context.bot.send_message(chat_id=new_target_data['user_id'], text=redirect_dm)
-            except Exception as e:
-                logger.warning(f"Could not send DM to redirected target {new_target_data['user_id']}: {e}")
-
-        await log_activity(context.bot, f"↪️ Ricochet: {original_target_data['first_name']} redirected {card_name} from {attacker_data['first_name']} to {new_target_data['first_name']}. Effect: {redirect_result.get('public', '')}")
+            dms.append((new_target_data['user_id'], f"↪️ A {card_name} card was redirected onto you!\n\nEffect: {redirect_result.get('public', '')}"))
+        BACKGROUND.spawn(notify_players(context.bot, dms, priority=True), 'ricochet_dms')
+        BACKGROUND.spawn(log_activity(context.bot, f"↪️ Ricochet: {original_target_data['first_name']} redirected {card_name} from {attacker_data['first_name']} to {new_target_data['first_name']}. Effect: {redirect_result.get('public', '')}"), 'log_activity')
         return
 
     if result.get('action') == 'trigger_vortex':
@@ -1572,46 +2303,47 @@ async def execute_card_effect(update: Update, context: ContextTypes.DEFAULT_TYPE
         elif 'public' in result and result['public']:
             await safe_reply(update, result['public'])
         
-        all_players = get_all_players()
         attacker_is_msgc = bool(user_data.get('msgc_registered', False)) if user_data else False
         discard_summary = ["The Vortex has struck!"]
-        
-        for p_data in all_players:
-            p_id = p_data['user_id']
-            p_name = p_data.get('first_name', 'A player')
-            p_status = p_data.get('status', {}) or {}
-            p_cards = list(p_data.get('cards', []))
-            p_is_msgc = bool(p_data.get('msgc_registered', False))
-
-            if p_is_msgc != attacker_is_msgc:
-                continue
-
-            if p_status.get('protected'):
-                p_status['protected'] = False
-                update_player_data(p_id, {'status': p_status})
-                discard_summary.append(f"🛡️ {p_name} was protected by a Forcefield!")
-                if p_id != user.id:
-                    try:
-                        await context.bot.send_message(chat_id=p_id, text=f"🌪️ {user_name} (@{user.username or 'user'}) unleashed a Vortex, but your Forcefield protected you!")
-                    except Exception as e:
-                        logger.warning(f"Could not send Vortex DM to {p_id}: {e}")
-            elif not p_cards:
-                discard_summary.append(f"💨 {p_name} had no cards to discard.")
-            else:
-                c_disc = random.choice(p_cards)
-                p_cards.remove(c_disc)
-                update_player_data(p_id, {'cards': p_cards})
-                c_name = POWER_CARDS.get(c_disc, {}).get('name', 'Unknown Card')
-                discard_summary.append(f"🌪️ {p_name} lost a {c_name} card.")
-                if p_id != user.id:
-                    try:
-                        await context.bot.send_message(chat_id=p_id, text=f"🌪️ {user_name} (@{user.username or 'user'}) unleashed a Vortex!\nYou were forced to discard your {c_name} card.")
-                    except Exception as e:
-                        logger.warning(f"Could not send Vortex DM to {p_id}: {e}")
-
+        rng = RNG_SERVICE.derive('vortex', user_id=user.id)
+        vortex_discards = {}
+        dms = []
+
+        def strike(records):
+            changes = {}
+            for p_id in sorted(records):
+                p_data = records[p_id].to_dict()
+                p_name = p_data.get('first_name', 'A player')
+                p_status = p_data.get('status', {}) or {}
+                p_inv = CardInventory.from_cards(p_data.get('cards', []))
+
+                if p_status.get('protected'):
+                    p_status['protected'] = False
+                    changes[p_id] = {'status': p_status}
+                    discard_summary.append(f"🛡️ {p_name} was protected by a Forcefield!")
+                    if p_id != user.id:
+                        dms.append((p_id, f"🌪️ {user_name} (@{user.username or 'user'}) unleashed a Vortex, but your Forcefield protected you!"))
+                elif not p_inv:
+                    discard_summary.append(f"💨 {p_name} had no cards to discard.")
+                else:
+                    c_disc = p_inv.choice(rng)
+                    vortex_discards[p_id] = c_disc
+                    p_inv.discard(c_disc)
+                    changes[p_id] = {'cards': p_inv.to_list()}
+                    c_name = POWER_CARDS.get(c_disc, {}).get('name', 'Unknown Card')
+                    discard_summary.append(f"🌪️ {p_name} lost a {c_name} card.")
+                    if p_id != user.id:
+                        dms.append((p_id, f"🌪️ {user_name} (@{user.username or 'user'}) unleashed a Vortex!\nYou were forced to discard your {c_name} card."))
+            return changes
+
+        with FANOUT_SECONDS.time('vortex'):
+            update_players([p.user_id for p in get_eligible_player_records(attacker_is_msgc, user.id)], strike)
+
+        RNG_SERVICE.record(rng, vortex_discards)
         summary_message = "\n".join(discard_summary)
         await safe_reply(update, summary_message)
-        await log_activity(context.bot, summary_message)
+        BACKGROUND.spawn(notify_players(context.bot, dms), 'vortex_dms')
+        BACKGROUND.spawn(log_activity(context.bot, summary_message), 'log_activity')
         return
 
     if 'public' in result and result['public']:
@@ -1620,31 +2352,30 @@ async def execute_card_effect(update: Update, context: ContextTypes.DEFAULT_TYPE
             await safe_reply_animation(update, animation=gif_url, caption=result['public'])
         else:
             await safe_reply(update, result['public'])
+
+    # Everything below is a side effect of the reply above and runs after the handler returns.
+    priority_dms = []
     if 'private' in result and result['private']:
-        await context.bot.send_message(chat_id=user.id, text=result['private'])
+        priority_dms.append((user.id, result['private']))
+    if target_user and getattr(target_user, 'id', None) and target_user.id != user.id and result.get('public'):
+        priority_dms.append((target_user.id, f"⚠️ {user.first_name} (@{user.username or 'user'}) used a {card['name']} card on you!\n\nEffect: {result['public']}"))
+    if priority_dms:
+        BACKGROUND.spawn(notify_players(context.bot, priority_dms, priority=True), 'card_dms')
 
     if card_id == 'inflation' and result.get('public'):
-        all_players = get_all_players()
-        user_is_msgc = bool(user_data.get('msgc_registered', False)) if user_data else False
-        for p in all_players:
-            p_is_msgc = bool(p.get('msgc_registered', False))
-            if p['user_id'] != user.id and p_is_msgc == user_is_msgc and not is_user_exempt_from_inflation(p['user_id'], p.get('status')):
-                try:
-                    await context.bot.send_message(
-                        chat_id=p['user_id'],
-                        text=f"📈 {user.first_name} (@{user.username or 'user'}) used Inflation!\nFor the next 1 hour, store card prices are doubled for everyone else!"
-                    )
-                except Exception as e:
-                    logger.warning(f"Could not send Inflation DM to user {p['user_id']}: {e}")
+        BACKGROUND.spawn(notify_inflation(context.bot, user, user_data), 'inflation_dms')
 
-    if target_user and getattr(target_user, 'id', None) and target_user.id != user.id and result.get('public'):
-        try:
-            target_dm_text = f"⚠️ {user.first_name} (@{user.username or 'user'}) used a {card['name']} card on you!\n\nEffect: {result['public']}"
-            await context.bot.send_message(chat_id=target_user.id, text=target_dm_text)
-        except Exception as e:
-            logger.warning(f"Could not send DM to target user {target_user.id}: {e}")
-        
-    await log_activity(context.bot, result.get('public') or result.get('private'))
+    BACKGROUND.spawn(log_activity(context.bot, result.get('public') or result.get('private')), 'log_activity')
+
+@timed_fanout('inflation')
+async def notify_inflation(bot: Bot, user, user_data: dict):
+    """DMs every non-exempt player in the user's MSGC pool and chat that prices just doubled."""
+    user_is_msgc = bool(user_data.get('msgc_registered', False)) if user_data else False
+    text = f"📈 {user.first_name} (@{user.username or 'user'}) used Inflation!\nFor the next 1 hour, store card prices are doubled for everyone else!"
+    await notify_players(bot, [
+        (p.user_id, text) for p in get_eligible_player_records(user_is_msgc, user.id)
+        if p.user_id != user.id and not is_user_exempt_from_inflation(p.user_id, p.status)
+    ])
 
 
 # --- DOUBLE OR NOTHING LOGIC ---
@@ -1728,18 +2459,11 @@ async def handle_double_or_nothing_challenge(update: Update, context: ContextTyp
     if target_status.get('ricochet_active_until', 0) > now:
         target_status['ricochet_active_until'] = 0
         update_player_data(target.id, {'status': target_status})
-        all_players = get_all_players()
         attacker_is_msgc = bool(attacker_data.get('msgc_registered', False)) if attacker_data else False
-        potential = [
-            p for p in all_players
-            if p.get('user_id') and str(p.get('user_id')) != '0'
-            and p['user_id'] != attacker.id and p['user_id'] != target.id
-            and not is_player_eliminated(p)
-            and bool(p.get('msgc_registered', False)) == attacker_is_msgc
-            and p.get('coins', 0) >= wager
-        ]
-        if potential:
-            new_target_dict = random.choice(potential)
+        rng = RNG_SERVICE.derive('double_or_nothing_ricochet', attacker_id=attacker.id, target_id=target.id)
+        new_target_dict = pick_eligible_target(rng, attacker_is_msgc, attacker.id, exclude=(attacker.id, target.id), min_coins=wager)
+        if new_target_dict:
+            RNG_SERVICE.record(rng, new_target_dict['user_id'])
             class PseudoTarget:
                 def __init__(self, uid, fname, uname):
                     self.id = uid
@@ -1761,7 +2485,9 @@ async def handle_double_or_nothing_challenge(update: Update, context: ContextTyp
         await safe_reply(update, f"🛡️ Blocked! {target.first_name}'s Forcefield deflected the Double or Nothing challenge!")
         return
 
-    winner, loser = (attacker, target) if random.random() < 0.5 else (target, attacker)
+    rng = RNG_SERVICE.derive('double_or_nothing', attacker_id=attacker.id, target_id=target.id)
+    winner, loser = (attacker, target) if rng.random() < 0.5 else (target, attacker)
+    RNG_SERVICE.record(rng, winner.id)
     winner_data = attacker_data if winner.id == attacker.id else target_data
     loser_data = target_data if winner.id == attacker.id else attacker_data
 
@@ -1792,6 +2518,7 @@ async def handle_double_or_nothing_challenge(update: Update, context: ContextTyp
         surcharge_msg = f"\n\n⚠️ Repeat Attack Penalty: Charged an extra {surcharge} PC (+{30*repeat_count}%) for repeatedly challenging {target.first_name}!"
     repeat_attacks[repeat_key] = {'count': repeat_count + 1, 'last_time': now}
     att_status['repeat_attacks'] = repeat_attacks
+    att_status['attacks_landed'] = att_status.get('attacks_landed', 0) + 1
     
     update_player_data(attacker.id, {'cards': att_cards, 'status': att_status})
 
@@ -1807,13 +2534,9 @@ async def handle_double_or_nothing_challenge(update: Update, context: ContextTyp
     else:
         await safe_reply(update, message)
 
-    try:
-        target_dm_text = f"🎲 {attacker.first_name} (@{attacker.username or 'user'}) used Double or Nothing on you!\n\nWinner: {winner.first_name}\nPot won: {wager * 2} Power Coins"
-        await context.bot.send_message(chat_id=target.id, text=target_dm_text)
-    except Exception as e:
-        logger.warning(f"Could not send DM to target {target.id}: {e}")
-
-    await log_activity(context.bot, f"🎲 {attacker.first_name} used Double or Nothing on {target.first_name}. Winner: {winner.first_name}")
+    target_dm_text = f"🎲 {attacker.first_name} (@{attacker.username or 'user'}) used Double or Nothing on you!\n\nWinner: {winner.first_name}\nPot won: {wager * 2} Power Coins"
+    BACKGROUND.spawn(notify_players(context.bot, [(target.id, target_dm_text)], priority=True), 'double_or_nothing_dm')
+    BACKGROUND.spawn(log_activity(context.bot, f"🎲 {attacker.first_name} used Double or Nothing on {target.first_name}. Winner: {winner.first_name}"), 'log_activity')
 
 
 # --- GOD CARD LOGIC ---
@@ -1918,16 +2641,10 @@ async def execute_god_power(update: Update, context: ContextTypes.DEFAULT_TYPE,
             elif target_status.get('ricochet_active_until', 0) > now:
                 target_status['ricochet_active_until'] = 0
                 update_player_data(target_data['user_id'], {'status': target_status})
-                all_players = get_all_players()
-                potential = [
-                    p for p in all_players
-                    if p.get('user_id') and str(p.get('user_id')) != '0'
-                    and p['user_id'] != user.id and p['user_id'] != target_data['user_id']
-                    and not is_player_eliminated(p)
-                    and bool(p.get('msgc_registered', False)) == user_is_msgc
-                ]
-                if potential:
-                    new_target = random.choice(potential)
+                rng = RNG_SERVICE.derive('god_ricochet', user_id=user.id, target_id=target_data['user_id'])
+                new_target = pick_eligible_target(rng, user_is_msgc, user.id, exclude=(user.id, target_data['user_id']))
+                if new_target:
+                    RNG_SERVICE.record(rng, new_target['user_id'])
                     coins_lost = min(new_target.get('coins', 0) // 2, max(0, new_target.get('coins', 0) - 10))
                     new_target_coins = max(0, new_target.get('coins', 0) - coins_lost)
                     n_status = new_target.get('status', {}) or {}
@@ -1949,6 +2666,7 @@ async def execute_god_power(update: Update, context: ContextTypes.DEFAULT_TYPE,
                 target_coins = max(0, target_data.get('coins', 0) - coins_lost)
                 target_status['attack_grace_until'] = now + (30 * 60)
                 effect_message = f"🛐 {user_name} used God's Smite on {target_data.get('first_name')}, destroying {coins_lost} coins!"
+                user_status['attacks_landed'] = user_status.get('attacks_landed', 0) + 1
                 if 'insurance' in target_data.get('cards', []) and coins_lost > 0:
                     refund = int(coins_lost * 0.5)
                     target_coins += refund
@@ -1964,22 +2682,19 @@ async def execute_god_power(update: Update, context: ContextTypes.DEFAULT_TYPE,
             user_status['repeat_attacks'] = repeat_attacks
 
         elif power == 'tribute':
-            all_players = get_all_players()
-            total_tribute = 0
-            for p in all_players:
-                p_is_msgc = bool(p.get('msgc_registered', False))
-                if p['user_id'] != user.id and p_is_msgc == user_is_msgc:
-                    c_pay = min(5, p.get('coins', 0))
-                    total_tribute += c_pay
-                    update_player_data(p['user_id'], {'coins': p.get('coins', 0) - c_pay})
-                    try:
-                        await context.bot.send_message(
-                            chat_id=p['user_id'],
-                            text=f"🛐 {user_name} (@{user.username or 'user'}) used God's Tribute!\n\nYou paid {c_pay} Power Coins in tribute to {user_name}."
-                        )
-                    except Exception as e:
-                        logger.warning(f"Could not send Tribute DM to user {p['user_id']}: {e}")
-            
+            paid = {}
+
+            def collect_tribute(records):
+                paid.update((uid, min(5, p.coins)) for uid, p in records.items())
+                return {uid: {'coins': records[uid].coins - c_pay} for uid, c_pay in paid.items()}
+
+            with FANOUT_SECONDS.time('tribute'):
+                payers = [p.user_id for p in get_eligible_player_records(user_is_msgc, user.id) if p.user_id != user.id]
+                update_players(payers, collect_tribute)
+            total_tribute = sum(paid.values())
+            tribute_dms = [(uid, f"🛐 {user_name} (@{user.username or 'user'}) used God's Tribute!\n\nYou paid {c_pay} Power Coins in tribute to {user_name}.")
+                           for uid, c_pay in paid.items()]
+
             user_data['coins'] = user_data.get('coins', 0) + total_tribute
             effect_message = f"🛐 {user_name} used God's Tribute, collecting a total of {total_tribute} coins from all other players!"
         else:
@@ -1999,27 +2714,146 @@ async def execute_god_power(update: Update, context: ContextTypes.DEFAULT_TYPE,
         else:
             await safe_reply(update, effect_message)
         
+        if power == 'tribute':
+            BACKGROUND.spawn(notify_players(context.bot, tribute_dms), 'tribute_dms')
         if target_data and target_data.get('user_id') and target_data['user_id'] != user.id:
-            try:
-                await context.bot.send_message(
-                    chat_id=target_data['user_id'],
-                    text=f"🛐 {user_name} (@{user.username or 'user'}) used God's {power.capitalize()} on you!\n\nEffect: {effect_message}"
-                )
-            except Exception as e:
-                logger.warning(f"Could not send DM to target {target_data['user_id']}: {e}")
+            target_dm_text = f"🛐 {user_name} (@{user.username or 'user'}) used God's {power.capitalize()} on you!\n\nEffect: {effect_message}"
+            BACKGROUND.spawn(notify_players(context.bot, [(target_data['user_id'], target_dm_text)], priority=True), 'god_dm')
 
-        await log_activity(context.bot, effect_message)
+        BACKGROUND.spawn(log_activity(context.bot, effect_message), 'log_activity')
 
     except Exception as e:
         logger.error(f"Error executing God power: {e}")
         await safe_reply(update, f"Action failed: {e}")
 
 
+async def leaderboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Shows the top 10 players by coins, cards held or attacks landed, plus the caller's own rank."""
+    user = update.effective_user
+    board_name = context.args[0].lower() if context.args else 'coins'
+    board_aliases = {'coin': 'coins', 'pc': 'coins', 'card': 'cards', 'attack': 'attacks', 'attacks_landed': 'attacks'}
+    board_name = board_aliases.get(board_name, board_name)
+    if board_name not in LEADERBOARDS:
+        await safe_reply(update, "Usage: /leaderboard [coins|cards|attacks]")
+        return
+
+    ensure_leaderboards_loaded()
+    board = LEADERBOARDS[board_name]
+    if not len(board):
+        await safe_reply(update, "No players are ranked yet.")
+        return
+
+    unit = {'coins': 'PC', 'cards': 'cards', 'attacks': 'attacks'}[board_name]
+    medals = {1: '🥇', 2: '🥈', 3: '🥉'}
+    lines = [f"🏆 {LEADERBOARD_TITLES[board_name]} 🏆\n"]
+    for pos, (uid, score) in enumerate(board.top(10), 1):
+        record = PLAYER_CACHE.get(uid)
+        name = record.display_name if record else f"ID: {uid}"
+        lines.append(f"{medals.get(pos, f'{pos}.')} {name} — {score} {unit}")
+
+    if user:
+        my_rank = board.rank(user.id)
+        if my_rank:
+            lines.append(f"\n📍 Your rank: #{my_rank} of {len(board)} ({board.score(user.id)} {unit})")
+        else:
+            lines.append("\n📍 You are not ranked yet. Use /start to join the game!")
+
+    await safe_reply(update, "\n".join(lines))
+
+async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Shows a player's recent coin and card changes from the ledger. Admins can look up any player."""
+    user = update.effective_user
+    if not user:
+        return
+
+    target_id, target_name = user.id, user.first_name or 'you'
+    if context.args and is_admin(user.id):
+        target = get_player_by_username(context.args[0].lstrip('@'))
+        if not target:
+            await safe_reply(update, f"Player {context.args[0]} was not found.")
+            return
+        target_id, target_name = target['user_id'], target.get('first_name') or context.args[0]
+
+    try:
+        entries = LEDGER.history(target_id, limit=15)
+    except Exception as e:
+        logger.error(f"Error reading ledger history for {target_id}: {e}")
+        await safe_reply(update, "History is not available right now. Please try again later.")
+        return
+    if not entries:
+        await safe_reply(update, f"No coin or card history recorded for {target_name} yet.")
+        return
+
+    lines = [f"📒 Recent history for {target_name}\n"]
+    for entry in entries:
+        when = time.strftime('%d %b %H:%M', time.gmtime(entry.ts))
+        if entry.card_id:
+            change = f"{'+' if entry.card_delta > 0 else '-'}{POWER_CARDS.get(entry.card_id, {}).get('name', entry.card_id)} card"
+        else:
+            change = f"{'+' if entry.coins > 0 else ''}{entry.coins} PC"
+        line = f"{when} UTC — {change} ({entry.reason or 'other'})"
+        if is_admin(user.id):
+            line += f" [{entry.event_id}]"
+        lines.append(line)
+    await safe_reply(update, "\n".join(lines))
+
+
 # --- ADMIN COMMANDS ---
 
+# --- PLAYER REPORTS ---
+# /allplayers is one message paged with inline buttons. A report freezes the matching ids in their sort order;
+# each page re-reads only its own players, so paging through thousands of players costs one edit per page.
+ALL_PLAYERS_REPORTS = ReportCache()
+ALL_PLAYERS_PAGE_SIZE = 10
+ALL_PLAYERS_MAX_CARDS = 6
+
+def roster_records() -> list:
+    """Every registered player, served from the player cache once it holds the full roster."""
+    ensure_leaderboards_loaded()
+    return [p for p in list(PLAYER_CACHE.values()) if isinstance(p.user_id, int) and p.user_id != 0]
+
+def render_report_page(report: Report, page: int):
+    """Text and Prev/refresh/Next keyboard for one page of an /allplayers report."""
+    pages = report.pages(ALL_PLAYERS_PAGE_SIZE)
+    ids = report.page_ids(page, ALL_PLAYERS_PAGE_SIZE)
+    records = {p.user_id: p for p in get_player_records(ids)}
+    now = time.time()
+    lines = [f"📊 {report.title} — page {page + 1}/{pages}\n"]
+    for pos, uid in enumerate(ids, page * ALL_PLAYERS_PAGE_SIZE + 1):
+        p = records.get(uid)
+        if p is None:
+            lines.append(f"{pos}. 👤 ID: {uid} (no longer registered)\n")
+            continue
+        username = f" (@{p.username})" if p.username else ""
+        names = [POWER_CARDS[cid]['name'] for cid in p.cards if cid in POWER_CARDS]
+        cards_str = ", ".join(names[:ALL_PLAYERS_MAX_CARDS]) or "None"
+        if len(names) > ALL_PLAYERS_MAX_CARDS:
+            cards_str += f" +{len(names) - ALL_PLAYERS_MAX_CARDS} more"
+        badges = ["Eliminated 💀" if p.is_eliminated else "Active 🟢"] + [badge for _, badge in active_effects(p, now)]
+        if p.msgc_registered:
+            badges.append("MSGC ✅")
+        lines.append(
+            f"{pos}. 👤 {p.first_name or p.username or f'ID: {uid}'}{username}\n"
+            f"    💰 Coins: {p.coins} PC\n"
+            f"    🎴 Cards: {cards_str}\n"
+            f"    ✨ Status: {', '.join(badges)}\n"
+        )
+
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀️ Prev", callback_data=f"allp:{report.report_id}:{page - 1}"))
+    buttons.append(InlineKeyboardButton(f"🔄 {page + 1}/{pages}", callback_data=f"allp:{report.report_id}:{page}"))
+    if page < pages - 1:
+        buttons.append(InlineKeyboardButton("Next ▶️", callback_data=f"allp:{report.report_id}:{page + 1}"))
+    return "\n".join(lines), InlineKeyboardMarkup([buttons])
+
 async def all_players_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Admin command to view all players with their coin balance, cards, and current status."""
-    if not is_admin(update.effective_user.id):
+    """Admin command to page through players in one message, or export them as a CSV/JSON document.
+
+    /allplayers [coins|cards|name|id] [active|eliminated] [msgc|nomsgc] [effects|<effect>] [min=N] [max=N] [export csv|json]
+    """
+    user = update.effective_user
+    if not is_admin(user.id):
         await safe_reply(update, "You are not authorized to use this command.")
         return
 
@@ -2028,61 +2862,290 @@ async def all_players_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
 
     try:
-        all_players = get_all_players()
-        if not all_players:
-            await safe_reply(update, "No players have registered yet.")
-            return
+        report_query = ReportQuery.parse(context.args)
+    except ValueError as e:
+        await safe_reply(update, f"Unknown option: {e}\n{REPORT_USAGE}")
+        return
 
-        now = time.time()
-        chunks = []
-        current_chunk = [f"📊 *All Players Report ({len(all_players)} Total)*\n"]
-
-        for i, p in enumerate(all_players, 1):
-            name = p.get('first_name') or p.get('username') or f"ID: {p.get('user_id')}"
-            username = f" (@{p.get('username')})" if p.get('username') else ""
-            coins = p.get('coins', 0)
-            cards_list = [POWER_CARDS[cid]['name'] for cid in p.get('cards', []) if cid in POWER_CARDS]
-            cards_str = ", ".join(cards_list) if cards_list else "None"
-            
-            p_status = p.get('status', {}) or {}
-            s_badges = []
+    if await defer_report_under_load(update, context, all_players_command):
+        return
 
-            if is_player_eliminated(p):
-                s_badges.append("Eliminated 💀")
-            else:
-                s_badges.append("Active 🟢")
-
-            if p_status.get('protected'): s_badges.append("Protected 🛡️")
-            if p_status.get('trap_active'): s_badges.append("Trap 🪤")
-            if p_status.get('shackled_until', 0) > now: s_badges.append("Shackled ⛓️")
-            if p_status.get('karma_active_until', 0) > now: s_badges.append("Karma ⚖️")
-            if p_status.get('blackout_until', 0) > now: s_badges.append("Blackout 🕶️")
-            if p_status.get('mirage_until', 0) > now: s_badges.append("Mirage 🏜️")
-            if p_status.get('speed_active_until', 0) > now: s_badges.append("Speed ⚡️")
-            if bool(p.get('msgc_registered', False)): s_badges.append("MSGC ✅")
-
-            status_str = ", ".join(s_badges)
-
-            entry = (
-                f"{i}. 👤 *{name}*{username}\n"
-                f"    💰 Coins: {coins} PC\n"
-                f"    🎴 Cards: {cards_str}\n"
-                f"    ✨ Status: {status_str}\n"
-            )
-            current_chunk.append(entry)
+    try:
+        roster = roster_records()
+        if not roster:
+            await safe_reply(update, "No players have registered yet.")
+            return
+        players = report_query.select(roster)
+        if not players:
+            await safe_reply(update, f"No players match ({report_query.describe()}).")
+            return
 
-            # Split into chunks of 10 players to avoid Telegram 4096 char limits
-            if len(current_chunk) >= 11 or i == len(all_players):
-                chunks.append("\n".join(current_chunk))
-                current_chunk = []
+        if report_query.export:
+            document = write_export(players, report_query.export)
+            try:
+                await context.bot.send_document(
+                    chat_id=user.id, document=document, filename=f"players-{int(time.time())}.{report_query.export}",
+                    caption=f"📊 {len(players)} players ({report_query.describe()})",
+                )
+            except Exception as e:
+                logger.error(f"Could not send player export: {e}")
+                await safe_reply(update, "Could not send the export. Make sure you have started a private chat with me.")
+                return
+            if update.effective_chat and update.effective_chat.type != 'private':
+                await safe_reply(update, "📄 Player export sent to your DM.")
+            return
 
-        for chunk in chunks:
-            await safe_reply(update, chunk)
+        title = f"All Players Report ({len(players)} of {len(roster)}, {report_query.describe()})"
+        report = ALL_PLAYERS_REPORTS.add(user.id, [p.user_id for p in players], title)
+        text, reply_markup = render_report_page(report, 0)
+        await safe_reply(update, text, reply_markup=reply_markup)
 
     except Exception as e:
         logger.error(f"Error in /allplayers command: {e}")
         await safe_reply(update, f"An error occurred while fetching player data: {e}")
 
+async def handle_all_players_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Prev/Next/refresh on an /allplayers report: re-renders the page and edits the message in place."""
+    query = update.callback_query
+    if not is_admin(query.from_user.id):
+        await query.answer("Only admins can page through this report.", show_alert=True)
+        return
+    try:
+        _, report_id, page = query.data.split(':')
+        page = int(page)
+    except ValueError:
+        await query.answer()
+        return
+    report = ALL_PLAYERS_REPORTS.get(report_id)
+    if report is None:
+        await query.answer("This report has expired. Run /allplayers again.", show_alert=True)
+        return
+    await query.answer()
+    page = min(max(0, page), report.pages(ALL_PLAYERS_PAGE_SIZE) - 1)
+    text, reply_markup = render_report_page(report, page)
+    try:
+        await query.edit_message_text(text, reply_markup=reply_markup)
+    except Exception as e:
+        # Refreshing a page nothing on which has changed is rejected as "message is not modified".
+        if 'not modified' not in str(e).lower():
+            logger.warning(f"Could not edit /allplayers page: {e}")
+
+# --- BULK PAYOUTS ---
+# A payout file (see payouts.py) an admin uploads in DM is resolved against the username index in one pass,
+# applied with batched upserts under the upload's ledger event, and answered with a per-row report.
+PAYOUT_BATCH_SIZE = 200
+CARD_INDEX = card_index(POWER_CARDS)
+
+def resolve_players(refs) -> tuple:
+    """Player records for ('id', n) / ('name', s) references: ({ref: Player}, {ambiguous refs}).
+
+    Ids and names in USERNAME_INDEX are read with one batched query. Only if a name is still unknown (or
+    indexed under a username its player no longer has) is the player table scanned, once. A name matches a
+    username first, then the first or in-game name of exactly one player.
+    """
+    found, ambiguous, unknown = {}, set(), set()
+    wanted = {ref: ref[1] if ref[0] == 'id' else USERNAME_INDEX.get(ref[1]) for ref in refs}
+    ids = {user_id for user_id in wanted.values() if user_id is not None}
+    records = {r.user_id: r for r in get_player_records(ids)} if ids else {}
+    for ref, user_id in wanted.items():
+        record = records.get(user_id)
+        if record and (ref[0] == 'id' or normalise_username(record.username) == ref[1]):
+            found[ref] = record
+        elif ref[0] == 'name':
+            unknown.add(ref)
+    if not unknown:
+        return found, ambiguous
+
+    by_username, by_alias = {}, {}
+    for p in get_all_player_records():
+        if p.user_id == 0:
+            continue
+        if p.username:
+            by_username.setdefault(normalise_username(p.username), p)
+        for alias in {str(p.first_name or '').lower().strip(), str(p.in_game_name or '').lower().strip()} - {''}:
+            by_alias.setdefault(alias, []).append(p)
+    for ref in unknown:
+        matches = by_alias.get(ref[1], [])
+        if ref[1] in by_username:
+            found[ref] = by_username[ref[1]]
+        elif len(matches) == 1:
+            found[ref] = matches[0]
+        elif matches:
+            ambiguous.add(ref)
+    return found, ambiguous
+
+def settle_payout(record: Player, rows: list) -> tuple:
+    """Adds one player's payout rows up on top of their record, filling in each row's status and detail.
+
+    Returns (column updates, {'coins': delta, 'cards': [card ids]}).
+    """
+    coins, cards, status = record.coins, record.cards.copy(), PlayerStatus.decode(record.status.encode())
+    result = {'coins': 0, 'cards': []}
+    for row in rows:
+        notes = []
+        total = coins + row.coins
+        if total < 0:
+            notes.append(f"coins stopped at 0 (had {coins})")
+            total = 0
+        coin_delta = total - coins
+        result['coins'] += coin_delta
+        coins = total
+
+        new_cards = [cid for cid in dict.fromkeys(row.card_ids) if cid not in cards]
+        for cid in new_cards:
+            cards.add(cid)
+            status.card_costs = {**(status.card_costs or {}), cid: 0}
+        result['cards'] += new_cards
+        owned = [cid for cid in row.card_ids if cid not in new_cards]
+        if owned:
+            notes.append(f"already owned: {', '.join(POWER_CARDS[cid]['name'] for cid in owned)}")
+
+        row.status = 'ok' if coin_delta or new_cards else 'skipped'
+        row.detail = "; ".join(notes)
+    return {'coins': coins, 'cards': cards, 'status': status}, result
+
+def apply_payouts(rows: list, dry_run: bool = False) -> dict:
+    """Resolves and applies every pending PayoutRow, filling in its status and detail.
+
+    Rows for the same player add up. Coins never go below zero and cards a player already holds are
+    reported, not duplicated. Players are written PAYOUT_BATCH_SIZE at a time through update_players,
+    so each player's rows are settled on their current record and a payout overlapping a job (/awardall)
+    adds to its changes instead of overwriting them. Changes go under the current ledger event.
+    Blocks on Supabase for every batch; the bot calls it off the update loop.
+    Returns {user_id: {'coins': delta, 'cards': [card ids]}} of what was (or would be) applied.
+    """
+    pending = []
+    for row in rows:
+        if row.status != 'pending':
+            continue
+        unknown = [card for card in row.cards if card.lower() not in CARD_INDEX]
+        if unknown:
+            row.fail(f"unknown card: {', '.join(unknown)}")
+            continue
+        row.card_ids = [CARD_INDEX[card.lower()] for card in row.cards]
+        pending.append(row)
+
+    found, ambiguous = resolve_players({player_ref(row.player) for row in pending})
+    resolved, player_rows = {}, {}
+    for row in pending:
+        ref = player_ref(row.player)
+        record = found.get(ref)
+        if record is None:
+            row.fail("name matches several players; use the @username or id" if ref in ambiguous else "player not found")
+            continue
+        row.user_id = record.user_id
+        resolved[record.user_id] = record
+        player_rows.setdefault(record.user_id, []).append(row)
+
+    applied = {}
+
+    def settle(records):
+        changes = {}
+        for user_id, record in records.items():
+            change, result = settle_payout(record, player_rows[user_id])
+            if result['coins'] or result['cards']:
+                changes[user_id], applied[user_id] = change, result
+        return changes
+
+    if dry_run:
+        settle(resolved)
+        return applied
+
+    user_ids, failed = list(player_rows), set()
+    for start in range(0, len(user_ids), PAYOUT_BATCH_SIZE):
+        settled = set(applied)
+        written = update_players(user_ids[start:start + PAYOUT_BATCH_SIZE], settle)
+        chunk = set(applied) - settled
+        if written < len(chunk):
+            # Players whose write failed are dropped from the cache or left dirty by update_players.
+            failed.update(uid for uid in chunk if PLAYER_CACHE.get(uid) is None or PLAYER_CACHE[uid].dirty_fields)
+    for row in rows:
+        if row.status == 'pending':
+            # Resolved, but gone from Supabase by the time its batch was read.
+            row.fail("player not found")
+        elif row.user_id in failed and row.status == 'ok':
+            row.fail("write failed")
+    return {uid: result for uid, result in applied.items() if uid not in failed}
+
+async def payout_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Admin command explaining the payout file format; the file itself is handled by handle_payout_document."""
+    if not is_admin(update.effective_user.id):
+        await safe_reply(update, "You are not authorized to use this command.")
+        return
+    await safe_reply(update, PAYOUT_USAGE)
+
+async def handle_payout_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Applies a payout CSV/JSON file an admin sent in DM and replies with a summary and a per-row report."""
+    user = update.effective_user
+    message = update.effective_message
+    if not user or not is_admin(user.id) or not message or not message.document:
+        return
+    document = message.document
+    filename = document.file_name or ''
+    if not filename.lower().endswith(('.csv', '.json')):
+        await safe_reply(update, f"Only .csv and .json payout files are accepted.\n\n{PAYOUT_USAGE}")
+        return
+    if document.file_size and document.file_size > PAYOUT_MAX_BYTES:
+        await safe_reply(update, f"❌ That file is too large (max {PAYOUT_MAX_BYTES // 1024} KB).")
+        return
+    if not db:
+        await safe_reply(update, "Database not available.")
+        return
+
+    dry_run = 'dry' in (message.caption or '').lower()
+    try:
+        file = await document.get_file()
+        rows = parse_payout_file(bytes(await file.download_as_bytearray()), filename)
+    except ValueError as e:
+        await safe_reply(update, f"❌ {e}\n\n{PAYOUT_USAGE}")
+        return
+    except Exception as e:
+        logger.error(f"Could not download payout file: {e}")
+        await safe_reply(update, "Could not download that file. Please try again.")
+        return
+
+    try:
+        applied = await asyncio.to_thread(apply_payouts, rows, dry_run)
+    except Exception as e:
+        logger.error(f"Error applying payout file: {e}")
+        await safe_reply(update, "An error occurred while applying the payout file; check /history before sending it again.")
+        return
+
+    counts = {status: sum(1 for row in rows if row.status == status) for status in ('ok', 'skipped', 'error')}
+    total_coins = sum(result['coins'] for result in applied.values())
+    total_cards = sum(len(result['cards']) for result in applied.values())
+    event_id = current_event()[0]
+    lines = [
+        f"{'🔎 Dry run' if dry_run else '✅ Payout applied'}: {len(rows)} rows, {counts['ok']} ok, "
+        f"{counts['skipped']} skipped, {counts['error']} errors.",
+        f"{'Would give' if dry_run else 'Gave'} {total_coins:+,} PC and {total_cards} cards to {len(applied)} players.",
+    ]
+    errors = [row for row in rows if row.status == 'error']
+    lines += [f"• line {row.line} ({row.player or '?'}): {row.detail}" for row in errors[:10]]
+    if len(errors) > 10:
+        lines.append(f"• …and {len(errors) - 10} more errors in the report.")
+    if not dry_run and applied:
+        lines.append(f"Undo with /revertevent {event_id}")
+    await safe_reply(update, "\n".join(lines))
+
+    try:
+        await context.bot.send_document(
+            chat_id=message.chat_id, document=write_report(rows),
+            filename=f"payout-report-{int(time.time())}.csv", caption=f"📄 Per-row result of {filename}",
+        )
+    except Exception as e:
+        logger.error(f"Could not send payout report: {e}")
+
+    if dry_run or not applied:
+        return
+    dms = []
+    for user_id, result in applied.items():
+        parts = [f"{result['coins']:+,} Power Coins"] if result['coins'] else []
+        parts += [f"a {POWER_CARDS[cid]['name']} card" for cid in result['cards']]
+        dms.append((user_id, f"🎁 Admin payout: {', '.join(parts)}!"))
+    BACKGROUND.spawn(notify_players(context.bot, dms), 'payout_dms')
+    BACKGROUND.spawn(log_activity(context.bot, f"👑 Admin payout from {filename}: {total_coins:+,} PC and {total_cards} cards to {len(applied)} players ({event_id})."), 'log_activity')
+
 async def award_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Admin command to award coins to a player."""
     if not is_admin(update.effective_user.id):
@@ -2111,10 +3174,9 @@ async def award_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 
         # Send DM notification to the player
         try:
-            await context.bot.send_animation(
-                chat_id=target_data['user_id'],
-                animation=award_gif_url,
-                caption=f"🎁 You have received {amount} Power Coins from the Admin!"
+            await NOTIFIER.notify(
+                context.bot, target_data['user_id'],
+                f"🎁 You have received {amount} Power Coins from the Admin!", gif_url=award_gif_url
             )
         except Exception as e:
             logger.warning(f"Could not send DM to user {target_data['user_id']}: {e}")
@@ -2149,8 +3211,7 @@ async def awardall_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         return
 
     try:
-        awardall_gif_url = "https://media.giphy.com/media/v1.Y2lkPTc5MGI3NjExYnp4amQzMGRvcTk1YWRtNXk3d2NpeHd4eGxidGh5ZWltMnhldDdkMCZlcD12MV9naWZzX3NlYXJjaCZjdD1n/pwyW4XDmtqjG8/giphy.gif"
-        all_players, debug_info = get_all_players_debug()
+        all_players, debug_info = get_all_player_records_debug()
         if not all_players:
             key_prefix = SUPABASE_KEY[:12] if SUPABASE_KEY else 'None'
             await safe_reply(update, 
@@ -2162,21 +3223,8 @@ async def awardall_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
             )
             return
 
-        for p in all_players:
-            update_player_data(p['user_id'], {'coins': p.get('coins', 0) + amount})
-            try:
-                await context.bot.send_animation(
-                    chat_id=p['user_id'],
-                    animation=awardall_gif_url,
-                    caption=f"🎁 You have received {amount} Power Coins from the Admin!"
-                )
-            except Exception as e:
-                logger.warning(f"Could not send DM to user {p['user_id']}: {e}")
-        
-        reply_msg = f"✅ Successfully awarded {amount} PC to all {len(all_players)} players."
-        await safe_reply_animation(update, animation=awardall_gif_url, caption=reply_msg)
-        await log_activity(context.bot, f"👑 Admin awarded {amount} PC to all {len(all_players)} players.")
-
+        user_ids = [p.user_id for p in all_players if p.user_id]
+        await start_admin_job(update, 'awardall', f"Award {amount} PC to all players", user_ids, {'amount': amount})
     except Exception as e:
         logger.error(f"Error in /awardall command: {e}")
         await safe_reply(update, "An error occurred while awarding coins to all players.")
@@ -2210,6 +3258,9 @@ async def givecard_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
             return
             
         c_list = list(target_data.get('cards', []))
+        if card_id in c_list:
+            await safe_reply(update, f"❌ @{username} already has a {POWER_CARDS[card_id]['name']} card; players hold at most one of each card.")
+            return
         c_list.append(card_id)
         t_status = parse_json_dict(target_data.get('status', {}))
         card_costs = parse_json_dict(t_status.get('card_costs', {}))
@@ -2220,10 +3271,7 @@ async def givecard_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         
         # Send DM notification to the player
         try:
-            await context.bot.send_message(
-                chat_id=target_data['user_id'],
-                text=f"🎁 You have received a {card_name} card from the Admin!"
-            )
+            await NOTIFIER.notify(context.bot, target_data['user_id'], f"🎁 You have received a {card_name} card from the Admin!")
         except Exception as e:
             logger.warning(f"Could not send DM to user {target_data['user_id']}: {e}")
 
@@ -2251,18 +3299,13 @@ async def resetallcoins_command(update: Update, context: ContextTypes.DEFAULT_TY
             pass
 
     try:
-        all_players = get_all_players()
+        all_players = get_all_player_records()
         if not all_players:
             await safe_reply(update, "No players found in database.")
             return
 
-        for p in all_players:
-            if p.get('user_id'):
-                update_player_data(p['user_id'], {'coins': reset_amount, 'cards': []})
-
-        reply_msg = f"✅ Successfully reset all {len(all_players)} players to {reset_amount} coins and 0 cards."
-        await safe_reply(update, reply_msg)
-        await log_activity(context.bot, f"👑 Admin reset all {len(all_players)} players to {reset_amount} coins and 0 cards.")
+        user_ids = [p.user_id for p in all_players if p.user_id]
+        await start_admin_job(update, 'resetallcoins', f"Reset all players to {reset_amount} PC and 0 cards", user_ids, {'amount': reset_amount})
     except Exception as e:
         logger.error(f"Error in /resetallcoins command: {e}")
         await safe_reply(update, "An error occurred while resetting coins.")
@@ -2288,47 +3331,19 @@ async def startevent_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
         
     event_name = context.args[0].lower()
-    now = time.time()
-
-    if event_name == 'bogo':
-        update_game_state({'bogo_active_until': now + (15 * 60)})
-        await broadcast_event_message(context.bot, "🎁 *BOGO EVENT STARTED!* 🎁\n\nFor 15 minutes, store purchases for MSGC registered players include a FREE Tier 1 or 2 card!", context, gif_url=EVENT_GIFS.get('bogo'))
-        await safe_reply(update, "✅ BOGO event started for 15 minutes.")
 
-    elif event_name == 'secretsanta':
-        await safe_reply(update, "🎅 Initiating Secret Santa...")
-        await execute_secret_santa_event(context.bot, context)
-
-    elif event_name == 'rushhour':
-        update_game_state({'rush_hour_until': now + (60 * 60)})
-        await broadcast_event_message(context.bot, "⏰ *RUSH HOUR HAS BEGUN!* ⏰\n\nFor 1 hour, all card cooldowns are disabled for MSGC registered players!", context, gif_url=EVENT_GIFS.get('rushhour'))
-        await safe_reply(update, "✅ Rush Hour started for 1 hour.")
-
-    elif event_name == 'truce':
-        update_game_state({'truce_until': now + (15 * 60)})
-        await broadcast_event_message(context.bot, "🤝 *A TRUCE HAS BEEN CALLED!* 🤝\n\nFor 15 minutes, negative cards are disabled for MSGC registered players!", context, gif_url=EVENT_GIFS.get('truce'))
-        await safe_reply(update, "✅ Truce event started for 15 minutes.")
+    if event_name == 'secretsanta':
+        await start_secret_santa_job(update, context)
 
     elif event_name == 'gambit':
-        await safe_reply(update, "🎲 Initiating Gambit...")
-        await execute_gambit_event(context.bot, context)
-
-    elif event_name == 'coinrush':
-        duration = 10 * 60
-        update_game_state({'coin_rush_until': now + duration})
-        
-        async def coin_rush_end(ctx: ContextTypes.DEFAULT_TYPE):
-            await broadcast_event_message(ctx.bot, "💰 *Coin Rush has ended!* 💰\n\nThanks for participating!", ctx)
-            
-        if context.job_queue:
-            context.job_queue.run_once(coin_rush_end, duration)
-        await broadcast_event_message(context.bot, "💰 *COIN RUSH!* 💰\n\nFor 10 minutes, messages in group chats drop free Power Coins for MSGC registered players!", context, gif_url=EVENT_GIFS.get('coinrush'))
-        await safe_reply(update, "✅ Coin Rush started for 10 minutes.")
+        await start_gambit_job(update, context)
 
-    elif event_name == 'freebiefrenzy':
-        update_game_state({'freebie_frenzy_until': now + (15 * 60)})
-        await broadcast_event_message(context.bot, "🎁 *FREEBIE FRENZY!* 🎁\n\nFor 15 minutes, Tier 1 cards (except Angel) are FREE in the store for MSGC registered players!", context, gif_url=EVENT_GIFS.get('freebiefrenzy'))
-        await safe_reply(update, "✅ Freebie Frenzy started for 15 minutes.")
+    elif event_name in TIMED_EVENTS:
+        event = TIMED_EVENTS[event_name]
+        now = time.time()
+        open_event_window(event_name, now, now + event.duration)
+        await broadcast_event_message(context.bot, EVENT_ANNOUNCEMENTS[event_name], context, gif_url=EVENT_GIFS.get(event_name))
+        await safe_reply(update, f"✅ {event.label} started for {event.duration // 60} minutes.")
 
     else:
         await safe_reply(update, f"Unknown event: '{event_name}'. Use /startevent to see available events.")
@@ -2351,7 +3366,7 @@ async def endevent_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
 
         if event_name in key_map:
             target_key, display_name = key_map[event_name]
-            update_game_state({target_key: 0})
+            clear_event_timers([target_key])
             await broadcast_event_message(context.bot, f"🛑 *{display_name.upper()} EVENT ENDED!* 🛑\n\nThe '{display_name}' event has been ended by the Admin.", context)
             await safe_reply(update, f"🛑 The '{display_name}' event has been ended.")
             return
@@ -2362,13 +3377,7 @@ async def endevent_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
             await safe_reply(update, f"Unknown event: '{event_name}'. Usage: /endevent [bogo|secretsanta|rushhour|truce|gambit|coinrush|freebiefrenzy]")
             return
 
-    update_game_state({
-        'bogo_active_until': 0,
-        'rush_hour_until': 0,
-        'truce_until': 0,
-        'coin_rush_until': 0,
-        'freebie_frenzy_until': 0
-    })
+    clear_event_timers()
     
     await broadcast_event_message(context.bot, "🛑 *ALL ACTIVE EVENTS HAVE BEEN ENDED!* 🛑\n\nAll event bonuses, store discounts, and cooldown overrides have now expired.", context)
     await safe_reply(update, "🛑 All active events have been ended and announcement broadcasted.")
@@ -2385,6 +3394,7 @@ async def revertevent_command(update: Update, context: ContextTypes.DEFAULT_TYPE
             "Available Revert Targets:\n"
             "• gambit - Take back the free cards awarded in the last Gambit\n"
             "• secretsanta - Return all gifted cards/coins from the last Secret Santa\n"
+            "• <event id> - Undo any ledger event, e.g. update:123456 (see /history)\n"
             "• bogo / rushhour / truce / coinrush / freebiefrenzy - Cancel & revert active event immediately"
         )
         return
@@ -2392,78 +3402,30 @@ async def revertevent_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     event_name = context.args[0].lower()
     game_state = get_game_state()
 
-    if event_name == 'gambit':
-        records = game_state.get('last_gambit_awards', [])
-        if not records:
-            await safe_reply(update, "❌ No recorded Gambit event awards found to revert.")
+    if event_name in ['gambit', 'secretsanta'] or ':' in event_name:
+        label = {'gambit': 'Gambit', 'secretsanta': 'Secret Santa'}.get(event_name)
+        event_id = game_state.get(f'last_{event_name}_event') if label else context.args[0]
+        if not event_id:
+            await safe_reply(update, f"❌ No recorded {label} event found to revert.")
             return
 
-        reverted_count = 0
-        for item in records:
-            user_id = item.get('user_id')
-            card_id = item.get('card_id')
-            if not user_id or not card_id: continue
-
-            p_data = get_player_data(user_id)
-            if p_data:
-                cards = list(p_data.get('cards', []))
-                if card_id in cards:
-                    cards.remove(card_id)
-                    update_player_data(user_id, {'cards': cards})
-                    reverted_count += 1
-                    try:
-                        card_name = POWER_CARDS.get(card_id, {}).get('name', card_id)
-                        await context.bot.send_message(
-                            chat_id=user_id,
-                            text=f"↩️ *Gambit Event Reverted!* ↩️\nThe free *{card_name}* card awarded from Gambit has been removed from your inventory by an Admin."
-                        )
-                    except Exception:
-                        pass
-
-        update_game_state({'last_gambit_awards': []})
-        await broadcast_event_message(context.bot, f"↩️ *GAMBIT EVENT REVERTED!* ↩️\n\nAll free cards awarded during Gambit ({reverted_count} cards) have been taken back.", context)
-        await safe_reply(update, f"✅ Gambit event reverted. {reverted_count} cards removed from players.")
-
-    elif event_name == 'secretsanta':
-        records = game_state.get('last_secretsanta_swaps', [])
-        if not records:
-            await safe_reply(update, "❌ No recorded Secret Santa event swaps found to revert.")
+        running = JOBS.active_for_event(event_id) or JOBS.active_for_event(f"revert:{event_id}")
+        if running:
+            await safe_reply(update, f"❌ Job {running.job_id} ({running.title}) is still running for event {event_id}. Wait for it or /jobs cancel {running.job_id} first.")
             return
 
-        reverted_count = 0
-        for item in records:
-            s_id = item.get('sender_id')
-            r_id = item.get('receiver_id')
-            g_type = item.get('type')
-            val = item.get('val')
-            if not s_id or not r_id: continue
-
-            s_data = get_player_data(s_id)
-            r_data = get_player_data(r_id)
-
-            if g_type == 'card':
-                if r_data:
-                    r_cards = list(r_data.get('cards', []))
-                    if val in r_cards:
-                        r_cards.remove(val)
-                        update_player_data(r_id, {'cards': r_cards})
-                if s_data:
-                    s_cards = list(s_data.get('cards', []))
-                    s_cards.append(val)
-                    update_player_data(s_id, {'cards': s_cards})
-                reverted_count += 1
-            elif g_type == 'coins':
-                if r_data:
-                    r_coins = max(0, r_data.get('coins', 0) - val)
-                    update_player_data(r_id, {'coins': r_coins})
-                if s_data:
-                    s_coins = s_data.get('coins', 0) + val
-                    update_player_data(s_id, {'coins': s_coins})
-                reverted_count += 1
-
-        update_game_state({'last_secretsanta_swaps': []})
-        await broadcast_event_message(context.bot, "↩️ *SECRET SANTA REVERTED!* ↩️\n\nAll gifted cards and coins have been returned to their original owners.", context)
-        await safe_reply(update, f"✅ Secret Santa event reverted ({reverted_count} transactions returned).")
+        inverse = pending_revert(event_id)
+        if inverse is None:
+            await safe_reply(update, f"❌ Event {event_id} has already been reverted.")
+            return
+        if not inverse:
+            await safe_reply(update, f"❌ No coin or card changes are recorded for event {event_id}.")
+            return
+
+        items = [[user_id, {'coins': change['coins'], 'add': sorted(change['add']), 'remove': sorted(change['remove'])}]
+                 for user_id, change in sorted(inverse.items())]
+        params = {'target': event_id, 'name': event_name if label else None, 'label': label, 'reason': f"revert {event_id}"}
+        await start_admin_job(update, 'revert', f"Revert {label or 'event'} {event_id}", items, params, event_id=f"revert:{event_id}")
 
     elif event_name in ['bogo', 'rushhour', 'truce', 'coinrush', 'freebiefrenzy']:
         key_map = {
@@ -2474,7 +3436,7 @@ async def revertevent_command(update: Update, context: ContextTypes.DEFAULT_TYPE
             'freebiefrenzy': 'freebie_frenzy_until'
         }
         target_key = key_map[event_name]
-        update_game_state({target_key: 0})
+        clear_event_timers([target_key])
         await broadcast_event_message(context.bot, f"🛑 *{event_name.upper()} EVENT CANCELLED!* 🛑\n\nThe active event '{event_name}' has been stopped and reverted by the Admin.", context)
         await safe_reply(update, f"✅ Active '{event_name}' event stopped.")
 
@@ -2644,6 +3606,85 @@ async def openstore_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await safe_reply(update, "🔓 Power Store has been RE-OPENED. Players can now purchase and use cards.")
     await log_activity(context.bot, f"👑 Admin {user.first_name} opened the Power Store.")
 
+async def trace_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Admin command to show the most recent slow updates (/trace last [n]) or the latest updates (/trace recent [n])."""
+    if not is_admin(update.effective_user.id):
+        await safe_reply(update, "You are not authorized to use this command.")
+        return
+
+    args = [a.lower() for a in (context.args or [])]
+    mode = args[0] if args and not args[0].isdigit() else 'last'
+    count_arg = next((a for a in args if a.isdigit()), None)
+    count = min(int(count_arg), 10) if count_arg else 5
+    if mode not in ('last', 'recent'):
+        await safe_reply(update, "Usage: /trace last [n] — slowest recent updates\n/trace recent [n] — latest updates")
+        return
+
+    traces = list(TRACER.slow if mode == 'last' else TRACER.recent)[-count:]
+    if not traces:
+        await safe_reply(update, "No slow updates recorded yet." if mode == 'last' else "No updates traced yet.")
+        return
+
+    title = "🐢 Slow updates" if mode == 'last' else "🔎 Recent updates"
+    lines = [f"{title} (budget {TRACE_SLOW_SECONDS:g}s / {TRACE_SLOW_ROUND_TRIPS} round trips)"]
+    for trace in reversed(traces):
+        lines.append(
+            f"\n#{trace.update_id} {trace.command} — {trace.seconds * 1000:.0f} ms\n"
+            f"  DB: {trace.db_calls} calls, {trace.db_seconds * 1000:.0f} ms · API: {trace.api_calls} calls, {trace.api_seconds * 1000:.0f} ms"
+        )
+        for kind, name, calls, seconds in trace.breakdown()[:5]:
+            lines.append(f"  · {kind} {name} ×{calls} — {seconds * 1000:.0f} ms")
+    await safe_reply(update, "\n".join(lines))
+
+async def profile_bot_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Admin command to run the sampling profiler: /profile_bot start [seconds], stop, dump, or no argument for status."""
+    user = update.effective_user
+    if not user or not is_admin(user.id):
+        await safe_reply(update, "You are not authorized to use this command.")
+        return
+
+    action = context.args[0].lower() if context.args else 'status'
+    if action == 'start':
+        try:
+            seconds = float(context.args[1]) if len(context.args) > 1 else PROFILE_MAX_SECONDS
+        except ValueError:
+            await safe_reply(update, "Usage: /profile_bot start [seconds]")
+            return
+        if not PROFILER.start(seconds, baseline=handler_timings()):
+            await safe_reply(update, f"⏱️ A profiling session is already running ({PROFILER.elapsed():.0f}s so far).")
+            return
+        await safe_reply(update, f"⏱️ Profiling for up to {min(seconds, PROFILE_MAX_SECONDS):g}s. Use /profile_bot stop or /profile_bot dump for the report.")
+        return
+
+    if action in ('stop', 'dump'):
+        if action == 'stop':
+            PROFILER.stop()
+        if PROFILER.started_at is None:
+            await safe_reply(update, "No profiling session yet. Start one with /profile_bot start [seconds].")
+            return
+        report = PROFILER.report(handler_timings())
+        filename = f"profile-{int(PROFILER.started_at)}.txt"
+        try:
+            await context.bot.send_document(
+                chat_id=user.id, document=io.BytesIO(report.encode('utf-8')), filename=filename,
+                caption=f"⏱️ Profile over {PROFILER.elapsed():.0f}s, {PROFILER.samples:,} samples",
+            )
+        except Exception as e:
+            logger.error(f"Could not send profile report: {e}")
+            await safe_reply(update, "Could not send the report. Make sure you have started a private chat with me.")
+            return
+        if update.effective_chat and update.effective_chat.type != 'private':
+            await safe_reply(update, "📄 Profile report sent to your DM.")
+        return
+
+    if action != 'status':
+        await safe_reply(update, "Usage: /profile_bot start [seconds] | stop | dump")
+        return
+    if PROFILER.running:
+        await safe_reply(update, f"⏱️ Profiling: {PROFILER.elapsed():.0f}s, {PROFILER.samples:,} samples so far.")
+    else:
+        await safe_reply(update, "⏱️ The profiler is idle. Start it with /profile_bot start [seconds].")
+
 
 # --- EVENT SYSTEM ---
 
@@ -2657,18 +3698,40 @@ EVENT_GIFS = {
     'freebiefrenzy': 'https://media.giphy.com/media/v1.Y2lkPTc5MGI3NjExdWM5NnAxNmpqMDRjbmJuOHI3dm0wbTgzNDQ0czFvemo3bjY0bG04bSZlcD12MV9naWZzX3NlYXJjaCZjdD1n/PtC8Xg71JB8hKn7ZmS/giphy.gif'
 }
 
-async def broadcast_event_message(bot: Bot, message: str, context: ContextTypes.DEFAULT_TYPE = None, gif_url: str = None):
-    """Utility to broadcast an event announcement to tracked group chats, MSGC player DMs, and activity log with GIF support."""
+# Broadcast when a timed event starts, whether from /startevent or the schedule, and (Coin Rush only) when it ends.
+EVENT_ANNOUNCEMENTS = {
+    'bogo': "🎁 *BOGO EVENT STARTED!* 🎁\n\nFor 15 minutes, store purchases for MSGC registered players include a FREE Tier 1 or 2 card!",
+    'rushhour': "⏰ *RUSH HOUR HAS BEGUN!* ⏰\n\nFor 1 hour, all card cooldowns are disabled for MSGC registered players!",
+    'truce': "🤝 *A TRUCE HAS BEEN CALLED!* 🤝\n\nFor 15 minutes, negative cards are disabled for MSGC registered players!",
+    'coinrush': "💰 *COIN RUSH!* 💰\n\nFor 10 minutes, messages in group chats drop free Power Coins for MSGC registered players!",
+    'freebiefrenzy': "🎁 *FREEBIE FRENZY!* 🎁\n\nFor 15 minutes, Tier 1 cards (except Angel) are FREE in the store for MSGC registered players!",
+}
+EVENT_END_ANNOUNCEMENTS = {
+    'coinrush': "💰 *Coin Rush has ended!* 💰\n\nThanks for participating!",
+}
+
+@timed_fanout('broadcast')
+async def broadcast_event_message(bot: Bot, message: str, context: ContextTypes.DEFAULT_TYPE = None, gif_url: str = None, notifier: Notifier = None):
+    """Utility to broadcast an event announcement to tracked group chats, MSGC player DMs, and activity log with GIF support.
+
+    Inside a group chat only that chat and its members are notified. Admin jobs pass their own `notifier`.
+    """
     await log_activity(bot, message, title="🎉 Power Store Event!")
+    if not PRESSURE.allows_gifs():
+        gif_url = None
     
     group_chat_ids = set()
-    if context and hasattr(context, 'bot_data'):
-        group_chat_ids.update(context.bot_data.get('group_chat_ids', set()))
-    
-    game_state = get_game_state()
-    stored_chats = game_state.get('group_chat_ids', [])
-    if isinstance(stored_chats, list):
-        group_chat_ids.update(stored_chats)
+    if current_chat() is not None:
+        group_chat_ids.add(current_chat())
+    else:
+        group_chat_ids.update(GROUP_CHAT_IDS)
+        if context and hasattr(context, 'bot_data'):
+            group_chat_ids.update(context.bot_data.get('group_chat_ids', set()))
+
+        game_state = get_game_state()
+        stored_chats = game_state.get('group_chat_ids', [])
+        if isinstance(stored_chats, list):
+            group_chat_ids.update(stored_chats)
 
     # 1. Send broadcast to group chats
     for chat_id in group_chat_ids:
@@ -2684,40 +3747,29 @@ async def broadcast_event_message(bot: Bot, message: str, context: ContextTypes.
             logger.error(f"Failed to send event broadcast to chat {chat_id}: {e}")
 
     # 2. Send DM notification to all active registered players
-    all_players = get_all_players()
+    all_players = get_scope_player_records()
     for p in all_players:
-        if not is_player_eliminated(p) and p.get('user_id') and str(p.get('user_id')) != '0':
-            try:
-                if gif_url:
-                    try:
-                        await bot.send_animation(chat_id=p['user_id'], animation=gif_url, caption=message)
-                    except Exception:
-                        await bot.send_message(chat_id=p['user_id'], text=message)
-                else:
-                    await bot.send_message(chat_id=p['user_id'], text=message)
-            except Exception as e:
-                logger.warning(f"Could not send event DM to player {p['user_id']}: {e}")
+        if not p.is_eliminated and p.user_id and str(p.user_id) != '0':
+            await (notifier or NOTIFIER).notify(bot, p.user_id, message, gif_url=gif_url)
 
-async def execute_secret_santa_event(bot: Bot, context: ContextTypes.DEFAULT_TYPE):
-    """Executes Secret Santa card/coin gift exchange across all active registered players with direct DM notifications."""
-    all_players = get_all_players()
-    eligible_players = [p for p in all_players if not is_player_eliminated(p) and p.get('user_id') and str(p.get('user_id')) != '0']
+def event_targets(minimum: int = 1) -> list:
+    """Active registered players in scope for a Gambit or Secret Santa: the MSGC ones if there are at least
+    `minimum` of them, otherwise everyone active."""
+    eligible_players = [p for p in get_scope_players() if not is_player_eliminated(p) and p.get('user_id') and str(p.get('user_id')) != '0']
     msgc_flagged = [p for p in eligible_players if bool(p.get('msgc_registered', False))]
-    target_players = msgc_flagged if len(msgc_flagged) >= 2 else eligible_players
-
-    if len(target_players) < 2:
-        logger.info("Secret Santa cancelled: Less than 2 active registered players.")
-        await broadcast_event_message(bot, "🎅 *Secret Santa Cancelled:* At least 2 active registered players are required.", context)
-        return
-
-    player_ids = [p.get('user_id') for p in target_players if p.get('user_id')]
-    player_map = {p.get('user_id'): p for p in target_players if p.get('user_id')}
+    return msgc_flagged if len(msgc_flagged) >= minimum else eligible_players
 
+async def start_secret_santa_job(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Pairs every active registered player with a gift receiver and runs the exchange as an admin job."""
+    player_ids = [p.get('user_id') for p in event_targets(minimum=2)]
     if len(player_ids) < 2:
+        logger.info("Secret Santa cancelled: Less than 2 active registered players.")
+        await broadcast_event_message(context.bot, "🎅 *Secret Santa Cancelled:* At least 2 active registered players are required.", context)
         return
 
+    rng = RNG_SERVICE.derive('secretsanta', players=len(player_ids))
     receivers = player_ids[:]
-    random.shuffle(receivers)
+    rng.shuffle(receivers)
 
     # Prevent self-gifting
     for i in range(len(player_ids)):
@@ -2725,181 +3777,167 @@ async def execute_secret_santa_event(bot: Bot, context: ContextTypes.DEFAULT_TYP
             swap_idx = (i + 1) % len(player_ids)
             receivers[i], receivers[swap_idx] = receivers[swap_idx], receivers[i]
 
-    summary_messages = ["🎁 *Secret Santa Event!* 🎁\n\nGifts have been exchanged between players:"]
-    eligible_santa_cards = [cid for cid, c in POWER_CARDS.items() if c.get('tier') in [1, 2]]
-    swaps_record = []
-
-    for i, sender_id in enumerate(player_ids):
-        receiver_id = receivers[i]
-        sender_data = player_map[sender_id]
-        receiver_data = player_map[receiver_id]
+    event_id = new_event_id('secretsanta')
+    update_game_state({'last_secretsanta_event': event_id, 'last_secretsanta_seed': rng.event_seed})
+    pairs = [[sender_id, receiver_id] for sender_id, receiver_id in zip(player_ids, receivers)]
+    await start_admin_job(update, 'secretsanta', "Secret Santa", pairs, {'seed': rng.event_seed}, event_id=event_id)
+
+async def run_secret_santa_batch(bot: Bot, job, pairs: list):
+    """Exchanges the gifts of one batch of (sender, receiver) pairs with one batched read and one write."""
+    enter_job_scope(job)
+    already_sent = job_applied_ids(job, outgoing=True)
+    rng = RNG_SERVICE.replay('secretsanta', job.params['seed'] + job.cursor, players=len(pairs))
+    changes, dms, swaps_record = {}, [], []
+
+    def exchange(records):
+        players = {uid: p.to_dict() for uid, p in records.items()}
+        for sender_id, receiver_id in pairs:
+            sender_data, receiver_data = players.get(sender_id), players.get(receiver_id)
+            if sender_id in already_sent or not sender_data or not receiver_data:
+                job.add('skipped')
+                continue
 
-        sender_name = sender_data.get('first_name') or sender_data.get('username') or 'A player'
-        receiver_name = receiver_data.get('first_name') or receiver_data.get('username') or 'Another player'
-        
-        sender_cards = list(sender_data.get('cards', []))
-        receiver_cards = list(receiver_data.get('cards', []))
-        sender_status = parse_json_dict(sender_data.get('status', {}))
-        receiver_status = parse_json_dict(receiver_data.get('status', {}))
+            sender_name = sender_data.get('first_name') or sender_data.get('username') or 'A player'
+            receiver_name = receiver_data.get('first_name') or receiver_data.get('username') or 'Another player'
 
-        # Only gift cards that the receiver does not already possess
-        sendable_cards = [card for card in sender_cards if card in eligible_santa_cards and card not in receiver_cards]
+            sender_inv = CardInventory.from_cards(sender_data.get('cards', []))
+            receiver_inv = CardInventory.from_cards(receiver_data.get('cards', []))
+            sender_status = parse_json_dict(sender_data.get('status', {}))
+            receiver_status = parse_json_dict(receiver_data.get('status', {}))
 
-        try:
-            if sendable_cards:
-                card_to_send = random.choice(sendable_cards)
-                sender_cards.remove(card_to_send)
-                receiver_cards.append(card_to_send)
-
-                # Update card_costs tracking
-                receiver_card_costs = parse_json_dict(receiver_status.get('card_costs', {}))
-                receiver_card_costs[card_to_send] = 0
-                receiver_status['card_costs'] = receiver_card_costs
-
-                sender_card_costs = parse_json_dict(sender_status.get('card_costs', {}))
-                sender_card_costs.pop(card_to_send, None)
-                sender_status['card_costs'] = sender_card_costs
-
-                # Update local map state to prevent stale overwrites across the loop
-                sender_data['cards'] = sender_cards
-                sender_data['status'] = sender_status
-                receiver_data['cards'] = receiver_cards
-                receiver_data['status'] = receiver_status
-
-                update_player_data(sender_id, {'cards': sender_cards, 'status': sender_status})
-                update_player_data(receiver_id, {'cards': receiver_cards, 'status': receiver_status})
-                swaps_record.append({'sender_id': sender_id, 'receiver_id': receiver_id, 'type': 'card', 'val': card_to_send})
-
-                card_name = POWER_CARDS.get(card_to_send, {}).get('name', card_to_send)
-                summary_messages.append(f"🎁 {sender_name} gifted a {card_name} card to {receiver_name}!")
-
-                # Send DM to Receiver
-                try:
-                    await bot.send_message(
-                        chat_id=receiver_id,
-                        text=f"🎅 *Secret Santa Gift!* 🎅\n\nYou received a *{card_name}* card from {sender_name} (@{sender_data.get('username', 'user')})!"
-                    )
-                except Exception as e:
-                    logger.warning(f"Could not send Secret Santa DM to receiver {receiver_id}: {e}")
-
-                # Send DM to Sender
-                try:
-                    await bot.send_message(
-                        chat_id=sender_id,
-                        text=f"🎅 *Secret Santa Gift Sent!* 🎅\n\nYou gifted your *{card_name}* card to {receiver_name} (@{receiver_data.get('username', 'user')})!"
-                    )
-                except Exception as e:
-                    logger.warning(f"Could not send Secret Santa DM to sender {sender_id}: {e}")
+            # Only gift cards that the receiver does not already possess
+            sendable_cards = (sender_inv & TIER_1_2_POOL) - receiver_inv
 
-            else:
-                sender_coins = sender_data.get('coins', 0)
-                coins_to_send = min(50, sender_coins)
-                if coins_to_send > 0:
-                    receiver_coins = receiver_data.get('coins', 0)
-                    new_sender_coins = sender_coins - coins_to_send
-                    new_receiver_coins = receiver_coins + coins_to_send
-
-                    sender_data['coins'] = new_sender_coins
-                    receiver_data['coins'] = new_receiver_coins
-
-                    update_player_data(sender_id, {'coins': new_sender_coins})
-                    update_player_data(receiver_id, {'coins': new_receiver_coins})
-                    swaps_record.append({'sender_id': sender_id, 'receiver_id': receiver_id, 'type': 'coins', 'val': coins_to_send})
-                    summary_messages.append(f"💰 {sender_name} gifted {coins_to_send} PC to {receiver_name}!")
-
-                    # Send DM to Receiver
-                    try:
-                        await bot.send_message(
-                            chat_id=receiver_id,
-                            text=f"🎅 *Secret Santa Gift!* 🎅\n\nYou received *{coins_to_send} Power Coins* from {sender_name} (@{sender_data.get('username', 'user')})!"
-                        )
-                    except Exception as e:
-                        logger.warning(f"Could not send Secret Santa DM to receiver {receiver_id}: {e}")
-
-                    # Send DM to Sender
-                    try:
-                        await bot.send_message(
-                            chat_id=sender_id,
-                            text=f"🎅 *Secret Santa Gift Sent!* 🎅\n\nYou gifted *{coins_to_send} Power Coins* to {receiver_name} (@{receiver_data.get('username', 'user')})!"
-                        )
-                    except Exception as e:
-                        logger.warning(f"Could not send Secret Santa DM to sender {sender_id}: {e}")
+            try:
+                if sendable_cards:
+                    card_to_send = sendable_cards.choice(rng)
+                    sender_inv.discard(card_to_send)
+                    receiver_inv.add(card_to_send)
+
+                    # Update card_costs tracking
+                    receiver_card_costs = parse_json_dict(receiver_status.get('card_costs', {}))
+                    receiver_card_costs[card_to_send] = 0
+                    receiver_status['card_costs'] = receiver_card_costs
+
+                    sender_card_costs = parse_json_dict(sender_status.get('card_costs', {}))
+                    sender_card_costs.pop(card_to_send, None)
+                    sender_status['card_costs'] = sender_card_costs
+
+                    # Update local map state so later pairs in the batch see this gift
+                    sender_data['cards'] = sender_inv.to_list()
+                    sender_data['status'] = sender_status
+                    receiver_data['cards'] = receiver_inv.to_list()
+                    receiver_data['status'] = receiver_status
+                    changes.setdefault(sender_id, {}).update(cards=sender_data['cards'], status=sender_status)
+                    changes.setdefault(receiver_id, {}).update(cards=receiver_data['cards'], status=receiver_status)
+                    swaps_record.append({'sender_id': sender_id, 'receiver_id': receiver_id, 'type': 'card', 'val': card_to_send})
+
+                    card_name = POWER_CARDS.get(card_to_send, {}).get('name', card_to_send)
+                    job.note(f"🎁 {sender_name} gifted a {card_name} card to {receiver_name}!")
+                    job.add('cards')
+                    dms.append((receiver_id, f"🎅 *Secret Santa Gift!* 🎅\n\nYou received a *{card_name}* card from {sender_name} (@{sender_data.get('username', 'user')})!"))
+                    dms.append((sender_id, f"🎅 *Secret Santa Gift Sent!* 🎅\n\nYou gifted your *{card_name}* card to {receiver_name} (@{receiver_data.get('username', 'user')})!"))
 
                 else:
-                    summary_messages.append(f"💨 {sender_name} had no gifts/coins to give to {receiver_name}.")
-        except Exception as e:
-            logger.error(f"Error transferring Secret Santa gift ({sender_id} -> {receiver_id}): {e}")
-
-    update_game_state({'last_secretsanta_swaps': swaps_record})
-    await broadcast_event_message(bot, "\n".join(summary_messages), context, gif_url=EVENT_GIFS.get('secretsanta'))
-
-async def execute_gambit_event(bot: Bot, context: ContextTypes.DEFAULT_TYPE):
-    """Executes Gambit event: awards a random non-God card to every active registered player with DM notifications."""
-    all_players = get_all_players()
-    eligible_players = [p for p in all_players if not is_player_eliminated(p) and p.get('user_id') and str(p.get('user_id')) != '0']
-    msgc_flagged = [p for p in eligible_players if bool(p.get('msgc_registered', False))]
-    target_players = msgc_flagged if msgc_flagged else eligible_players
-
-    if not target_players:
+                    sender_coins = sender_data.get('coins', 0)
+                    coins_to_send = min(50, sender_coins)
+                    if coins_to_send > 0:
+                        sender_data['coins'] = sender_coins - coins_to_send
+                        receiver_data['coins'] = receiver_data.get('coins', 0) + coins_to_send
+                        changes.setdefault(sender_id, {})['coins'] = sender_data['coins']
+                        changes.setdefault(receiver_id, {})['coins'] = receiver_data['coins']
+                        swaps_record.append({'sender_id': sender_id, 'receiver_id': receiver_id, 'type': 'coins', 'val': coins_to_send})
+                        job.note(f"💰 {sender_name} gifted {coins_to_send} PC to {receiver_name}!")
+                        job.add('coins')
+                        dms.append((receiver_id, f"🎅 *Secret Santa Gift!* 🎅\n\nYou received *{coins_to_send} Power Coins* from {sender_name} (@{sender_data.get('username', 'user')})!"))
+                        dms.append((sender_id, f"🎅 *Secret Santa Gift Sent!* 🎅\n\nYou gifted *{coins_to_send} Power Coins* to {receiver_name} (@{receiver_data.get('username', 'user')})!"))
+                    else:
+                        job.note(f"💨 {sender_name} had no gifts/coins to give to {receiver_name}.")
+                        job.add('empty')
+            except Exception as e:
+                logger.error(f"Error transferring Secret Santa gift ({sender_id} -> {receiver_id}): {e}")
+        return changes
+
+    update_players({uid for pair in pairs for uid in pair}, exchange)
+    LEDGER.flush()
+    RNG_SERVICE.record(rng, swaps_record)
+    await notify_players(bot, dms, notifier=JOB_NOTIFIER)
+
+async def finish_secret_santa_job(bot: Bot, job):
+    enter_job_scope(job)
+    if job.cursor:
+        header = "🎁 *Secret Santa Event!* 🎁\n\nGifts have been exchanged between players:"
+        await broadcast_event_message(bot, job.summary(header), gif_url=EVENT_GIFS.get('secretsanta'), notifier=JOB_NOTIFIER)
+
+async def start_gambit_job(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Awards a random non-God card to every active registered player, as an admin job."""
+    player_ids = [p.get('user_id') for p in event_targets()]
+    if not player_ids:
         logger.info("Gambit cancelled: No active registered players found.")
-        await broadcast_event_message(bot, "🎲 *Gambit Cancelled:* No active registered players found.", context)
+        await broadcast_event_message(context.bot, "🎲 *Gambit Cancelled:* No active registered players found.", context)
         return
 
-    gambit_cards = [card_id for card_id in POWER_CARDS if card_id != 'god']
-    summary_messages = ["🎲 *Gambit Event!* 🎲\n\nEvery registered player receives a random card!"]
-    gambit_record = []
-
-    for player in target_players:
-        player_id = player.get('user_id')
-        if not player_id: continue
-        player_name = player.get('first_name') or player.get('username') or 'Player'
-        
-        # Refresh player state
-        fresh_data = get_player_data(player_id) or player
-        player_cards = list(fresh_data.get('cards', []))
-        player_status = parse_json_dict(fresh_data.get('status', {}))
-
-        try:
-            available_cards = [cid for cid in gambit_cards if cid not in player_cards]
-            if available_cards:
-                random_card = random.choice(available_cards)
-                card_name = POWER_CARDS.get(random_card, {}).get('name', random_card)
-                player_cards.append(random_card)
-
-                card_costs = parse_json_dict(player_status.get('card_costs', {}))
-                card_costs[random_card] = 0
-                player_status['card_costs'] = card_costs
+    rng = RNG_SERVICE.derive('gambit', players=len(player_ids))
+    event_id = new_event_id('gambit')
+    update_game_state({'last_gambit_event': event_id, 'last_gambit_seed': rng.event_seed})
+    await start_admin_job(update, 'gambit', "Gambit", player_ids, {'seed': rng.event_seed}, event_id=event_id)
+
+async def run_gambit_batch(bot: Bot, job, user_ids: list):
+    """Awards the Gambit cards of one batch of players with one batched read and one write."""
+    enter_job_scope(job)
+    already_awarded = job_applied_ids(job)
+    rng = RNG_SERVICE.replay('gambit', job.params['seed'] + job.cursor, players=len(user_ids))
+    changes, dms, gambit_record = {}, [], []
+
+    def draw(records):
+        # Records come back in the order Supabase returns them; sorting keeps the draws of a re-run batch identical.
+        for player in sorted(records.values(), key=lambda p: p.user_id):
+            player_id = player.user_id
+            if player_id in already_awarded:
+                job.add('skipped')
+                continue
+            player_data = player.to_dict()
+            player_name = player_data.get('first_name') or player_data.get('username') or 'Player'
+            player_inv = CardInventory.from_cards(player_data.get('cards', []))
+            player_status = parse_json_dict(player_data.get('status', {}))
 
-                update_player_data(player_id, {'cards': player_cards, 'status': player_status})
-                gambit_record.append({'user_id': player_id, 'card_id': random_card})
-                summary_messages.append(f"🎁 {player_name} received a {card_name} card!")
+            try:
+                available_cards = GAMBIT_POOL - player_inv
+                if available_cards:
+                    random_card = available_cards.choice(rng)
+                    card_name = POWER_CARDS.get(random_card, {}).get('name', random_card)
+                    player_inv.add(random_card)
+
+                    card_costs = parse_json_dict(player_status.get('card_costs', {}))
+                    card_costs[random_card] = 0
+                    player_status['card_costs'] = card_costs
+
+                    changes[player_id] = {'cards': player_inv.to_list(), 'status': player_status}
+                    gambit_record.append({'user_id': player_id, 'card_id': random_card})
+                    job.note(f"🎁 {player_name} received a {card_name} card!")
+                    job.add('cards')
+                    dms.append((player_id, f"🎲 *Gambit Event Award!* 🎲\n\nYou received a free *{card_name}* card from the Gambit event!"))
+                else:
+                    # If player already owns all cards, award bonus coins
+                    changes[player_id] = {'coins': player_data.get('coins', 0) + 50}
+                    job.note(f"⭐ {player_name} already owns all cards and received 50 PC instead!")
+                    job.add('coins')
+                    dms.append((player_id, "🎲 *Gambit Event Award!* 🎲\n\nYou already own all cards! You received *50 Power Coins* instead!"))
 
-                # Send DM to player
-                try:
-                    await bot.send_message(
-                        chat_id=player_id,
-                        text=f"🎲 *Gambit Event Award!* 🎲\n\nYou received a free *{card_name}* card from the Gambit event!"
-                    )
-                except Exception as e:
-                    logger.warning(f"Could not send Gambit DM to player {player_id}: {e}")
-            else:
-                # If player already owns all cards, award bonus coins
-                player_coins = fresh_data.get('coins', 0) + 50
-                update_player_data(player_id, {'coins': player_coins})
-                summary_messages.append(f"⭐ {player_name} already owns all cards and received 50 PC instead!")
-                try:
-                    await bot.send_message(
-                        chat_id=player_id,
-                        text="🎲 *Gambit Event Award!* 🎲\n\nYou already own all cards! You received *50 Power Coins* instead!"
-                    )
-                except Exception as e:
-                    logger.warning(f"Could not send Gambit DM to player {player_id}: {e}")
+            except Exception as e:
+                logger.error(f"Error awarding Gambit card to player {player_id}: {e}")
+        return changes
 
-        except Exception as e:
-            logger.error(f"Error awarding Gambit card to player {player_id}: {e}")
+    update_players(user_ids, draw)
+    LEDGER.flush()
+    RNG_SERVICE.record(rng, gambit_record)
+    await notify_players(bot, dms, notifier=JOB_NOTIFIER)
 
-    update_game_state({'last_gambit_awards': gambit_record})
-    await broadcast_event_message(bot, "\n".join(summary_messages), context, gif_url=EVENT_GIFS.get('gambit'))
+async def finish_gambit_job(bot: Bot, job):
+    enter_job_scope(job)
+    if job.cursor:
+        header = "🎲 *Gambit Event!* 🎲\n\nEvery registered player receives a random card!"
+        await broadcast_event_message(bot, job.summary(header), gif_url=EVENT_GIFS.get('gambit'), notifier=JOB_NOTIFIER)
 
 async def handle_group_message_and_coin_rush(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Tracks active group chat IDs and processes Coin Rush random coin drops."""
@@ -2912,16 +3950,60 @@ async def handle_group_message_and_coin_rush(update: Update, context: ContextTyp
         group_chats = context.bot_data.setdefault('group_chat_ids', set())
         group_chats.add(chat.id)
 
-    game_state = get_game_state()
-    if game_state.get('coin_rush_until', 0) > time.time():
-        if random.random() < 0.25:
-            drop = random.randint(2, 5)
+    # Ordinary chatter is the busiest update there is: outside a Coin Rush it costs no game-state read at all.
+    if event_active(COIN_RUSH, user.id):
+        rng = RNG_SERVICE.derive('coin_rush', user_id=user.id)
+        if rng.random() < 0.25:
+            drop = rng.randint(2, 5)
+            RNG_SERVICE.record(rng, drop)
             p_data = get_player_data(user.id)
             if p_data and not is_player_eliminated(p_data):
                 update_player_data(user.id, {'coins': p_data.get('coins', 0) + drop})
                 await safe_reply(update, f"💰 *Coin Rush Drop!* {user.first_name} received +{drop} Power Coins!")
 
 
+def persist_chat_membership(user_id: int):
+    """Writes a player's known group chats into their status so partitions survive restarts."""
+    record = get_player_record(user_id)
+    if not record:
+        return
+    chats = sorted(PARTITIONS.chat_ids_for(user_id))
+    if sorted(record.status.chats or []) != chats:
+        status = record.to_dict()['status']
+        status['chats'] = chats
+        update_player_data(user_id, {'status': status})
+
+async def track_chat_membership(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Runs first for every update: scopes it to its group chat and records who plays in which group."""
+    chat = update.effective_chat
+    if not chat or chat.type not in ['group', 'supergroup']:
+        set_current_chat(None)
+        return
+    set_current_chat(chat.id)
+    ensure_partitions_loaded()
+
+    user = update.effective_user
+    if user and not user.is_bot and PARTITIONS.join(chat.id, user.id):
+        persist_chat_membership(user.id)
+
+    msg = update.effective_message
+    left = msg.left_chat_member if msg else None
+    if left and not left.is_bot and PARTITIONS.leave(chat.id, left.id):
+        persist_chat_membership(left.id)
+
+def describe_update(update: Update) -> str:
+    """Short label for an update: the command, the button's callback data, or 'message'."""
+    msg = update.effective_message
+    if update.callback_query:
+        return update.callback_query.data or 'button'
+    if msg and msg.text and msg.text.startswith('/'):
+        return msg.text.split()[0].split('@')[0]
+    return 'message'
+
+async def tag_ledger_event(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Runs before every other handler so all ledger entries made while handling an update share its id."""
+    set_event(f"update:{update.update_id}", describe_update(update))
+
 async def global_error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Global error handler to handle errors gracefully and avoid raw Markdown entity parse crashes."""
     logger.error("Exception while handling an update:", exc_info=context.error)
@@ -2934,73 +4016,572 @@ async def global_error_handler(update: object, context: ContextTypes.DEFAULT_TYP
     if isinstance(update, Update):
         await safe_reply(update, f"❌ An error occurred: {err_str}")
 
+# --- ADMIN JOBS ---
+# Fleet-wide admin operations run as tracked jobs on the JOBS thread: the admin's update returns at once and one
+# message shows live progress with a Cancel button. Each batch of players is read and written in one round trip
+# each and journaled under the job's ledger event, so /revertevent still undoes a whole run.
+AWARDALL_GIF_URL = "https://media.giphy.com/media/v1.Y2lkPTc5MGI3NjExYnp4amQzMGRvcTk1YWRtNXk3d2NpeHd4eGxidGh5ZWltMnhldDdkMCZlcD12MV9naWZzX3NlYXJjaCZjdD1n/pwyW4XDmtqjG8/giphy.gif"
+# DMs sent by jobs are digested on the job thread's own loop, apart from the ones sent while handling updates.
+JOB_NOTIFIER = Notifier(NOTIFY_WINDOW, policy=PRESSURE)
+JOB_BOT = None
+
+def get_job_bot() -> Bot:
+    """The Bot the job thread talks to Telegram with; its HTTP client lives on that thread's event loop."""
+    global JOB_BOT, job_request_obj
+    if JOB_BOT is None:
+        job_request_obj = CountingRequest(connect_timeout=20.0, read_timeout=20.0, write_timeout=20.0, pool_timeout=20.0)
+        JOB_BOT = Bot(TELEGRAM_BOT_TOKEN, request=job_request_obj)
+    return JOB_BOT
+
+JOBS = JobRunner(
+    get_job_bot, JOB_CHECKPOINT_PATH, max_concurrency=JOB_CONCURRENCY, batch_size=JOB_BATCH_SIZE,
+    observe=lambda kind, seconds: FANOUT_SECONDS.observe(seconds, kind), drain=lambda: JOB_NOTIFIER.flush_all(),
+)
+
+def enter_job_scope(job):
+    """Scopes the rest of a job's task to the chat it was started from and files its changes under its ledger event."""
+    set_current_chat(job.params.get('chat'))
+    set_event(job.event_id, job.params.get('reason', job.kind))
+
+def job_applied_ids(job, outgoing: bool = False) -> set:
+    """Players already changed under the job's ledger event, looked up only for the batch a restart interrupted.
+    With `outgoing`, only the players who gave away coins or a card."""
+    if not job.recovering:
+        return set()
+    return {e.user_id for e in LEDGER.event_entries(job.event_id) if not outgoing or e.coins < 0 or e.card_delta < 0}
+
+async def start_admin_job(update: Update, kind: str, title: str, items: list, params: dict = None, event_id: str = None):
+    """Posts a job's progress message and starts it. Changes go under `event_id`, by default the admin's update."""
+    if not event_id:
+        event_id = current_event()[0]
+        if event_id == 'unscoped':
+            event_id = new_event_id(kind)
+    job = JOBS.create(kind, title, items, {'chat': current_chat(), **(params or {})}, event_id=event_id)
+    message = await safe_reply(update, JOBS.render(job), reply_markup=JOBS.markup(job))
+    JOBS.submit(job, *((message.chat_id, message.message_id) if message else (None, None)))
+    return job
+
+async def run_awardall_batch(bot: Bot, job, user_ids: list):
+    enter_job_scope(job)
+    amount = job.params['amount']
+    already_awarded = job_applied_ids(job)
+    awarded = []
+
+    def award(records):
+        awarded.extend(uid for uid in records if uid not in already_awarded)
+        return {uid: {'coins': records[uid].coins + amount} for uid in awarded}
+
+    job.add('awarded', update_players(user_ids, award))
+    LEDGER.flush()
+    for user_id in awarded:
+        try:
+            await JOB_NOTIFIER.notify(bot, user_id, f"🎁 You have received {amount} Power Coins from the Admin!", gif_url=AWARDALL_GIF_URL)
+        except Exception as e:
+            logger.warning(f"Could not send DM to user {user_id}: {e}")
+
+async def finish_awardall_job(bot: Bot, job):
+    outcome = "" if job.state == 'done' else f" (job {job.state} at {job.cursor}/{job.total})"
+    await log_activity(bot, f"👑 Admin awarded {job.params['amount']} PC to {job.counts.get('awarded', 0)} players{outcome}.")
+
+async def run_resetallcoins_batch(bot: Bot, job, user_ids: list):
+    enter_job_scope(job)
+    amount = job.params['amount']
+    job.add('reset', bulk_update_players({uid: {'coins': amount, 'cards': []} for uid in user_ids}))
+    LEDGER.flush()
+
+async def finish_resetallcoins_job(bot: Bot, job):
+    outcome = "" if job.state == 'done' else f" (job {job.state} at {job.cursor}/{job.total})"
+    await log_activity(bot, f"👑 Admin reset {job.cursor} players to {job.params['amount']} coins and 0 cards{outcome}.")
+
+async def run_revert_batch(bot: Bot, job, items: list):
+    """Applies one batch of an event's inverse ([user_id, {'coins', 'add', 'remove'}] items) and tells the players."""
+    enter_job_scope(job)
+    already_reverted = job_applied_ids(job)
+    inverse = {int(user_id): change for user_id, change in items if int(user_id) not in already_reverted}
+    if len(inverse) < len(items):
+        job.add('skipped', len(items) - len(inverse))
+    job.add('reverted', apply_revert(inverse))
+    LEDGER.flush()
+
+    label = job.params.get('label')
+    dms = []
+    for user_id, change in inverse.items():
+        parts = [f"{'+' if change['coins'] > 0 else ''}{change['coins']} PC"] if change['coins'] else []
+        parts += [f"-{POWER_CARDS.get(cid, {}).get('name', cid)}" for cid in change['remove']]
+        parts += [f"+{POWER_CARDS.get(cid, {}).get('name', cid)}" for cid in change['add']]
+        dms.append((user_id, f"↩️ *{label or 'Event'} Reverted!* ↩️\nAn Admin reverted this event. Your changes: {', '.join(parts)}"))
+    await notify_players(bot, dms, notifier=JOB_NOTIFIER)
+
+async def finish_revert_job(bot: Bot, job):
+    label = job.params.get('label')
+    if job.state == 'done' and label:
+        enter_job_scope(job)
+        update_game_state({f"last_{job.params['name']}_event": None})
+        await broadcast_event_message(bot, f"↩️ *{label.upper()} EVENT REVERTED!* ↩️\n\nAll cards and coins handed out during {label} have been returned.", notifier=JOB_NOTIFIER)
+
+JOBS.register('awardall', run_awardall_batch, finish_awardall_job)
+JOBS.register('resetallcoins', run_resetallcoins_batch, finish_resetallcoins_job)
+JOBS.register('gambit', run_gambit_batch, finish_gambit_job)
+JOBS.register('secretsanta', run_secret_santa_batch, finish_secret_santa_job)
+JOBS.register('revert', run_revert_batch, finish_revert_job)
+
+async def jobs_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Admin command to list recent admin jobs, or cancel or retry one."""
+    if not is_admin(update.effective_user.id):
+        await safe_reply(update, "You are not authorized to use this command.")
+        return
+
+    args = [a.lower() for a in context.args or []]
+    if args and args[0] in ('cancel', 'retry'):
+        if len(args) < 2:
+            await safe_reply(update, "Usage: /jobs [cancel|retry <job id>]")
+            return
+        if args[0] == 'cancel':
+            job = JOBS.cancel(args[1])
+            reply = f"🛑 Job {args[1]} will stop after its current batch." if job else f"❌ No queued or running job {args[1]}."
+        else:
+            job = JOBS.retry(args[1])
+            reply = f"🔁 Job {args[1]} resumed from {job.cursor:,}/{job.total:,}." if job else f"❌ No failed job {args[1]}."
+        await safe_reply(update, reply)
+        return
+
+    jobs = JOBS.recent()
+    if not jobs:
+        await safe_reply(update, "No admin jobs since the bot started.")
+        return
+    lines = ["🧰 Admin jobs (newest first):"]
+    lines += [f"{STATE_ICONS.get(job.state, '')} {job.job_id} {job.title}: {job.cursor:,}/{job.total:,} {job.state}" for job in jobs]
+    lines.append("\n/jobs cancel <id> stops a job after its current batch; /jobs retry <id> resumes a failed one.")
+    await safe_reply(update, "\n".join(lines))
+
+async def handle_job_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Cancel button on a job's progress message; the job itself edits the message when it stops."""
+    query = update.callback_query
+    if not is_admin(query.from_user.id):
+        await query.answer("Only admins can cancel jobs.", show_alert=True)
+        return
+    job = JOBS.cancel(query.data.rsplit(':', 1)[-1])
+    await query.answer("Stopping after the current batch…" if job else "This job is no longer running.")
+
+# --- EVENT SCHEDULE ---
+# Timed events keep a window (chat, start, end) in the game state's 'event_schedule' from the moment they are
+# scheduled or started until they end. The EVENT_CLOCK thread starts scheduled ones and sends end notices; both
+# run on the JOBS thread's loop.
+SCHEDULE_USAGE = (
+    "Usage: /scheduleevent <event> <HH:MM|+minutes>\n"
+    "       /scheduleevent cancel <id>\n"
+    f"Events: {', '.join(TIMED_EVENTS)}. Times are {EVENT_TIMEZONE}; a time that has passed today means tomorrow."
+)
+
+def save_event_schedule():
+    update_game_state({'event_schedule': EVENT_CLOCK.dump()})
+
+def fire_event_windows(starting: list, ending: list):
+    """EVENT_CLOCK callback, on the clock thread."""
+    JOBS.call(run_event_windows, starting, ending)
+
+async def run_event_windows(bot: Bot, starting: list, ending: list):
+    save_event_schedule()
+    for window in starting:
+        set_current_chat(window.chat_id)
+        try:
+            update_scoped_game_state({TIMED_EVENTS[window.name].key: window.end})
+            await broadcast_event_message(bot, EVENT_ANNOUNCEMENTS[window.name], gif_url=EVENT_GIFS.get(window.name), notifier=JOB_NOTIFIER)
+            logger.info(f"Scheduled {window.name} {window.window_id} started in {window.chat_id or 'every chat'}.")
+        except Exception as e:
+            logger.error(f"Could not start scheduled {window.name} {window.window_id}: {e}", exc_info=True)
+    for window in ending:
+        message = EVENT_END_ANNOUNCEMENTS.get(window.name)
+        if not message:
+            continue
+        set_current_chat(window.chat_id)
+        try:
+            await broadcast_event_message(bot, message, notifier=JOB_NOTIFIER)
+        except Exception as e:
+            logger.error(f"Could not announce the end of {window.name} {window.window_id}: {e}", exc_info=True)
+    await JOB_NOTIFIER.flush_all()
+
+def restore_event_schedule():
+    """Reloads the persisted schedule and starts the clock thread; windows that came due while the bot was down fire now."""
+    restored = EVENT_CLOCK.restore(get_game_state().get('event_schedule'))
+    EVENT_CLOCK.start(fire_event_windows)
+    if restored:
+        logger.info(f"Restored {restored} scheduled or running events.")
+
+def describe_window(window, now: float) -> str:
+    event = TIMED_EVENTS[window.name]
+    start = datetime.datetime.fromtimestamp(window.start, EVENT_TZ)
+    end = datetime.datetime.fromtimestamp(window.end, EVENT_TZ)
+    when = f"running until {end:%H:%M}" if window.started else f"{start:%a %H:%M}–{end:%H:%M} (in {format_duration(window.start - now)})"
+    where = "" if current_chat() is not None else f" in {'every chat' if window.chat_id is None else f'chat {window.chat_id}'}"
+    return f"{window.window_id} {event.label}: {when}{where}"
+
+async def scheduleevent_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Admin command to schedule a timed event for later, list the schedule, or cancel a scheduled event."""
+    if not is_admin(update.effective_user.id):
+        await safe_reply(update, "You are not authorized to use this command.")
+        return
+
+    args = [a.lower() for a in context.args or []]
+    now = time.time()
+    if not args:
+        windows = EVENT_CLOCK.upcoming(schedule_scope())
+        lines = (["🗓️ Scheduled events:"] + [describe_window(w, now) for w in windows]) if windows else ["No events scheduled."]
+        await safe_reply(update, "\n".join(lines + ["", SCHEDULE_USAGE]))
+        return
+
+    if args[0] == 'cancel':
+        window = EVENT_CLOCK.cancel(args[1], schedule_scope()) if len(args) > 1 else None
+        if window is None:
+            await safe_reply(update, f"❌ No scheduled event {args[1]}." if len(args) > 1 else SCHEDULE_USAGE)
+            return
+        if window.started:
+            # Already running: end it like /endevent would from where it was started.
+            set_current_chat(window.chat_id)
+            clear_event_timers([TIMED_EVENTS[window.name].key])
+        save_event_schedule()
+        await safe_reply(update, f"🗑️ {TIMED_EVENTS[window.name].label} {window.window_id} cancelled.")
+        return
+
+    event = TIMED_EVENTS.get(args[0])
+    if event is None or len(args) < 2:
+        await safe_reply(update, SCHEDULE_USAGE)
+        return
+    try:
+        start = parse_start(args[1], now, EVENT_TZ)
+    except ValueError:
+        await safe_reply(update, f"❌ '{args[1]}' is not a time. {SCHEDULE_USAGE}")
+        return
+    window = EVENT_CLOCK.schedule(event.name, current_chat(), start, start + event.duration)
+    save_event_schedule()
+    await safe_reply(update, f"🗓️ Scheduled: {describe_window(window, now)}")
+
 # --- APPLICATION SETUP ---
 
-request_obj = HTTPXRequest(
-    connect_timeout=20.0,
-    read_timeout=20.0,
-    write_timeout=20.0,
-    pool_timeout=20.0
+class CountingRequest(HTTPXRequest):
+    """HTTPXRequest that counts Bot API calls in flight (outbound-pressure gauge) and records their metrics."""
+
+    in_flight = 0
+
+    async def do_request(self, url, *args, **kwargs):
+        method = url.rsplit('/', 1)[-1]
+        CountingRequest.in_flight += 1
+        start = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, *args, **kwargs)
+        except Exception:
+            TELEGRAM_ERRORS.inc(method, 'network')
+            raise
+        finally:
+            CountingRequest.in_flight -= 1
+            elapsed = time.perf_counter() - start
+            TELEGRAM_SECONDS.observe(elapsed, method)
+            TRACER.observe_api(method, elapsed)
+        if code >= 400:
+            TELEGRAM_ERRORS.inc(method, str(code))
+            if code == 429:
+                try:
+                    TELEGRAM_RETRY_AFTER.inc(method, amount=json.loads(payload)['parameters']['retry_after'])
+                except Exception:
+                    pass
+        return code, payload
+
+FIRST_UPDATE_DONE = False
+
+# --- UPDATE DEDUPLICATION ---
+# Telegram redelivers a webhook update it got no timely answer for, and players double-tap buttons; either
+# would run a /use or a purchase twice. Both are dropped before any handler (or database read) runs.
+UPDATE_DEDUPER = UpdateDeduper(
+    UPDATE_DEDUPE_SIZE, UPDATE_DEDUPE_WINDOW, CALLBACK_DEBOUNCE,
+    store=SupabaseUpdateStore(lambda: db, UPDATE_DEDUPE_TABLE) if UPDATE_DEDUPE_TABLE else None,
 )
-application = Application.builder().token(TELEGRAM_BOT_TOKEN).request(request_obj).build()
-
-application.add_handler(CommandHandler("start", start_command))
-application.add_handler(CommandHandler("help", help_command))
-application.add_handler(CommandHandler("profile", profile_command))
-application.add_handler(CommandHandler("store", store_command))
-application.add_handler(CommandHandler("use", use_command))
-application.add_handler(CommandHandler("award", award_command))
-application.add_handler(CommandHandler("awardall", awardall_command))
-application.add_handler(CommandHandler("resetallcoins", resetallcoins_command))
-application.add_handler(CommandHandler("startevent", startevent_command))
-application.add_handler(CommandHandler("endevent", endevent_command))
-application.add_handler(CommandHandler("stopevent", endevent_command))
-application.add_handler(CommandHandler("endevents", endevent_command))
-application.add_handler(CommandHandler("revertevent", revertevent_command))
-application.add_handler(CommandHandler("revertgambit", lambda u, c: c.args.insert(0, 'gambit') or revertevent_command(u, c)))
-application.add_handler(CommandHandler("revertsecretsanta", lambda u, c: c.args.insert(0, 'secretsanta') or revertevent_command(u, c)))
-application.add_handler(CommandHandler("givecard", givecard_command))
-application.add_handler(CommandHandler("allplayers", all_players_command))
-application.add_handler(CommandHandler("players", all_players_command))
-application.add_handler(CommandHandler("disablecard", disablecard_command))
-application.add_handler(CommandHandler("enablecard", enablecard_command))
-application.add_handler(CommandHandler("disabledcards", disabledcards_command))
-application.add_handler(CommandHandler("eliminate", eliminate_command))
-application.add_handler(CommandHandler("uneliminate", uneliminate_command))
-application.add_handler(CommandHandler("closestore", closestore_command))
-application.add_handler(CommandHandler("close_store", closestore_command))
-application.add_handler(CommandHandler("lockstore", closestore_command))
-application.add_handler(CommandHandler("openstore", openstore_command))
-application.add_handler(CommandHandler("open_store", openstore_command))
-application.add_handler(CommandHandler("unlockstore", openstore_command))
-application.add_handler(CallbackQueryHandler(handle_inspect_callback, pattern="^inspect_"))
-application.add_handler(CallbackQueryHandler(handle_back_to_store_callback, pattern="^back_to_store$"))
-application.add_handler(CallbackQueryHandler(handle_buy_callback, pattern="^buy_"))
-application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_group_message_and_coin_rush))
-application.add_error_handler(global_error_handler)
-
-app = Flask(__name__)
-
-@app.route('/webhook', methods=['POST'])
-def webhook():
-    """Webhook endpoint to process updates."""
-    async def handle_update():
-        await application.initialize()
-        update = Update.de_json(request.get_json(force=True), application.bot)
-        await application.process_update(update)
+
+async def accept_update(update: Update) -> bool:
+    """Claims the update for processing. False for a redelivery or a repeated button tap."""
+    if not UPDATE_DEDUPER.claim(update.update_id):
+        logger.info(f"Dropping redelivered update {update.update_id}.")
+        return False
+    query = update.callback_query
+    if query is None:
+        return True
+    message = query.message
+    if UPDATE_DEDUPER.debounce(query.from_user.id, query.data, message.chat.id if message else None,
+                               message.message_id if message else query.inline_message_id):
+        return True
+    try:
+        # The first tap's handler answers with the outcome; this only stops the button's spinner.
+        await query.answer()
+    except Exception as e:
+        logger.debug(f"Could not answer debounced callback {query.id}: {e}")
+    return False
+
+class TracedApplication(Application):
+    """Application that drops duplicate updates and opens a round-trip trace around each one it processes."""
+
+    async def process_update(self, update: object) -> None:
+        if not isinstance(update, Update):
+            return await super().process_update(update)
+        if not await accept_update(update):
+            return
+        user, chat = update.effective_user, update.effective_chat
+        handle = TRACER.start(update.update_id, describe_update(update), user.id if user else None, chat.id if chat else None)
+        try:
+            await super().process_update(update)
+        finally:
+            TRACER.finish(handle)
+            global FIRST_UPDATE_DONE
+            if not FIRST_UPDATE_DONE:
+                FIRST_UPDATE_DONE = True
+                logger.info(f"First update handled {time.perf_counter() - IMPORT_STARTED:.2f}s after start.")
+
+def timed_handler(handler):
+    """Wraps a handler's callback so its latency and failures are recorded under the command or function name."""
+    callback = handler.callback
+    label = '/' + min(handler.commands) if isinstance(handler, CommandHandler) else getattr(callback, '__name__', type(handler).__name__)
+
+    async def timed(update, context):
+        with HANDLER_SECONDS.time(label):
+            try:
+                return await callback(update, context)
+            except Exception:
+                HANDLER_ERRORS.inc(label)
+                raise
+    return timed
+
+# --- APPLICATION ---
+# Built by get_application() on first use, so importing main (tooling, the simulator) opens no Bot API client.
+APPLICATION_LOCK = threading.Lock()
+
+def build_application() -> Application:
+    """Creates the Bot API client and the Application, and registers every handler."""
+    global request_obj
+    request_obj = CountingRequest(
+        connect_timeout=20.0,
+        read_timeout=20.0,
+        write_timeout=20.0,
+        pool_timeout=20.0
+    )
+    application = Application.builder().token(TELEGRAM_BOT_TOKEN).request(request_obj).application_class(TracedApplication).post_stop(drain_side_effects).build()
+    application.bot_data['group_chat_ids'] = GROUP_CHAT_IDS
+
+    application.add_handler(TypeHandler(Update, track_chat_membership), group=-2)
+    application.add_handler(TypeHandler(Update, tag_ledger_event), group=-1)
+    application.add_handler(CommandHandler("start", start_command))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("profile", profile_command))
+    application.add_handler(CommandHandler("store", store_command))
+    application.add_handler(CommandHandler("use", use_command))
+    application.add_handler(CommandHandler("leaderboard", leaderboard_command))
+    application.add_handler(CommandHandler("top", leaderboard_command))
+    application.add_handler(CommandHandler("history", history_command))
+    application.add_handler(CommandHandler("trace", trace_command))
+    application.add_handler(CommandHandler("profile_bot", profile_bot_command))
+    application.add_handler(CommandHandler("award", award_command))
+    application.add_handler(CommandHandler("awardall", awardall_command))
+    application.add_handler(CommandHandler("resetallcoins", resetallcoins_command))
+    application.add_handler(CommandHandler("startevent", startevent_command))
+    application.add_handler(CommandHandler("scheduleevent", scheduleevent_command))
+    application.add_handler(CommandHandler("endevent", endevent_command))
+    application.add_handler(CommandHandler("stopevent", endevent_command))
+    application.add_handler(CommandHandler("endevents", endevent_command))
+    application.add_handler(CommandHandler("revertevent", revertevent_command))
+    application.add_handler(CommandHandler("revertgambit", lambda u, c: c.args.insert(0, 'gambit') or revertevent_command(u, c)))
+    application.add_handler(CommandHandler("revertsecretsanta", lambda u, c: c.args.insert(0, 'secretsanta') or revertevent_command(u, c)))
+    application.add_handler(CommandHandler("givecard", givecard_command))
+    application.add_handler(CommandHandler("jobs", jobs_command))
+    application.add_handler(CommandHandler("payout", payout_command))
+    application.add_handler(CommandHandler("allplayers", all_players_command))
+    application.add_handler(CommandHandler("players", all_players_command))
+    application.add_handler(CommandHandler("disablecard", disablecard_command))
+    application.add_handler(CommandHandler("enablecard", enablecard_command))
+    application.add_handler(CommandHandler("disabledcards", disabledcards_command))
+    application.add_handler(CommandHandler("eliminate", eliminate_command))
+    application.add_handler(CommandHandler("uneliminate", uneliminate_command))
+    application.add_handler(CommandHandler("closestore", closestore_command))
+    application.add_handler(CommandHandler("close_store", closestore_command))
+    application.add_handler(CommandHandler("lockstore", closestore_command))
+    application.add_handler(CommandHandler("openstore", openstore_command))
+    application.add_handler(CommandHandler("open_store", openstore_command))
+    application.add_handler(CommandHandler("unlockstore", openstore_command))
+    application.add_handler(CallbackQueryHandler(handle_inspect_callback, pattern="^inspect_"))
+    application.add_handler(CallbackQueryHandler(handle_back_to_store_callback, pattern="^back_to_store$"))
+    application.add_handler(CallbackQueryHandler(handle_buy_callback, pattern="^buy_"))
+    application.add_handler(CallbackQueryHandler(handle_all_players_page_callback, pattern="^allp:"))
+    application.add_handler(CallbackQueryHandler(handle_job_callback, pattern="^job:cancel:"))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_group_message_and_coin_rush))
+    application.add_handler(MessageHandler(filters.Document.ALL & filters.ChatType.PRIVATE, handle_payout_document))
+    application.add_error_handler(global_error_handler)
+    for group_handlers in application.handlers.values():
+        for handler in group_handlers:
+            handler.callback = timed_handler(handler)
+    return application
+
+def get_application() -> Application:
+    global application
+    with APPLICATION_LOCK:
+        if 'application' not in globals():
+            application = build_application()
+    return application
+
+def __getattr__(name):
+    """Module attributes built on first access: `application`, `request_obj` and the Flask `app`."""
+    if name in ('application', 'request_obj'):
+        get_application()
+        return globals()[name]
+    if name == 'app':
+        return get_web_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+WEBHOOK_IN_FLIGHT = [0]
+WEBHOOK_LOCK = threading.Lock()
+PRESSURE.add_gauge('outbound', lambda: CountingRequest.in_flight + NOTIFIER.queued() + JOB_NOTIFIER.queued() + BACKGROUND.waiting)
+PRESSURE.add_gauge('pending_updates', lambda: (application.update_queue.qsize() if 'application' in globals() else 0) + WEBHOOK_IN_FLIGHT[0])
+
+METRICS.gauge('load_shedding_level', 'Current load-shedding level (0 = normal).', lambda: PRESSURE.level)
+METRICS.gauge('background_tasks', 'Background side-effect task counters.', lambda: {k: v for k, v in BACKGROUND.snapshot().items() if k != 'recent_errors'})
+METRICS.gauge('notifications', 'DM digest counters.', lambda: NOTIFIER.stats)
+METRICS.gauge('player_cache_size', 'Player records held in the cache.', lambda: len(PLAYER_CACHE))
+METRICS.gauge('player_status_bytes', 'Player status size in bytes over the players of the last compaction sweep.', STATUS_SWEEPER.size_summary, labelname='stat')
+METRICS.gauge('status_compaction', 'Status compaction sweep counters.', lambda: {k: v for k, v in STATUS_SWEEPER.stats.items() if isinstance(v, (int, float)) and not isinstance(v, bool)})
+METRICS.gauge('admin_jobs', 'Admin job counters.', lambda: {**JOBS.stats, 'active': len(JOBS.active())})
+METRICS.gauge('update_dedupe', 'Redelivered updates and repeated button taps dropped.', UPDATE_DEDUPER.snapshot)
+
+# --- WEB SERVER ---
+# Flask is only imported in webhook mode (or by tools that ask for `app`).
+WEB_APP = None
+# Webhook requests arrive on the web server's threads and all hand their update to this one long-lived loop,
+# where the Application is initialised once. Side effects spawned by a handler finish on it after the reply.
+WEBHOOK_LOOP = None
+WEBHOOK_LOOP_LOCK = threading.Lock()
+
+def get_webhook_loop() -> asyncio.AbstractEventLoop:
+    global WEBHOOK_LOOP
+    with WEBHOOK_LOOP_LOCK:
+        if WEBHOOK_LOOP is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='webhook', daemon=True).start()
+            asyncio.run_coroutine_threadsafe(get_application().initialize(), loop).result()
+            atexit.register(stop_webhook_loop)
+            WEBHOOK_LOOP = loop
+    return WEBHOOK_LOOP
+
+def stop_webhook_loop():
+    """Finishes pending side effects and shuts the Application down (at exit)."""
+    loop = WEBHOOK_LOOP
+    if loop is None or not loop.is_running():
+        return
+
+    async def shutdown():
+        await drain_side_effects()
         await application.shutdown()
 
-    asyncio.run(handle_update())
-    return 'ok'
+    try:
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result(BACKGROUND_DRAIN_SECONDS + 10)
+    except Exception as e:
+        logger.warning(f"Webhook loop shutdown failed: {e}")
+    loop.call_soon_threadsafe(loop.stop)
+
+def create_web_app():
+    """Builds the Flask app serving /webhook, /metrics and /health."""
+    from flask import Flask, request, jsonify, Response
+
+    app = Flask(__name__)
+
+    recorder = None
+    if UPDATE_RECORD_PATH:
+        from loadgen import UpdateRecorder
+        recorder = UpdateRecorder(UPDATE_RECORD_PATH, TELEGRAM_BOT_TOKEN or '', keep_ids=ADMIN_USER_IDS)
+
+    @app.route('/webhook', methods=['POST'])
+    def webhook():
+        """Webhook endpoint to process updates."""
+        data = request.get_json(force=True)
+        if UPDATE_DEDUPER.seen(data.get('update_id')):
+            # A redelivery of an update this process already took: answer at once so Telegram stops retrying.
+            return 'ok'
+        if recorder:
+            recorder.record(data)
+        application = get_application()
+
+        async def handle_update():
+            await application.process_update(Update.de_json(data, application.bot))
+
+        with WEBHOOK_LOCK:
+            WEBHOOK_IN_FLIGHT[0] += 1
+        try:
+            asyncio.run_coroutine_threadsafe(handle_update(), get_webhook_loop()).result()
+        finally:
+            with WEBHOOK_LOCK:
+                WEBHOOK_IN_FLIGHT[0] -= 1
+        return 'ok'
+
+    @app.route('/')
+    def index():
+        return 'Bot is running!'
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
+    @app.route('/health')
+    def health():
+        """Liveness plus the current load-shedding level and the background job counters."""
+        return jsonify({
+            'status': 'ok',
+            'load_shedding': PRESSURE.snapshot(),
+            'background': BACKGROUND.snapshot(),
+            'notifications': NOTIFIER.stats,
+            'snapshot': SNAPSHOT.stats if SNAPSHOT else None,
+            'status_compaction': STATUS_SWEEPER.snapshot(),
+            'jobs': JOBS.snapshot(),
+            'events': EVENT_CLOCK.snapshot(),
+            'dedupe': UPDATE_DEDUPER.snapshot(),
+        })
+
+    return app
+
+def get_web_app():
+    global WEB_APP
+    if WEB_APP is None:
+        WEB_APP = create_web_app()
+    return WEB_APP
+
+def warm_up(application: bool = True, reconcile: bool = False):
+    """Builds the Supabase client (and, for the webhook, the Application on its loop) off the main thread while
+    the bot connects or binds its port, then reconciles a restored snapshot with Supabase and re-arms the event schedule."""
+    try:
+        if db:
+            db.connect()
+        if application:
+            get_webhook_loop()
+        if reconcile and db:
+            reconcile_snapshot()
+    except Exception as e:
+        logger.warning(f"Warm-up failed, will retry on first use: {e}")
+    restore_event_schedule()
+
+def start_snapshots() -> bool:
+    """Restores the snapshot (if any) and starts the periodic writer plus a final write at exit."""
+    if not SNAPSHOT:
+        return False
+    restored = restore_snapshot()
+    SNAPSHOT.start(collect_snapshot, SNAPSHOT_INTERVAL)
+    atexit.register(SNAPSHOT.stop, collect_snapshot)
+    return restored
 
-@app.route('/')
-def index():
-    return 'Bot is running!'
+logger.info(f"main imported in {(time.perf_counter() - IMPORT_STARTED) * 1000:.0f} ms")
 
 if __name__ == "__main__":
-    mode = os.environ.get("RUN_MODE", "polling").lower()
-    if mode == "webhook":
-        app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8080)))
+    restored = start_snapshots()
+    if STATUS_SWEEP_INTERVAL > 0:
+        STATUS_SWEEPER.start(STATUS_SWEEP_INTERVAL)
+    JOBS.resume()
+    if RUN_MODE == "webhook":
+        # Exit cleanly on SIGTERM (what a platform restart sends) so the final snapshot is written.
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        threading.Thread(target=warm_up, args=(True, restored), name='warm-up', daemon=True).start()
+        get_web_app().run(host='0.0.0.0', port=int(os.environ.get('PORT', 8080)))
     else:
         logger.info("Starting bot in polling mode...")
-        application.run_polling()
\ No newline at end of file
+        threading.Thread(target=warm_up, args=(False, restored), name='warm-up', daemon=True).start()
+        get_application().run_polling()
@@ -0,0 +1,211 @@
+import copy
+import time
+
+
+class MemoryResponse:
+    """Mimics the `.data` attribute of a postgrest APIResponse."""
+
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+
+class MemoryQuery:
+    """Chained query builder supporting the subset of the Supabase table API used by the bot."""
+
+    def __init__(self, client: 'MemoryClient', name: str):
+        self.client = client
+        self.name = name
+        self.op = 'select'
+        self.payload = None
+        self.on_conflict = None
+        self.filters = []
+        self.equals = {}
+        self.row_limit = None
+        self.order_by = None
+
+    # --- builders ---
+    def select(self, *columns, **kwargs):
+        self.op = 'select'
+        return self
+
+    def update(self, payload: dict):
+        self.op = 'update'
+        self.payload = payload
+        return self
+
+    def upsert(self, payload, on_conflict: str = None, **kwargs):
+        self.op = 'upsert'
+        self.payload = payload
+        self.on_conflict = on_conflict
+        return self
+
+    def insert(self, payload, **kwargs):
+        self.op = 'insert'
+        self.payload = payload
+        return self
+
+    def delete(self):
+        self.op = 'delete'
+        return self
+
+    def eq(self, column: str, value):
+        self.equals.setdefault(column, str(value))
+        self.filters.append(lambda row: str(row.get(column)) == str(value))
+        return self
+
+    def neq(self, column: str, value):
+        self.filters.append(lambda row: str(row.get(column)) != str(value))
+        return self
+
+    def gt(self, column: str, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) > value)
+        return self
+
+    def gte(self, column: str, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) >= value)
+        return self
+
+    def lt(self, column: str, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) < value)
+        return self
+
+    def is_(self, column: str, value):
+        expected = None if value in (None, 'null') else value
+        self.filters.append(lambda row: row.get(column) is expected)
+        return self
+
+    def in_(self, column: str, values):
+        allowed = {str(v) for v in values}
+        self.filters.append(lambda row: str(row.get(column)) in allowed)
+        return self
+
+    def ilike(self, column: str, pattern: str):
+        pattern = str(pattern).lower()
+        if '%' in pattern:
+            parts = pattern.split('%')
+            def match(row):
+                val = str(row.get(column) or '').lower()
+                pos = 0
+                for i, part in enumerate(parts):
+                    found = val.find(part, pos)
+                    if found < 0 or (i == 0 and part and found != 0):
+                        return False
+                    pos = found + len(part)
+                return not parts[-1] or val.endswith(parts[-1])
+            self.filters.append(match)
+        else:
+            self.filters.append(lambda row: str(row.get(column) or '').lower() == pattern)
+        return self
+
+    def order(self, column: str, desc: bool = False):
+        self.order_by = (column, desc)
+        return self
+
+    def limit(self, count: int):
+        self.row_limit = count
+        return self
+
+    def range(self, start: int, end: int):
+        self.row_offset = start
+        self.row_limit = end - start + 1
+        return self
+
+    # --- execution ---
+    def _matches(self, row: dict) -> bool:
+        return all(f(row) for f in self.filters)
+
+    def execute(self) -> MemoryResponse:
+        return self.client._execute(self)
+
+
+class MemoryClient:
+    """In-memory stand-in for the Supabase client. Rows are deep-copied in and out, like a real round trip.
+
+    Equality lookups on a table's key column (see KEYS) are served from a hash index instead of a scan.
+    `latency` seconds are slept on every round trip to stand in for the network hop to Supabase.
+    """
+
+    KEYS = {'users': 'telegram_id', 'game_state': 'id'}
+
+    def __init__(self, latency: float = 0.0):
+        self.tables = {}
+        self.index = {}
+        self.calls = 0
+        self.latency = latency
+
+    def table(self, name: str) -> MemoryQuery:
+        return MemoryQuery(self, name)
+
+    def rows(self, name: str) -> list:
+        return self.tables.setdefault(name, [])
+
+    def _candidates(self, query: MemoryQuery) -> list:
+        key = self.KEYS.get(query.name)
+        if key and key in query.equals:
+            row = self.index.get(query.name, {}).get(query.equals[key])
+            return [row] if row is not None else []
+        return self.rows(query.name)
+
+    def _reindex(self, name: str, row: dict):
+        key = self.KEYS.get(name)
+        if key and row.get(key) is not None:
+            self.index.setdefault(name, {})[str(row[key])] = row
+
+    def _execute(self, query: MemoryQuery) -> MemoryResponse:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        rows = self.rows(query.name)
+
+        if query.op == 'select':
+            out = [row for row in self._candidates(query) if query._matches(row)]
+            if query.order_by:
+                column, desc = query.order_by
+                out.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+            offset = getattr(query, 'row_offset', 0)
+            if offset or query.row_limit is not None:
+                out = out[offset:offset + query.row_limit if query.row_limit is not None else None]
+            return MemoryResponse(copy.deepcopy(out))
+
+        if query.op == 'update':
+            out = []
+            for row in self._candidates(query):
+                if query._matches(row):
+                    row.update(copy.deepcopy(query.payload))
+                    self._reindex(query.name, row)
+                    out.append(row)
+            return MemoryResponse(copy.deepcopy(out))
+
+        if query.op == 'delete':
+            kept, removed = [], []
+            for row in rows:
+                (removed if query._matches(row) else kept).append(row)
+            rows[:] = kept
+            key = self.KEYS.get(query.name)
+            for row in removed:
+                if key:
+                    self.index.get(query.name, {}).pop(str(row.get(key)), None)
+            return MemoryResponse(removed)
+
+        payloads = query.payload if isinstance(query.payload, list) else [query.payload]
+        out = []
+        for payload in payloads:
+            payload = copy.deepcopy(payload)
+            existing = None
+            if query.op == 'upsert':
+                key = query.on_conflict or 'id'
+                if key in payload and key == self.KEYS.get(query.name):
+                    existing = self.index.get(query.name, {}).get(str(payload[key]))
+                elif key in payload:
+                    existing = next((row for row in rows if str(row.get(key)) == str(payload[key])), None)
+            if existing is not None:
+                existing.update(payload)
+                row = existing
+            else:
+                rows.append(payload)
+                row = payload
+            self._reindex(query.name, row)
+            out.append(row)
+        return MemoryResponse(copy.deepcopy(out))
@@ -0,0 +1,136 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from a cache hit to a slow Supabase or Bot API call.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names: tuple, values: tuple, extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+def _number(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label combination. inc() is a dict update, cheap enough for hot paths."""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.values = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels) -> float:
+        return self.values.get(labels, 0)
+
+    def total(self) -> float:
+        return sum(self.values.values())
+
+    def samples(self):
+        for labels, value in sorted(self.values.items()):
+            yield self.name, _labels(self.labelnames, labels), value
+
+
+class Gauge:
+    """Value read from a callback at scrape time, so nothing is recorded on the hot path."""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, read, labelname: str = 'name'):
+        self.name, self.help, self.read, self.labelname = name, help, read, labelname
+
+    def samples(self):
+        try:
+            value = self.read()
+        except Exception:
+            return
+        if isinstance(value, dict):
+            for key, v in sorted(value.items()):
+                yield self.name, _labels((self.labelname,), (key,)), v
+        else:
+            yield self.name, '', value
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram per label combination."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}
+
+    def observe(self, seconds: float, *labels):
+        series = self.series.get(labels)
+        if series is None:
+            # [bucket counts..., +Inf count, sum]
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, seconds)] += 1
+        series[-1] += seconds
+
+    def totals(self) -> dict:
+        """{labels: (count, sum)} for every label combination observed so far."""
+        return {labels: (sum(series[:-1]), series[-1]) for labels, series in self.series.items()}
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def samples(self):
+        for labels, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                yield f"{self.name}_bucket", _labels(self.labelnames, labels, f'le="{_number(bound)}"'), cumulative
+            yield f"{self.name}_count", _labels(self.labelnames, labels), cumulative
+            yield f"{self.name}_sum", _labels(self.labelnames, labels), series[-1]
+
+
+class MetricsRegistry:
+    """Holds the bot's metrics and renders them in the Prometheus text exposition format."""
+
+    def __init__(self, prefix: str = ''):
+        self.prefix = prefix
+        self.metrics = []
+
+    def _add(self, metric):
+        metric.name = self.prefix + metric.name
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        return self._add(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, read, labelname: str = 'name') -> Gauge:
+        """A gauge read at scrape time; `read` may return a number or a {label value: number} dict."""
+        return self._add(Gauge(name, help, read, labelname))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_number(value)}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,232 @@
+"""Schema normalisation for the `users` table.
+
+Older rows keep the telegram id in `Telegram_id` or `user_id` instead of `telegram_id`, store `status` as
+JSON text, a Python repr or a bare "eliminated"/"active", and `cards` or `coins` as strings. This rewrites
+every row into the canonical form of models.canonical_row, in two batched passes:
+
+1. keyed rows (telegram_id set) are read in telegram_id order, --batch-size at a time, and the rows that
+   are not canonical yet are rewritten with one upsert per batch;
+2. legacy rows (telegram_id empty) are moved onto telegram_id one update each. A legacy row whose id
+   already has a keyed row is a duplicate; it is reported and left alone for an admin to resolve.
+
+Progress is checkpointed after every batch, so an interrupted run resumes where it stopped; the
+checkpoint is removed when a run completes. Re-running on a migrated table reads every row once and
+writes nothing. Once a run reports nothing left to fix, set SCHEMA_NORMALISED=1 so the bot looks players
+up by telegram_id alone.
+
+Usage:
+    python migrate.py --dry-run            # count the rows that would change, write nothing
+    python migrate.py --batch-size 500     # migrate (resumes from migrate_checkpoint.json if present)
+    python migrate.py --restart            # ignore the checkpoint and start from the first row
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from models import canonical_row, is_canonical, LEGACY_ID_COLUMNS
+
+DEFAULT_CHECKPOINT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrate_checkpoint.json')
+STAT_KEYS = ('scanned', 'canonical', 'rewritten', 'skipped', 'conflicts', 'failed')
+# Conflicting rows listed in the final report; the rest are only counted.
+MAX_REPORTED_CONFLICTS = 50
+
+
+class Migration:
+    """One resumable run over the `users` table. `state` is what the checkpoint file holds."""
+
+    def __init__(self, db, batch_size: int = 500, checkpoint: str = None, dry_run: bool = False, progress=print):
+        self.db = db
+        self.batch_size = max(1, batch_size)
+        self.checkpoint = checkpoint
+        self.dry_run = dry_run
+        self.progress = progress
+        self.state = {'phase': 'keyed', 'after': None, 'stats': dict.fromkeys(STAT_KEYS, 0), 'conflicts': []}
+        self.started = time.perf_counter()
+
+    @property
+    def stats(self) -> dict:
+        return self.state['stats']
+
+    # --- CHECKPOINT ---
+    def resume(self) -> bool:
+        """Loads the checkpoint left by an interrupted run. True if there was one."""
+        if self.dry_run or not self.checkpoint or not os.path.exists(self.checkpoint):
+            return False
+        with open(self.checkpoint, encoding='utf-8') as f:
+            state = json.load(f)
+        state['stats'] = {**dict.fromkeys(STAT_KEYS, 0), **state.get('stats', {})}
+        state.setdefault('conflicts', [])
+        self.state = state
+        return True
+
+    def save(self):
+        if self.dry_run or not self.checkpoint:
+            return
+        tmp = f"{self.checkpoint}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.checkpoint)
+
+    def finish(self):
+        if not self.dry_run and self.checkpoint and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+
+    def conflict(self, row: dict, reason: str):
+        self.stats['conflicts'] += 1
+        if len(self.state['conflicts']) < MAX_REPORTED_CONFLICTS:
+            ids = {col: row.get(col) for col in ('telegram_id',) + LEGACY_ID_COLUMNS if row.get(col) is not None}
+            self.state['conflicts'].append({'ids': ids, 'reason': reason})
+
+    def report_progress(self):
+        s = self.stats
+        rate = s['scanned'] / max(time.perf_counter() - self.started, 1e-9)
+        verb = 'would rewrite' if self.dry_run else 'rewritten'
+        self.progress(f"[{self.state['phase']}] {s['scanned']:,} rows scanned, {s['rewritten']:,} {verb}, "
+                      f"{s['conflicts']:,} conflicts, {s['failed']:,} failed ({rate:,.0f} rows/s)")
+
+    # --- PASSES ---
+    def run(self) -> dict:
+        if self.state['phase'] == 'keyed':
+            self.migrate_keyed()
+            self.state.update(phase='legacy', after=None)
+            self.save()
+        if self.state['phase'] == 'legacy':
+            self.migrate_legacy()
+            self.state['phase'] = 'done'
+        self.finish()
+        return self.stats
+
+    def migrate_keyed(self):
+        """Pass 1: keyset pagination over telegram_id, one upsert per batch for the rows that changed."""
+        while True:
+            query = self.db.table('users').select('*').order('telegram_id').limit(self.batch_size)
+            if self.state['after'] is not None:
+                query = query.gt('telegram_id', self.state['after'])
+            rows = query.execute().data or []
+            keyed = [row for row in rows if row.get('telegram_id') is not None]
+            if not keyed:
+                break
+            self.rewrite_keyed(keyed)
+            self.state['after'] = str(keyed[-1]['telegram_id'])
+            self.save()
+            self.report_progress()
+            if len(rows) < self.batch_size:
+                break
+
+    def rewrite_keyed(self, rows: list):
+        pending = []
+        for row in rows:
+            self.stats['scanned'] += 1
+            canonical = canonical_row(row)
+            if canonical is None or canonical['telegram_id'] == '0':
+                # No usable id, or the GLOBAL_SYSTEM_STATE row, whose status is the game state, not a player's.
+                self.stats['skipped'] += 1
+            elif canonical['telegram_id'] != str(row['telegram_id']):
+                self.conflict(row, f"telegram_id {row['telegram_id']} disagrees with legacy id {canonical['telegram_id']}")
+            elif is_canonical(row, canonical):
+                self.stats['canonical'] += 1
+            else:
+                pending.append(canonical)
+        if not pending:
+            return
+        if self.dry_run:
+            self.stats['rewritten'] += len(pending)
+            return
+        try:
+            self.db.table('users').upsert(pending, on_conflict='telegram_id').execute()
+            self.stats['rewritten'] += len(pending)
+        except Exception as e:
+            logging.warning(f"Batch upsert failed, rewriting rows one by one: {e}")
+            for canonical in pending:
+                try:
+                    self.db.table('users').update(canonical).eq('telegram_id', canonical['telegram_id']).execute()
+                    self.stats['rewritten'] += 1
+                except Exception as e2:
+                    self.stats['failed'] += 1
+                    logging.error(f"Could not rewrite player {canonical['telegram_id']}: {e2}")
+
+    def migrate_legacy(self):
+        """Pass 2: rows with no telegram_id. Each fixed row leaves the set, so a rerun picks up the rest."""
+        rows = self.db.table('users').select('*').is_('telegram_id', 'null').execute().data or []
+        for start in range(0, len(rows), self.batch_size):
+            batch = [(row, canonical_row(row)) for row in rows[start:start + self.batch_size]]
+            ids = [canonical['telegram_id'] for _, canonical in batch if canonical]
+            taken = set()
+            if ids:
+                existing = self.db.table('users').select('telegram_id').in_('telegram_id', ids).execute().data or []
+                taken = {str(row['telegram_id']) for row in existing}
+            for row, canonical in batch:
+                self.stats['scanned'] += 1
+                if canonical is None:
+                    self.stats['skipped'] += 1
+                    continue
+                if canonical['telegram_id'] in taken:
+                    self.conflict(row, f"duplicate of the row with telegram_id {canonical['telegram_id']}")
+                    continue
+                if self.dry_run:
+                    self.stats['rewritten'] += 1
+                    continue
+                # The row is matched on the legacy column its id was read from (see extract_telegram_id).
+                column = next((col for col in LEGACY_ID_COLUMNS if row.get(col) is not None and str(row[col]).strip() == canonical['telegram_id']), None)
+                if column is None:
+                    self.stats['skipped'] += 1
+                    continue
+                try:
+                    self.db.table('users').update(canonical).eq(column, row[column]).execute()
+                    self.stats['rewritten'] += 1
+                    taken.add(canonical['telegram_id'])
+                except Exception as e:
+                    self.stats['failed'] += 1
+                    logging.error(f"Could not move legacy row {column}={row[column]} onto telegram_id: {e}")
+            self.save()
+            self.report_progress()
+
+
+def format_report(migration: Migration) -> str:
+    s = migration.stats
+    verb = 'Would rewrite' if migration.dry_run else 'Rewrote'
+    lines = [
+        f"Scanned {s['scanned']:,} rows in {time.perf_counter() - migration.started:.1f}s.",
+        f"{verb} {s['rewritten']:,}; {s['canonical']:,} already canonical; {s['skipped']:,} skipped "
+        f"(system row or no usable id); {s['conflicts']:,} conflicts; {s['failed']:,} failed.",
+    ]
+    for entry in migration.state['conflicts']:
+        lines.append(f"  conflict {entry['ids']}: {entry['reason']}")
+    if s['conflicts'] > len(migration.state['conflicts']):
+        lines.append(f"  ... and {s['conflicts'] - len(migration.state['conflicts'])} more")
+    if not migration.dry_run and not s['conflicts'] and not s['failed']:
+        lines.append("Every player row is canonical. Set SCHEMA_NORMALISED=1 to drop the legacy lookups.")
+    return "\n".join(lines)
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Rewrite legacy `users` rows into the canonical schema.")
+    parser.add_argument('--batch-size', type=int, default=500, help="rows read and written per round trip")
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help="progress file used to resume an interrupted run")
+    parser.add_argument('--restart', action='store_true', help="ignore an existing checkpoint")
+    parser.add_argument('--dry-run', action='store_true', help="count the rows that would change without writing")
+    args = parser.parse_args(argv)
+
+    import main
+    if not main.db:
+        print("SUPABASE_URL and SUPABASE_KEY must be configured.", file=sys.stderr)
+        return 2
+
+    migration = Migration(main.db, args.batch_size, args.checkpoint, args.dry_run)
+    if not args.restart and migration.resume():
+        print(f"Resuming {migration.state['phase']} pass after {migration.stats['scanned']:,} rows.")
+    try:
+        migration.run()
+    except KeyboardInterrupt:
+        migration.save()
+        print("\nInterrupted; run again to resume.", file=sys.stderr)
+        return 130
+    print(format_report(migration))
+    return 1 if migration.stats['conflicts'] or migration.stats['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,332 @@
+import ast
+import copy
+import json
+import time
+from dataclasses import dataclass, field, fields
+from typing import Optional
+
+from inventory import CardInventory
+
+
+# --- ROW DECODING HELPERS ---
+
+def parse_json_dict(val) -> dict:
+    if isinstance(val, dict):
+        return val
+    if isinstance(val, str) and val.strip():
+        try:
+            res = json.loads(val)
+            if isinstance(res, dict): return res
+        except Exception:
+            try:
+                res = ast.literal_eval(val)
+                if isinstance(res, dict): return res
+            except Exception:
+                pass
+        if val.strip().lower() == 'eliminated':
+            return {'eliminated': True, 'state': 'eliminated'}
+        if val.strip().lower() == 'active':
+            return {'eliminated': False, 'state': 'active'}
+    return {}
+
+def parse_json_list(val) -> list:
+    if isinstance(val, list):
+        return val
+    if isinstance(val, str) and val.strip():
+        try:
+            res = json.loads(val)
+            if isinstance(res, list): return res
+        except Exception:
+            try:
+                res = ast.literal_eval(val)
+                if isinstance(res, list): return res
+            except Exception:
+                pass
+    return []
+
+def extract_telegram_id(data: dict):
+    if not isinstance(data, dict): return None
+    for key in ['Telegram_id', 'telegram_id', 'user_id', 'id', 'Telegram_Id']:
+        if key in data and data[key] is not None:
+            return data[key]
+    return None
+
+def decode_cards(data: dict) -> CardInventory:
+    """Decodes a row's inventory, preferring the legacy `cards` list and falling back to `cards_mask`."""
+    if data.get('cards') is None and data.get('cards_mask') is not None:
+        try:
+            return CardInventory(int(data['cards_mask']))
+        except (ValueError, TypeError):
+            return CardInventory()
+    return CardInventory.from_cards(parse_json_list(data.get('cards')))
+
+def _as_number(val):
+    if isinstance(val, (int, float)) and not isinstance(val, bool):
+        return val
+    try:
+        return float(val)
+    except (ValueError, TypeError):
+        return 0
+
+
+# --- PLAYER RECORDS ---
+
+# Rolling windows (repeat-attack surcharge, daily loss cap, Angel limit) only look this far back.
+STATUS_WINDOW_SECONDS = 86400
+
+@dataclass(slots=True)
+class PlayerStatus:
+    """Typed view of a player's `status` JSON blob. Unknown keys are kept in `extra` and written back untouched."""
+    protected: bool = False
+    trap_active: bool = False
+    karma_active_until: float = 0
+    ricochet_active_until: float = 0
+    blackout_until: float = 0
+    mirage_until: float = 0
+    black_market_until: float = 0
+    shackled_until: float = 0
+    speed_active_until: float = 0
+    inflation_immunity_until: float = 0
+    attack_grace_until: float = 0
+    last_card_use_time: float = 0
+    frenzy_active: int = 0
+    attacks_landed: int = 0
+    no_cooldown: bool = False
+    eliminated: bool = False
+    state: str = ''
+    card_costs: Optional[dict] = None
+    repeat_attacks: Optional[dict] = None
+    daily_loss_history: Optional[list] = None
+    angel_uses_24h: Optional[list] = None
+    chats: Optional[list] = None
+    extra: Optional[dict] = None
+
+    @classmethod
+    def decode(cls, raw) -> 'PlayerStatus':
+        """Decodes a status value in any legacy form (dict, JSON, Python repr or bare state word)."""
+        data = parse_json_dict(raw)
+        status = cls()
+        for key, val in data.items():
+            kind = _STATUS_KINDS.get(key)
+            if kind is None:
+                if status.extra is None:
+                    status.extra = {}
+                status.extra[key] = copy.deepcopy(val)
+            elif kind is bool:
+                setattr(status, key, bool(val))
+            elif kind is str:
+                setattr(status, key, str(val or ''))
+            elif kind in (dict, list):
+                setattr(status, key, copy.deepcopy(val) if isinstance(val, kind) else None)
+            elif kind is int:
+                setattr(status, key, int(_as_number(val)))
+            else:
+                setattr(status, key, _as_number(val))
+        return status
+
+    def encode(self) -> dict:
+        """Encodes the status back into a JSON-safe dict, omitting fields still at their defaults."""
+        out = {}
+        for key, default in _STATUS_DEFAULTS.items():
+            val = getattr(self, key)
+            if val != default:
+                out[key] = copy.deepcopy(val) if isinstance(val, (dict, list)) else val
+        for key, val in (self.extra or {}).items():
+            out.setdefault(key, copy.deepcopy(val))
+        return out
+
+    @property
+    def is_eliminated(self) -> bool:
+        return bool(self.eliminated or (self.extra or {}).get('is_eliminated') or self.state.lower() == 'eliminated')
+
+    def compact(self, cards: CardInventory, now: float) -> bool:
+        """Drops entries no rule can read any more. Returns True if anything was removed.
+
+        Expired `*_until` timers go back to 0 (every check is `until > now`); `repeat_attacks`, `daily_loss_history`
+        and `angel_uses_24h` entries outside their 24-hour window are dropped; `card_costs` keeps held cards only.
+        """
+        before = self.encode()
+        for key in _UNTIL_FIELDS:
+            if 0 < getattr(self, key) <= now:
+                setattr(self, key, 0)
+        if self.extra:
+            expired = [k for k, v in self.extra.items() if k.endswith('_until') and isinstance(v, (int, float)) and not isinstance(v, bool) and v <= now]
+            for key in expired:
+                del self.extra[key]
+            self.extra = self.extra or None
+        if self.repeat_attacks:
+            self.repeat_attacks = {k: v for k, v in self.repeat_attacks.items()
+                                   if isinstance(v, dict) and now - _as_number(v.get('last_time', 0)) <= STATUS_WINDOW_SECONDS} or None
+        if self.daily_loss_history:
+            self.daily_loss_history = [e for e in self.daily_loss_history
+                                       if isinstance(e, dict) and now - _as_number(e.get('time', 0)) < STATUS_WINDOW_SECONDS] or None
+        if self.angel_uses_24h:
+            self.angel_uses_24h = [e for e in self.angel_uses_24h
+                                   if now - _as_number(e.get('timestamp', 0) if isinstance(e, dict) else e) < STATUS_WINDOW_SECONDS] or None
+        if self.card_costs:
+            self.card_costs = {k: v for k, v in self.card_costs.items() if k in cards} or None
+        return self.encode() != before
+
+_STATUS_DEFAULTS = {f.name: getattr(PlayerStatus(), f.name) for f in fields(PlayerStatus) if f.name != 'extra'}
+_UNTIL_FIELDS = tuple(name for name in _STATUS_DEFAULTS if name.endswith('_until'))
+# Declared type of each field, so counters such as frenzy_active stay ints after a decode.
+_STATUS_KINDS = {f.name: f.type for f in fields(PlayerStatus) if f.name != 'extra'}
+_STATUS_KINDS.update(card_costs=dict, repeat_attacks=dict, daily_loss_history=list, angel_uses_24h=list, chats=list)
+
+PLAYER_COLUMNS = ('username', 'first_name', 'in_game_name', 'coins', 'cards', 'status', 'msgc_registered')
+_COLUMN_BITS = {col: 1 << i for i, col in enumerate(PLAYER_COLUMNS)}
+
+
+@dataclass(slots=True)
+class Player:
+    """A decoded `users` row. Assigning a column attribute marks it dirty so writes only send changed columns."""
+    user_id: int
+    username: Optional[str] = None
+    first_name: Optional[str] = None
+    in_game_name: Optional[str] = None
+    coins: int = 0
+    cards: CardInventory = field(default_factory=CardInventory)
+    status: PlayerStatus = field(default_factory=PlayerStatus)
+    msgc_registered: bool = False
+    eliminated_column: bool = False
+    loaded_at: float = field(default=0, compare=False)
+    _dirty: int = field(default=0, repr=False, compare=False)
+
+    def __setattr__(self, name, value):
+        bit = _COLUMN_BITS.get(name)
+        if bit:
+            try:
+                object.__setattr__(self, '_dirty', self._dirty | bit)
+            except AttributeError:
+                pass
+        object.__setattr__(self, name, value)
+
+    @classmethod
+    def from_row(cls, row: dict, fallback_id=None) -> 'Player':
+        """The single decode path for a raw Supabase `users` row."""
+        tid = extract_telegram_id(row)
+        if tid is None:
+            tid = fallback_id
+        try:
+            user_id = int(tid)
+        except (ValueError, TypeError):
+            user_id = tid
+        player = cls(
+            user_id=user_id,
+            username=row.get('username'),
+            first_name=row.get('first_name'),
+            in_game_name=row.get('in_game_name'),
+            coins=int(_as_number(row.get('coins', 0) or 0)),
+            cards=row['cards'] if isinstance(row.get('cards'), CardInventory) else decode_cards(row),
+            status=row['status'] if isinstance(row.get('status'), PlayerStatus) else PlayerStatus.decode(row.get('status')),
+            msgc_registered=bool(row.get('msgc_registered', False)),
+            eliminated_column=bool(row.get('eliminated') or row.get('is_eliminated')),
+            loaded_at=time.time(),
+        )
+        player.mark_clean()
+        return player
+
+    def to_row(self) -> dict:
+        """The single encode path: full column payload for an upsert."""
+        return {
+            'telegram_id': str(self.user_id),
+            'username': self.username,
+            'first_name': self.first_name,
+            'in_game_name': self.in_game_name,
+            'coins': self.coins,
+            'cards': self.cards.to_list(),
+            'status': self.status.encode(),
+            'msgc_registered': self.msgc_registered,
+        }
+
+    def to_dict(self) -> dict:
+        """Legacy dict view for handlers that still work on plain player dicts. Safe to mutate."""
+        data = self.to_row()
+        data['user_id'] = self.user_id
+        if self.eliminated_column:
+            data['eliminated'] = True
+        return data
+
+    def apply(self, updates: dict) -> dict:
+        """Applies a legacy column update dict, marking only values that really changed as dirty.
+
+        Returns any keys that are not player columns so the caller can still send them through.
+        """
+        passthrough = {}
+        for key, val in updates.items():
+            if key == 'user_id':
+                continue
+            if key == 'cards':
+                val = val if isinstance(val, CardInventory) else CardInventory.from_cards(parse_json_list(val))
+            elif key == 'status':
+                val = val if isinstance(val, PlayerStatus) else PlayerStatus.decode(val)
+            elif key == 'coins':
+                val = int(_as_number(val or 0))
+            elif key not in PLAYER_COLUMNS:
+                passthrough[key] = val
+                continue
+            if getattr(self, key) != val:
+                setattr(self, key, val)
+        return passthrough
+
+    def touch(self, *columns):
+        """Marks columns dirty after in-place changes to `cards` or `status`."""
+        for col in columns:
+            object.__setattr__(self, '_dirty', self._dirty | _COLUMN_BITS[col])
+
+    @property
+    def dirty_fields(self) -> frozenset:
+        return frozenset(col for col, bit in _COLUMN_BITS.items() if self._dirty & bit)
+
+    def dirty_payload(self) -> dict:
+        """Encoded values of the changed columns only."""
+        if not self._dirty:
+            return {}
+        row = self.to_row()
+        return {col: row[col] for col in self.dirty_fields}
+
+    def mark_clean(self):
+        object.__setattr__(self, '_dirty', 0)
+
+    @property
+    def is_eliminated(self) -> bool:
+        return self.eliminated_column or self.status.is_eliminated
+
+    @property
+    def display_name(self) -> str:
+        return self.first_name or self.username or 'A player'
+
+
+# --- CANONICAL ROWS ---
+# Columns older rows may hold the telegram id in, and legacy elimination flags, as read by Player.from_row.
+LEGACY_ID_COLUMNS = ('Telegram_id', 'user_id', 'Telegram_Id')
+ELIMINATED_COLUMNS = ('eliminated', 'is_eliminated')
+
+def canonical_row(row: dict) -> dict:
+    """The canonical form of a raw `users` row, or None if the row has no usable telegram id.
+
+    The id lives in `telegram_id` only (legacy id columns present in the row are cleared), `status` and
+    `cards` are native JSON, coins are an int and elimination is explicit in the status and in any
+    elimination column the row has. Every column of the row that the bot decodes is included, so rows
+    from the same table always produce the same keys.
+    """
+    player = Player.from_row(row)
+    if not isinstance(player.user_id, int):
+        return None
+    out = {col: val for col, val in player.to_row().items() if col in row or col == 'telegram_id'}
+    eliminated = player.is_eliminated
+    if eliminated and 'status' in out:
+        out['status']['eliminated'] = True
+    for col in LEGACY_ID_COLUMNS:
+        if col in row:
+            out[col] = None
+    for col in ELIMINATED_COLUMNS:
+        if col in row:
+            out[col] = eliminated
+    if 'cards_mask' in row:
+        out['cards_mask'] = player.cards.mask
+    return out
+
+def is_canonical(row: dict, canonical: dict) -> bool:
+    """True if the row already holds its canonical values (a numeric `telegram_id` column counts as canonical)."""
+    return all((str(row.get(col)) if col == 'telegram_id' else row.get(col)) == val for col, val in canonical.items())
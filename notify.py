@@ -0,0 +1,97 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Notifier:
+    """Coalesces the DMs sent to each player into one digest message per short window.
+
+    A notification waits up to `window` seconds for others to the same player; they are then delivered
+    together. A priority notification (the player was attacked, or asked for something) flushes the
+    player's pending ones immediately, in the same message. A lone notification is sent unchanged,
+    with its GIF; digests are plain text.
+
+    An optional `policy` (see pressure.PressureMonitor) can drop non-priority DMs and GIFs under load.
+    """
+
+    MAX_LENGTH = 4000
+    SEPARATOR = "\n\n— — —\n\n"
+
+    def __init__(self, window: float = 2.0, policy=None):
+        self.window = window
+        self.policy = policy
+        self.pending = {}
+        self.bots = {}
+        self.timers = {}
+        self.stats = {'queued': 0, 'messages': 0, 'failed': 0, 'dropped': 0}
+
+    def queued(self) -> int:
+        return sum(len(items) for items in self.pending.values())
+
+    async def notify(self, bot, chat_id: int, text: str, gif_url: str = None, priority: bool = False):
+        """Queues a DM. Priority DMs are delivered before returning and raise if sending fails."""
+        if self.policy is not None and not self.policy.allows_dm(priority):
+            self.stats['dropped'] += 1
+            return
+        self.pending.setdefault(chat_id, []).append((text, gif_url))
+        self.bots[chat_id] = bot
+        self.stats['queued'] += 1
+        if priority or self.window <= 0:
+            await self.flush(chat_id, raise_errors=priority)
+        elif chat_id not in self.timers:
+            self.timers[chat_id] = asyncio.get_running_loop().create_task(self._flush_later(chat_id))
+
+    async def _flush_later(self, chat_id: int):
+        await asyncio.sleep(self.window)
+        self.timers.pop(chat_id, None)
+        await self.flush(chat_id)
+
+    async def flush(self, chat_id: int, raise_errors: bool = False):
+        timer = self.timers.pop(chat_id, None)
+        if timer is not None and timer is not asyncio.current_task():
+            timer.cancel()
+        items = self.pending.pop(chat_id, None)
+        bot = self.bots.pop(chat_id, None)
+        if not items:
+            return
+        try:
+            await self._deliver(bot, chat_id, items)
+        except Exception as e:
+            self.stats['failed'] += 1
+            if raise_errors:
+                raise
+            logger.warning(f"Could not send notification digest to {chat_id}: {e}")
+
+    async def flush_all(self):
+        """Delivers everything still pending (end of a webhook request, shutdown)."""
+        for chat_id in list(self.pending):
+            await self.flush(chat_id)
+
+    async def _deliver(self, bot, chat_id: int, items: list):
+        if len(items) == 1:
+            text, gif_url = items[0]
+            self.stats['messages'] += 1
+            if gif_url and (self.policy is None or self.policy.allows_gifs()):
+                try:
+                    return await bot.send_animation(chat_id=chat_id, animation=gif_url, caption=text)
+                except Exception:
+                    pass
+            return await bot.send_message(chat_id=chat_id, text=text)
+
+        for chunk in self._chunks(f"🔔 {len(items)} new notifications", [text for text, _ in items]):
+            self.stats['messages'] += 1
+            await bot.send_message(chat_id=chat_id, text=chunk)
+
+    def _chunks(self, header: str, texts: list) -> list:
+        """Joins texts under the header, splitting into messages that fit Telegram's length limit."""
+        chunks, current = [], header
+        continued = header + " (cont.)"
+        for text in texts:
+            text = text[:self.MAX_LENGTH - len(continued) - len(self.SEPARATOR)]
+            if len(current) + len(self.SEPARATOR) + len(text) > self.MAX_LENGTH:
+                chunks.append(current)
+                current = continued
+            current += self.SEPARATOR + text
+        chunks.append(current)
+        return chunks
@@ -0,0 +1,129 @@
+from contextvars import ContextVar
+
+# Group chat the running update belongs to (None for private chats and background jobs).
+_CURRENT_CHAT = ContextVar('current_chat', default=None)
+
+# Game-state keys that belong to a single group chat; everything else in the game state stays global.
+PARTITION_STATE_KEYS = frozenset({
+    'inflation_until', 'inflation_user_id', 'truce_until', 'rush_hour_until',
+    'coin_rush_until', 'bogo_active_until', 'freebie_frenzy_until',
+})
+EVENT_TIMER_KEYS = ('bogo_active_until', 'rush_hour_until', 'truce_until', 'coin_rush_until', 'freebie_frenzy_until')
+
+
+def current_chat():
+    return _CURRENT_CHAT.get()
+
+def set_current_chat(chat_id):
+    """Scopes the rest of this context to a group chat (or to no chat with None). Returns a reset token."""
+    return _CURRENT_CHAT.set(int(chat_id) if chat_id is not None else None)
+
+
+class ChatPartition:
+    """One group chat's slice of the game: its member ids and its own event timers."""
+
+    __slots__ = ('chat_id', 'members', 'state')
+
+    def __init__(self, chat_id: int):
+        self.chat_id = chat_id
+        self.members = set()
+        self.state = {}
+
+
+class PartitionRegistry:
+    """Maps group chats to their members and per-chat state, with a reverse user -> chats index.
+
+    Players who have never been seen in any group (e.g. registered before partitions existed) are kept
+    in `unassigned` and count as members of every chat, so single-group deployments behave as before.
+    """
+
+    def __init__(self):
+        self.partitions = {}
+        self.chats_of = {}
+        self.unassigned = set()
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self.partitions)
+
+    def get(self, chat_id: int) -> ChatPartition:
+        chat_id = int(chat_id)
+        partition = self.partitions.get(chat_id)
+        if partition is None:
+            partition = self.partitions[chat_id] = ChatPartition(chat_id)
+        return partition
+
+    def join(self, chat_id: int, user_id: int) -> bool:
+        """Adds a member. Returns True if they were not known to be in this chat."""
+        partition = self.get(chat_id)
+        self.unassigned.discard(user_id)
+        if user_id in partition.members:
+            return False
+        partition.members.add(user_id)
+        self.chats_of.setdefault(user_id, set()).add(partition.chat_id)
+        return True
+
+    def leave(self, chat_id: int, user_id: int) -> bool:
+        partition = self.partitions.get(int(chat_id))
+        if partition is None or user_id not in partition.members:
+            return False
+        partition.members.discard(user_id)
+        chats = self.chats_of.get(user_id, set())
+        chats.discard(partition.chat_id)
+        if not chats:
+            self.chats_of.pop(user_id, None)
+        return True
+
+    def index_player(self, user_id: int, chats):
+        """Adds a player's persisted chat memberships (from their status) to the index."""
+        if chats:
+            for chat_id in chats:
+                try:
+                    self.join(int(chat_id), user_id)
+                except (ValueError, TypeError):
+                    pass
+        elif user_id not in self.chats_of:
+            self.unassigned.add(user_id)
+
+    def forget_player(self, user_id: int):
+        self.unassigned.discard(user_id)
+        for chat_id in self.chats_of.pop(user_id, set()):
+            self.partitions[chat_id].members.discard(user_id)
+
+    def chat_ids_for(self, user_id: int) -> set:
+        return set(self.chats_of.get(user_id, ()))
+
+    def members(self, *chat_ids) -> set:
+        """Member ids of the given chats, plus players not yet assigned to any chat."""
+        out = set(self.unassigned)
+        for chat_id in chat_ids:
+            partition = self.partitions.get(int(chat_id))
+            if partition is not None:
+                out |= partition.members
+        return out
+
+    def load_states(self, states):
+        """Refreshes per-chat state from the persisted {chat_id: state} map."""
+        if not isinstance(states, dict):
+            return
+        for chat_id, state in states.items():
+            try:
+                partition = self.get(int(chat_id))
+            except (ValueError, TypeError):
+                continue
+            if isinstance(state, dict):
+                partition.state = {k: v for k, v in state.items() if k in PARTITION_STATE_KEYS}
+
+    def merged_state(self, base: dict, chat_ids) -> dict:
+        """Overlays the event timers of the given chats on the global state; the latest-running timer wins."""
+        state = {k: v for k, v in base.items() if k != 'chats'}
+        for chat_id in chat_ids:
+            partition = self.partitions.get(int(chat_id))
+            if partition is None:
+                continue
+            for key, val in partition.state.items():
+                if key.endswith('_until') and (val or 0) > (state.get(key) or 0):
+                    state[key] = val
+                    if key == 'inflation_until':
+                        state['inflation_user_id'] = partition.state.get('inflation_user_id')
+        return state
@@ -0,0 +1,140 @@
+import csv
+import io
+import json
+import re
+from dataclasses import dataclass, field
+
+# Header names accepted for each column (case-insensitive).
+PLAYER_COLUMNS = ('player', 'username', 'user', 'user_id', 'telegram_id', 'id')
+COIN_COLUMNS = ('coins', 'coins_delta', 'delta', 'amount')
+CARD_COLUMNS = ('cards', 'card')
+CARD_SEPARATOR = re.compile(r'[;,|]')
+REPORT_COLUMNS = ('line', 'player', 'user_id', 'coins', 'cards', 'status', 'detail')
+
+MAX_ROWS = 5000
+MAX_BYTES = 1024 * 1024
+
+PAYOUT_USAGE = (
+    "Send me a .csv or .json file in this chat to award coins and cards in bulk.\n"
+    "CSV header: player,coins,cards (player is a @username or a Telegram id; cards separated by ';').\n"
+    "JSON: [{\"player\": \"@name\", \"coins\": 50, \"cards\": [\"Flame\"]}, ...]\n"
+    "Coins may be negative. Add the caption \"dry\" to preview the report without changing anything."
+)
+
+
+@dataclass(slots=True)
+class PayoutRow:
+    """One line of a payout file and, once applied, what happened to it (`status` ok/skipped/error)."""
+    line: int
+    player: str
+    coins: int = 0
+    cards: list = field(default_factory=list)
+    card_ids: list = field(default_factory=list)
+    user_id: int = None
+    status: str = 'pending'
+    detail: str = ''
+
+    def fail(self, detail: str):
+        self.status, self.detail = 'error', detail
+
+
+def player_ref(value: str):
+    """('id', int) for a numeric Telegram id, ('name', lowercase username without '@') otherwise."""
+    value = value.strip()
+    if value.lstrip('-').isdigit():
+        return 'id', int(value)
+    return 'name', value.lstrip('@').strip().lower()
+
+
+def card_index(power_cards: dict) -> dict:
+    """Lowercase card name or id -> card id."""
+    index = {cid.lower(): cid for cid in power_cards}
+    index.update({card['name'].lower(): cid for cid, card in power_cards.items()})
+    return index
+
+
+def _column(fields: dict, names: tuple):
+    return next((fields[name] for name in names if fields.get(name) not in (None, '')), None)
+
+
+def _row(line: int, fields: dict) -> PayoutRow:
+    fields = {str(k).strip().lower(): v for k, v in fields.items() if k is not None}
+    player = _column(fields, PLAYER_COLUMNS)
+    row = PayoutRow(line, str(player).strip() if player is not None else '')
+    if not row.player:
+        row.fail("no player")
+        return row
+
+    coins = _column(fields, COIN_COLUMNS)
+    if coins is not None:
+        try:
+            row.coins = int(str(coins).strip().replace('+', '', 1))
+        except ValueError:
+            row.fail(f"coins '{coins}' is not a whole number")
+            return row
+
+    cards = _column(fields, CARD_COLUMNS)
+    if isinstance(cards, str):
+        cards = CARD_SEPARATOR.split(cards)
+    elif cards is not None and not isinstance(cards, list):
+        cards = [cards]
+    row.cards = [str(c).strip() for c in cards or [] if str(c).strip()]
+    if not row.coins and not row.cards:
+        row.status, row.detail = 'skipped', "nothing to award"
+    return row
+
+
+def parse_payout_file(data: bytes, filename: str) -> list:
+    """PayoutRows of a CSV or JSON payout file. Raises ValueError if the file as a whole cannot be read."""
+    if len(data) > MAX_BYTES:
+        raise ValueError(f"File is larger than {MAX_BYTES // 1024} KB.")
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise ValueError("File is not UTF-8 text.")
+
+    if filename.lower().endswith('.json'):
+        try:
+            document = json.loads(text)
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON: {e}")
+        if isinstance(document, dict):
+            document = document.get('rows', document.get('payouts'))
+        if not isinstance(document, list):
+            raise ValueError("JSON must be a list of rows (or {\"rows\": [...]}).")
+        entries = [(i, entry) for i, entry in enumerate(document, start=1)]
+    else:
+        reader = csv.DictReader(io.StringIO(text))
+        headers = {str(h).strip().lower() for h in reader.fieldnames or []}
+        if not headers & set(PLAYER_COLUMNS):
+            raise ValueError(f"CSV needs a header row with a player column ({', '.join(PLAYER_COLUMNS)}).")
+        # Line numbers as a spreadsheet shows them: the header is line 1.
+        entries = [(reader.line_num, entry) for entry in reader]
+
+    if len(entries) > MAX_ROWS:
+        raise ValueError(f"File has {len(entries)} rows; at most {MAX_ROWS} are accepted per upload.")
+    rows = []
+    for line, entry in entries:
+        if isinstance(entry, dict):
+            rows.append(_row(line, entry))
+        else:
+            row = PayoutRow(line, str(entry))
+            row.fail("row is not an object")
+            rows.append(row)
+    return rows
+
+
+def write_report(rows) -> io.BytesIO:
+    """The per-row result as a CSV document."""
+    buffer = io.BytesIO()
+    text = io.TextIOWrapper(buffer, encoding='utf-8', newline='', write_through=True)
+    writer = csv.DictWriter(text, fieldnames=REPORT_COLUMNS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({
+            'line': row.line, 'player': row.player, 'user_id': row.user_id or '', 'coins': row.coins,
+            'cards': ';'.join(row.card_ids or row.cards), 'status': row.status, 'detail': row.detail,
+        })
+    text.detach()
+    buffer.seek(0)
+    return buffer
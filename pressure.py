@@ -0,0 +1,133 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Degradation levels, mildest first. Each level also applies everything below it.
+NORMAL = 0
+TEXT_ONLY = 1         # replies and DMs drop their animations
+ESSENTIAL_DMS = 2     # only priority DMs (the player was targeted) are sent
+SAMPLED_LOGS = 3      # only one in `log_sample_every` activity posts reaches the log channel
+DEFERRED_REPORTS = 4  # /allplayers-style admin reports wait until load drops
+LEVEL_NAMES = ('normal', 'text_only', 'essential_dms', 'sampled_logs', 'deferred_reports')
+
+
+def parse_limits(raw, default: tuple) -> tuple:
+    """Parses "a,b,c,d" into four ascending thresholds (one per degradation level)."""
+    if not raw:
+        return default
+    try:
+        limits = tuple(float(v) for v in str(raw).split(','))
+    except ValueError:
+        logger.warning(f"Ignoring malformed pressure limits {raw!r}.")
+        return default
+    if len(limits) != len(default) or list(limits) != sorted(limits):
+        logger.warning(f"Ignoring pressure limits {raw!r}: need {len(default)} ascending values.")
+        return default
+    return limits
+
+
+class PressureMonitor:
+    """Turns load signals into a degradation level.
+
+    Signals are gauges (callables sampled on demand, e.g. queue depths) plus the mean database
+    round-trip latency over the last `latency_window` seconds. Each signal maps to a level through
+    its four thresholds; the worst one wins. Raising the level is immediate; it is lowered one step
+    at a time, once the signals have stayed below it for `recover_after` seconds.
+    """
+
+    def __init__(self, limits: dict, recover_after: float = 30.0, latency_window: float = 30.0,
+                 log_sample_every: int = 10, sample_interval: float = 0.5):
+        self.limits = dict(limits)
+        self.recover_after = recover_after
+        self.latency_window = latency_window
+        self.log_sample_every = max(1, int(log_sample_every))
+        self.sample_interval = sample_interval
+        self.gauges = {}
+        self.latencies = deque()
+        self.lock = threading.Lock()
+        self.current = NORMAL
+        self.calm_since = None
+        self.checked_at = 0.0
+        self.log_counter = 0
+        self.last_signals = {}
+
+    def add_gauge(self, name: str, read):
+        self.gauges[name] = read
+
+    def observe_db(self, table: str, seconds: float, ok: bool = True):
+        """InstrumentedClient observer: records one database round trip."""
+        now = time.monotonic()
+        with self.lock:
+            self.latencies.append((now, seconds))
+            self._trim(now)
+
+    def _trim(self, now: float):
+        while self.latencies and now - self.latencies[0][0] > self.latency_window:
+            self.latencies.popleft()
+
+    def signals(self) -> dict:
+        out = {}
+        for name, read in self.gauges.items():
+            try:
+                out[name] = float(read())
+            except Exception:
+                out[name] = 0.0
+        with self.lock:
+            self._trim(time.monotonic())
+            out['db_latency'] = sum(s for _, s in self.latencies) / len(self.latencies) if self.latencies else 0.0
+        return out
+
+    @property
+    def level(self) -> int:
+        now = time.monotonic()
+        if now - self.checked_at < self.sample_interval:
+            return self.current
+        self.checked_at = now
+        signals = self.last_signals = self.signals()
+        target = NORMAL
+        for name, value in signals.items():
+            for level, limit in enumerate(self.limits.get(name, ()), start=1):
+                if value >= limit:
+                    target = max(target, level)
+
+        if target > self.current:
+            logger.warning(f"Load shedding: {LEVEL_NAMES[self.current]} -> {LEVEL_NAMES[target]} ({signals})")
+            self.current, self.calm_since = target, None
+        elif target < self.current:
+            if self.calm_since is None:
+                self.calm_since = now
+            elif now - self.calm_since >= self.recover_after:
+                logger.info(f"Load shedding: recovering {LEVEL_NAMES[self.current]} -> {LEVEL_NAMES[self.current - 1]}")
+                self.current -= 1
+                self.calm_since = now if target < self.current else None
+        else:
+            self.calm_since = None
+        return self.current
+
+    # --- POLICIES ---
+    def allows_gifs(self) -> bool:
+        return self.level < TEXT_ONLY
+
+    def allows_dm(self, priority: bool = False) -> bool:
+        return priority or self.level < ESSENTIAL_DMS
+
+    def allows_log_post(self) -> bool:
+        if self.level < SAMPLED_LOGS:
+            return True
+        self.log_counter += 1
+        return self.log_counter % self.log_sample_every == 1
+
+    def defers_reports(self) -> bool:
+        return self.level >= DEFERRED_REPORTS
+
+    def snapshot(self) -> dict:
+        level = self.level
+        return {
+            'level': level,
+            'name': LEVEL_NAMES[level],
+            'signals': {k: round(v, 3) for k, v in self.last_signals.items()},
+            'limits': self.limits,
+        }
@@ -0,0 +1,158 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Leaf frames in these files mean the thread is waiting (event loop select, locks, queues), not working.
+IDLE_FILES = ('selectors.py', 'threading.py', 'queue.py', 'socketserver.py', 'ssl.py')
+
+
+def _frame_key(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Low-overhead wall-clock sampler for a live bot.
+
+    A daemon thread wakes every `interval` seconds, takes the Python stack of every other thread
+    (sys._current_frames) and counts it. Nothing is installed in the profiled code, so the cost is the
+    sampling thread alone, a few percent of one core at the default interval. Stacks whose innermost
+    frame is a wait (see IDLE_FILES) are counted as idle. A session stops on its own after
+    `max_seconds`, and at most `max_stacks` distinct stacks are kept, so it is safe to leave running.
+    """
+
+    MAX_DEPTH = 60
+
+    def __init__(self, interval: float = 0.005, max_seconds: float = 300.0, max_stacks: int = 20000):
+        self.interval = max(0.001, interval)
+        self.max_seconds = max_seconds
+        self.max_stacks = max_stacks
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop_event = threading.Event()
+        self._reset()
+
+    def _reset(self):
+        self.stacks = Counter()
+        self.samples = 0
+        self.idle = 0
+        self.dropped = 0
+        self.started_at = None
+        self.stopped_at = None
+        self.baseline = {}
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.stopped_at or time.time()) - self.started_at
+
+    def start(self, seconds: float = None, baseline: dict = None) -> bool:
+        """Starts a new session of at most `seconds` (capped at max_seconds). False if one is already running.
+
+        `baseline` is a {label: (count, seconds)} snapshot of per-handler timings taken now, so the
+        report can show what each handler cost during the session alone.
+        """
+        if self.running:
+            return False
+        with self.lock:
+            self._reset()
+            self.baseline = dict(baseline or {})
+            self.started_at = time.time()
+        duration = min(seconds or self.max_seconds, self.max_seconds)
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, args=(duration,), name='profiler', daemon=True)
+        self.thread.start()
+        logger.info(f"Profiler started for up to {duration:g}s (interval {self.interval * 1000:g} ms).")
+        return True
+
+    def stop(self) -> bool:
+        if not self.running:
+            return False
+        self.stop_event.set()
+        self.thread.join()
+        return True
+
+    def _run(self, duration: float):
+        me = threading.get_ident()
+        deadline = time.monotonic() + duration
+        while not self.stop_event.wait(self.interval):
+            if time.monotonic() >= deadline:
+                break
+            frames = sys._current_frames()
+            with self.lock:
+                for ident, frame in frames.items():
+                    if ident != me:
+                        self._sample(frame)
+        self.stopped_at = time.time()
+        logger.info(f"Profiler stopped after {self.elapsed():.1f}s with {self.samples} samples.")
+
+    def _sample(self, frame):
+        self.samples += 1
+        if os.path.basename(frame.f_code.co_filename) in IDLE_FILES:
+            self.idle += 1
+            return
+        stack = []
+        while frame is not None and len(stack) < self.MAX_DEPTH:
+            stack.append(_frame_key(frame.f_code))
+            frame = frame.f_back
+        stack = tuple(reversed(stack))
+        if stack in self.stacks or len(self.stacks) < self.max_stacks:
+            self.stacks[stack] += 1
+        else:
+            self.dropped += 1
+
+    # --- REPORT ---
+    def function_times(self):
+        """(self samples, cumulative samples) per function; recursion counts once per stack."""
+        own, cumulative = Counter(), Counter()
+        with self.lock:
+            for stack, count in self.stacks.items():
+                own[stack[-1]] += count
+                for key in set(stack):
+                    cumulative[key] += count
+        return own, cumulative
+
+    def handler_times(self, current: dict) -> list:
+        """[(label, calls, seconds)] of handlers run since start, from two {label: (count, seconds)} snapshots."""
+        rows = []
+        for label, (count, seconds) in current.items():
+            base_count, base_seconds = self.baseline.get(label, (0, 0.0))
+            if count > base_count:
+                rows.append((label, count - base_count, seconds - base_seconds))
+        return sorted(rows, key=lambda row: -row[2])
+
+    def folded(self) -> str:
+        """Stacks in the collapsed format read by flamegraph.pl and speedscope."""
+        with self.lock:
+            return "\n".join(f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common())
+
+    def report(self, handler_snapshot: dict = None, top: int = 40) -> str:
+        busy = self.samples - self.idle
+        status = "running" if self.running else "stopped"
+        lines = [
+            f"Profile ({status}) — {self.elapsed():.1f}s, sampling every {self.interval * 1000:g} ms",
+            f"Samples: {self.samples:,} across all threads, {busy:,} busy, {self.idle:,} idle"
+            + (f", {self.dropped:,} dropped (stack limit)" if self.dropped else ""),
+        ]
+        handlers = self.handler_times(handler_snapshot or {})
+        if handlers:
+            lines += ["", "Handlers (wall time during the session)", f"{'handler':<32} {'calls':>7} {'total s':>9} {'avg ms':>9}"]
+            for label, calls, seconds in handlers:
+                lines.append(f"{label:<32} {calls:>7} {seconds:>9.3f} {seconds / calls * 1000:>9.1f}")
+
+        own, cumulative = self.function_times()
+        for title, counts in (("Functions by own time", own), ("Functions by cumulative time", cumulative)):
+            lines += ["", title, f"{'samples':>8} {'% busy':>7}  function"]
+            for key, count in counts.most_common(top):
+                lines.append(f"{count:>8} {count / max(busy, 1) * 100:>6.1f}%  {key}")
+
+        lines += ["", "Folded stacks (flamegraph.pl / speedscope input)", self.folded()]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,59 @@
+import hashlib
+import logging
+import secrets
+import time
+from collections import deque
+from random import Random
+
+logger = logging.getLogger(__name__)
+
+
+class EventRandom(Random):
+    """A random.Random seeded for a single card use or event, carrying the seed it was derived from."""
+
+    def __init__(self, seed: int, kind: str = '', context: dict = None):
+        super().__init__(seed)
+        self.event_seed = seed
+        self.kind = kind
+        self.context = context or {}
+
+
+class RNGService:
+    """Hands out independently seeded RNGs per card use / event and remembers the seed behind each outcome.
+
+    Every derived seed is a hash of the master seed, a running counter and the event kind, so a run
+    started with the same master seed draws identical outcomes, and any single outcome can be replayed
+    bit-exactly from its recorded seed with `replay()`.
+    """
+
+    HISTORY_SIZE = 500
+
+    def __init__(self, master_seed=None):
+        self.reseed(master_seed)
+
+    def reseed(self, master_seed=None):
+        """Resets the derivation sequence. With no seed, a fresh unpredictable master seed is drawn."""
+        self.master_seed = int(master_seed) if master_seed not in (None, '') else secrets.randbits(64)
+        self.counter = 0
+        self.history = deque(maxlen=self.HISTORY_SIZE)
+
+    def derive(self, kind: str, **context) -> EventRandom:
+        """Returns a fresh RNG for one event. Context (user ids, card ids) is kept for the record."""
+        self.counter += 1
+        digest = hashlib.blake2b(f"{self.master_seed}:{self.counter}:{kind}".encode(), digest_size=8).digest()
+        return EventRandom(int.from_bytes(digest, 'big'), kind, context)
+
+    def replay(self, kind: str, seed: int, **context) -> EventRandom:
+        """Rebuilds the RNG of a recorded event so its outcome can be reproduced."""
+        return EventRandom(int(seed), kind, context)
+
+    def record(self, rng: EventRandom, outcome) -> dict:
+        """Records the outcome an event RNG produced, next to its seed."""
+        entry = {'time': time.time(), 'kind': rng.kind, 'seed': rng.event_seed, 'context': rng.context, 'outcome': outcome}
+        self.history.append(entry)
+        logger.info(f"RNG {rng.kind} seed={rng.event_seed:#018x} context={rng.context} outcome={outcome!r}")
+        return entry
+
+    def find(self, seed: int):
+        """Looks up a recent recorded event by its seed."""
+        return next((entry for entry in reversed(self.history) if entry['seed'] == int(seed)), None)
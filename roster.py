@@ -0,0 +1,211 @@
+import csv
+import io
+import itertools
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from models import Player
+
+# Timed and toggled effects shown in the report and matched by the `effects` filter: (status field, short name, badge).
+EFFECTS = (
+    ('protected', 'protected', "Protected 🛡️"),
+    ('trap_active', 'trap', "Trap 🪤"),
+    ('shackled_until', 'shackled', "Shackled ⛓️"),
+    ('karma_active_until', 'karma', "Karma ⚖️"),
+    ('ricochet_active_until', 'ricochet', "Ricochet ↪️"),
+    ('blackout_until', 'blackout', "Blackout 🕶️"),
+    ('mirage_until', 'mirage', "Mirage 🏜️"),
+    ('speed_active_until', 'speed', "Speed ⚡️"),
+    ('black_market_until', 'blackmarket', "Black Market 💰"),
+    ('inflation_immunity_until', 'immune', "Inflation Immunity 🛡️"),
+    ('attack_grace_until', 'grace', "Grace Period 🛡️"),
+)
+EFFECT_NAMES = {name: key for key, name, _ in EFFECTS}
+
+# Sort name -> (key function, descending).
+SORTS = {
+    'coins': (lambda p: (p.coins, -p.user_id), True),
+    'cards': (lambda p: (len(p.cards), -p.user_id), True),
+    'name': (lambda p: (p.display_name.lower(), p.user_id), False),
+    'id': (lambda p: p.user_id, False),
+}
+EXPORT_COLUMNS = ('user_id', 'username', 'first_name', 'in_game_name', 'coins', 'card_count', 'cards',
+                  'msgc_registered', 'eliminated', 'effects')
+
+REPORT_USAGE = (
+    "Usage: /allplayers [coins|cards|name|id] [active|eliminated] [msgc|nomsgc] [effects|<effect>] "
+    "[min=N] [max=N] [export csv|json]\n"
+    f"Effects: {', '.join(EFFECT_NAMES)}"
+)
+
+
+def active_effects(player: Player, now: float) -> list:
+    """(short name, badge) of every effect currently on the player."""
+    status = player.status
+    out = []
+    for key, name, badge in EFFECTS:
+        value = getattr(status, key)
+        if (value > now) if key.endswith('_until') else bool(value):
+            out.append((name, badge))
+    return out
+
+
+@dataclass(slots=True)
+class ReportQuery:
+    """Sort order, filters and export format parsed from /allplayers arguments."""
+    sort: str = 'coins'
+    eliminated: bool = None
+    msgc: bool = None
+    effects: set = field(default_factory=set)
+    any_effect: bool = False
+    min_coins: int = None
+    max_coins: int = None
+    export: str = None
+
+    @classmethod
+    def parse(cls, args) -> 'ReportQuery':
+        """Raises ValueError with the offending argument if one is not understood."""
+        query = cls()
+        args = [a.lower() for a in args or []]
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            key, _, value = arg.partition('=')
+            if arg in ('export', 'csv', 'json'):
+                if arg == 'export':
+                    i += 1
+                    value = args[i] if i < len(args) else 'csv'
+                else:
+                    value = arg
+                if value not in ('csv', 'json'):
+                    raise ValueError(value)
+                query.export = value
+            elif arg in SORTS or (key == 'sort' and value in SORTS):
+                query.sort = value or arg
+            elif arg in ('active', 'eliminated'):
+                query.eliminated = arg == 'eliminated'
+            elif arg in ('msgc', 'nomsgc'):
+                query.msgc = arg == 'msgc'
+            elif arg == 'effects':
+                query.any_effect = True
+            elif arg in EFFECT_NAMES:
+                query.effects.add(arg)
+            elif key in ('min', 'max') and value.lstrip('-').isdigit():
+                setattr(query, f"{key}_coins", int(value))
+            else:
+                raise ValueError(arg)
+            i += 1
+        return query
+
+    def matches(self, player: Player, now: float) -> bool:
+        if self.eliminated is not None and player.is_eliminated != self.eliminated:
+            return False
+        if self.msgc is not None and bool(player.msgc_registered) != self.msgc:
+            return False
+        if self.min_coins is not None and player.coins < self.min_coins:
+            return False
+        if self.max_coins is not None and player.coins > self.max_coins:
+            return False
+        if self.any_effect or self.effects:
+            names = {name for name, _ in active_effects(player, now)}
+            if not names or not self.effects <= names:
+                return False
+        return True
+
+    def select(self, players, now: float = None) -> list:
+        """The matching players, sorted."""
+        now = time.time() if now is None else now
+        key, descending = SORTS[self.sort]
+        return sorted((p for p in players if self.matches(p, now)), key=key, reverse=descending)
+
+    def describe(self) -> str:
+        parts = [f"by {self.sort}"]
+        if self.eliminated is not None:
+            parts.append('eliminated' if self.eliminated else 'active')
+        if self.msgc is not None:
+            parts.append('MSGC' if self.msgc else 'non-MSGC')
+        if self.any_effect:
+            parts.append('with effects')
+        parts.extend(sorted(self.effects))
+        if self.min_coins is not None:
+            parts.append(f"≥{self.min_coins} PC")
+        if self.max_coins is not None:
+            parts.append(f"≤{self.max_coins} PC")
+        return ", ".join(parts)
+
+
+@dataclass(slots=True)
+class Report:
+    """A frozen, ordered list of player ids; pages are rendered from current player records."""
+    report_id: str
+    owner_id: int
+    user_ids: list
+    title: str
+    created: float = field(default_factory=time.time)
+
+    def pages(self, page_size: int) -> int:
+        return max(1, -(-len(self.user_ids) // page_size))
+
+    def page_ids(self, page: int, page_size: int) -> list:
+        return self.user_ids[page * page_size:(page + 1) * page_size]
+
+
+class ReportCache:
+    """The most recent reports by id, so Prev/Next only re-read the ten players on the page.
+
+    Reports expire after `ttl` seconds and at most `size` are kept.
+    """
+
+    def __init__(self, size: int = 50, ttl: float = 900.0):
+        self.size = size
+        self.ttl = ttl
+        self.reports = OrderedDict()
+        self.ids = itertools.count(1)
+
+    def add(self, owner_id: int, user_ids: list, title: str) -> Report:
+        report = Report(format(next(self.ids), 'x'), owner_id, list(user_ids), title)
+        self.reports[report.report_id] = report
+        while len(self.reports) > self.size:
+            self.reports.popitem(last=False)
+        return report
+
+    def get(self, report_id: str):
+        report = self.reports.get(report_id)
+        if report is None or time.time() - report.created > self.ttl:
+            self.reports.pop(report_id, None)
+            return None
+        return report
+
+
+# --- EXPORT ---
+def export_row(player: Player, now: float) -> dict:
+    return {
+        'user_id': player.user_id, 'username': player.username, 'first_name': player.first_name,
+        'in_game_name': player.in_game_name, 'coins': player.coins, 'card_count': len(player.cards),
+        'cards': player.cards.to_list(), 'msgc_registered': bool(player.msgc_registered),
+        'eliminated': player.is_eliminated, 'effects': [name for name, _ in active_effects(player, now)],
+    }
+
+def write_export(players, fmt: str, now: float = None) -> io.BytesIO:
+    """Writes the players as CSV or JSON row by row into a BytesIO ready to send as a document."""
+    now = time.time() if now is None else now
+    buffer = io.BytesIO()
+    text = io.TextIOWrapper(buffer, encoding='utf-8', newline='', write_through=True)
+    if fmt == 'csv':
+        writer = csv.DictWriter(text, fieldnames=EXPORT_COLUMNS)
+        writer.writeheader()
+        for player in players:
+            row = export_row(player, now)
+            row['cards'] = ';'.join(row['cards'])
+            row['effects'] = ';'.join(row['effects'])
+            writer.writerow(row)
+    else:
+        text.write('[')
+        for i, player in enumerate(players):
+            text.write(('\n' if i == 0 else ',\n') + json.dumps(export_row(player, now), ensure_ascii=False))
+        text.write('\n]\n')
+    text.detach()
+    buffer.seek(0)
+    return buffer
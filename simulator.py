@@ -0,0 +1,447 @@
+"""Headless economy simulator.
+
+Runs whole game worlds without Telegram: every world gets its own in-memory store and virtual clock,
+and players buy and use cards through the bot's own rule functions (get_card_price, process_buy_card,
+get_card_use_block and process_use_card), so a rule change in main.py is reflected here unchanged.
+Worlds are independent and run in parallel worker processes; their statistics are merged at the end.
+
+Usage:
+    python simulator.py --worlds 8 --rounds 250000 --players 200 --seed 42
+    python simulator.py --strategies aggressive=0.3,hoarder=0.3,random=0.4 --json results.json
+
+Double or Nothing and God need a live chat (challenge buttons and follow-up arguments), so the
+built-in strategies never buy them.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+SKIPPED_CARDS = {'double_or_nothing', 'god'}
+DEFENSIVE_CARDS = {'angel', 'insurance', 'forcefield', 'trap', 'ricochet', 'karma', 'blackout', 'mirage', 'dispel'}
+
+
+class SimClock:
+    """Virtual clock installed as main.time so cooldowns and timed effects follow simulated time."""
+
+    def __init__(self, start: float = 1_700_000_000.0):
+        self.now = start
+
+    def time(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+def gini(values) -> float:
+    """Gini coefficient of a coin distribution (0 = perfectly equal, 1 = one player holds everything)."""
+    values = sorted(v for v in values if v >= 0)
+    n = len(values)
+    total = sum(values)
+    if n == 0 or total == 0:
+        return 0.0
+    weighted = sum((i + 1) * v for i, v in enumerate(values))
+    return (2 * weighted) / (n * total) - (n + 1) / n
+
+
+# --- STRATEGIES ---
+
+class Strategy:
+    """Decides one action per turn: ('buy', card_id), ('use', card_id, target_id, args) or None."""
+
+    name = 'base'
+    buy_chance = 0.5
+
+    def __init__(self, world: 'World'):
+        self.world = world
+        self.rng = world.rng
+
+    def buyable(self, player: dict) -> list:
+        held = set(player.get('cards', []))
+        return [cid for cid in self.world.main.POWER_CARDS if cid not in held and cid not in SKIPPED_CARDS]
+
+    def pick_buy(self, player: dict, options: list):
+        return self.rng.choice(options) if options else None
+
+    def pick_target(self, player: dict, card_id: str):
+        targets = self.world.eligible_targets(player)
+        return self.rng.choice(targets) if targets else None
+
+    def card_args(self, card_id: str, target) -> list:
+        if card_id == 'purge':
+            cards = [cid for cid in self.world.main.POWER_CARDS if cid not in SKIPPED_CARDS]
+            return self.world.main.POWER_CARDS[self.rng.choice(cards)]['name'].split()
+        return []
+
+    def pick_use(self, player: dict, held: list):
+        return self.rng.choice(held) if held else None
+
+    def decide(self, player: dict):
+        held = [cid for cid in player.get('cards', []) if cid not in SKIPPED_CARDS and cid != 'insurance']
+        if not held or self.rng.random() < self.buy_chance:
+            card_id = self.pick_buy(player, self.buyable(player))
+            if card_id:
+                return ('buy', card_id)
+        card_id = self.pick_use(player, held)
+        if not card_id:
+            return None
+        target = None
+        if self.world.main.POWER_CARDS[card_id].get('requires_target'):
+            target = self.pick_target(player, card_id)
+            if not target:
+                return None
+        return ('use', card_id, target.user_id if target else None, self.card_args(card_id, target))
+
+
+class RandomStrategy(Strategy):
+    """Buys and uses uniformly random cards on uniformly random targets."""
+    name = 'random'
+
+
+class AggressiveStrategy(Strategy):
+    """Prefers attack cards and always targets the richest eligible player."""
+    name = 'aggressive'
+    buy_chance = 0.4
+
+    def pick_buy(self, player, options):
+        attacks = [cid for cid in options if cid in self.world.main.NEGATIVE_CARDS]
+        return self.rng.choice(attacks or options) if options else None
+
+    def pick_use(self, player, held):
+        attacks = [cid for cid in held if cid in self.world.main.NEGATIVE_CARDS]
+        return self.rng.choice(attacks or held) if held else None
+
+    def pick_target(self, player, card_id):
+        targets = self.world.eligible_targets(player)
+        return max(targets, key=lambda p: p.coins) if targets else None
+
+
+class HoarderStrategy(Strategy):
+    """Saves coins, buys only defensive cards and rarely plays anything else."""
+    name = 'hoarder'
+    buy_chance = 0.2
+
+    def pick_buy(self, player, options):
+        defensive = [cid for cid in options if cid in DEFENSIVE_CARDS]
+        return self.rng.choice(defensive) if defensive else None
+
+    def pick_use(self, player, held):
+        defensive = [cid for cid in held if cid in DEFENSIVE_CARDS]
+        return self.rng.choice(defensive) if defensive else None
+
+
+STRATEGIES = {cls.name: cls for cls in (RandomStrategy, AggressiveStrategy, HoarderStrategy)}
+
+
+def parse_strategy_mix(text: str) -> dict:
+    """Parses 'aggressive=0.3,random=0.7' into normalised weights."""
+    mix = {}
+    for part in text.split(','):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition('=')
+        name = name.strip().lower()
+        if name not in STRATEGIES:
+            raise ValueError(f"Unknown strategy '{name}'. Choose from: {', '.join(STRATEGIES)}")
+        mix[name] = float(weight or 1)
+    total = sum(mix.values())
+    if total <= 0:
+        raise ValueError("Strategy weights must add up to more than zero.")
+    return {name: w / total for name, w in mix.items()}
+
+
+# --- WORLD ---
+
+class World:
+    """One simulated game: an in-memory store, a virtual clock and a population of scripted players."""
+
+    def __init__(self, config: dict, seed: int):
+        import main
+        from ledger import Ledger, SQLiteLedgerStore
+        from memstore import MemoryClient
+
+        self.main = main
+        self.config = config
+        self.rng = random.Random(seed)
+        main.RNG_SERVICE.reseed(seed)
+
+        self.clock = SimClock()
+        main.time = self.clock
+        main.db = MemoryClient()
+        # Keep the world's ledger in compact in-memory SQLite rather than as memstore rows.
+        main.LEDGER = Ledger(SQLiteLedgerStore(':memory:'))
+        main.PLAYER_CACHE.clear()
+        main.ELIGIBILITY.clear()
+        main.PLAYER_CACHE_TTL = float('inf')
+        main.GLOBAL_GAME_STATE.clear()
+
+        self.stats = {
+            'rounds': 0, 'buys': 0, 'uses': 0, 'blocked': 0, 'failed': 0,
+            'coins_spent': 0, 'coins_awarded': 0, 'ricochets': 0, 'vortexes': 0,
+        }
+        self.cards_bought = Counter()
+        self.cards_used = Counter()
+        self.strategy_of = {}
+        self.supply_series = []
+
+        mix = config['strategies']
+        names, weights = list(mix), list(mix.values())
+        for i in range(config['players']):
+            user_id = 1000 + i
+            main.save_player_data(user_id, {
+                'username': f"sim_{user_id}",
+                'first_name': f"Sim {user_id}",
+                'coins': config['start_coins'],
+                'cards': [],
+                'status': {},
+                'msgc_registered': self.rng.random() < config['msgc_share'],
+            })
+            self.strategy_of[user_id] = STRATEGIES[self.rng.choices(names, weights)[0]](self)
+        self.user_ids = list(self.strategy_of)
+
+    def player(self, user_id: int) -> dict:
+        return self.main.get_player_data(user_id)
+
+    def records(self) -> list:
+        """Cached Player records; scanning these avoids building a dict per player."""
+        return [self.main.get_player_record(uid) for uid in self.user_ids]
+
+    def eligible_targets(self, player: dict, exclude=()) -> list:
+        skip = {player['user_id'], *exclude}
+        is_msgc = bool(player.get('msgc_registered', False))
+        return [
+            r for r in self.records()
+            if r.user_id not in skip and not r.is_eliminated and r.msgc_registered == is_msgc
+        ]
+
+    def award_all(self, amount: int):
+        for r in self.records():
+            self.main.update_player_data(r.user_id, {'coins': r.coins + amount})
+            self.stats['coins_awarded'] += amount
+
+    def buy(self, player: dict, card_id: str):
+        result = self.main.process_buy_card(player['user_id'], player, card_id, self.main.get_game_state())
+        if 'error' in result:
+            self.stats['blocked'] += 1
+            return
+        self.stats['buys'] += 1
+        self.stats['coins_spent'] += result['price']
+        self.cards_bought[card_id] += 1
+
+    def use(self, player: dict, card_id: str, target_id, card_args: list):
+        main = self.main
+        if main.get_card_use_block(player['user_id'], player, card_id, main.get_game_state()):
+            self.stats['blocked'] += 1
+            return
+        target = self.player(target_id) if target_id else None
+        try:
+            result = main.process_use_card(player, target, card_id, card_args)
+        except Exception:
+            # The bot reports these as "Action failed" and the card is kept.
+            self.stats['failed'] += 1
+            return
+        self.stats['uses'] += 1
+        self.cards_used[card_id] += 1
+
+        if result.get('action') == 'trigger_ricochet':
+            self.resolve_ricochet(result['data'])
+        elif result.get('action') == 'trigger_vortex':
+            self.resolve_vortex(player)
+
+    def resolve_ricochet(self, data: dict):
+        """Mirrors execute_card_effect: redirect the card to a random eligible third player."""
+        self.stats['ricochets'] += 1
+        attacker = self.player(data['attacker_id'])
+        rng = self.main.RNG_SERVICE.derive('ricochet', attacker_id=data['attacker_id'], card_id=data['card_id'])
+        target_id = self.main.ELIGIBILITY.random_target(
+            rng, attacker.get('msgc_registered', False), exclude={data['attacker_id'], data['original_target_id']},
+        )
+        if target_id is not None:
+            try:
+                new_target = self.player(target_id)
+                self.main.process_use_card(attacker, new_target, data['card_id'], data['card_args'])
+            except Exception:
+                self.stats['failed'] += 1
+
+    def resolve_vortex(self, user: dict):
+        """Mirrors execute_card_effect: every same-pool player loses a random card unless shielded."""
+        self.stats['vortexes'] += 1
+        is_msgc = bool(user.get('msgc_registered', False))
+        rng = self.main.RNG_SERVICE.derive('vortex', user_id=user['user_id'])
+        for user_id in self.main.ELIGIBILITY.members(is_msgc):
+            r = self.main.get_player_record(user_id)
+            p = r.to_dict()
+            status = p['status']
+            inv = r.cards.copy()
+            if status.get('protected'):
+                status['protected'] = False
+                self.main.update_player_data(r.user_id, {'status': status})
+            elif inv:
+                inv.discard(inv.choice(rng))
+                self.main.update_player_data(r.user_id, {'cards': inv.to_list()})
+
+    def sample(self):
+        coins = [r.coins for r in self.records()]
+        self.supply_series.append({'round': self.stats['rounds'], 'supply': sum(coins), 'gini': round(gini(coins), 4)})
+
+    def run(self) -> dict:
+        cfg = self.config
+        self.sample()
+        for _ in range(cfg['rounds']):
+            self.clock.advance(cfg['round_seconds'])
+            self.stats['rounds'] += 1
+
+            user_id = self.rng.choice(self.user_ids)
+            player = self.player(user_id)
+            if player and not self.main.is_player_eliminated(player):
+                action = self.strategy_of[user_id].decide(player)
+                if action and action[0] == 'buy':
+                    self.buy(player, action[1])
+                elif action:
+                    self.use(player, *action[1:])
+
+            if cfg['award_every'] and self.stats['rounds'] % cfg['award_every'] == 0:
+                self.award_all(cfg['award'])
+            if self.stats['rounds'] % cfg['sample_every'] == 0:
+                self.sample()
+        return self.summary()
+
+    def summary(self) -> dict:
+        records = self.records()
+        coins = [r.coins for r in records]
+        by_strategy = {}
+        for r in records:
+            by_strategy.setdefault(self.strategy_of[r.user_id].name, []).append(r.coins)
+        return {
+            'stats': self.stats,
+            'cards_bought': dict(self.cards_bought),
+            'cards_used': dict(self.cards_used),
+            'final_supply': sum(coins),
+            'final_gini': gini(coins),
+            'median_coins': statistics.median(coins) if coins else 0,
+            'mean_coins_by_strategy': {name: sum(v) / len(v) for name, v in by_strategy.items()},
+            'supply_series': self.supply_series,
+            'db_calls': self.main.db.calls,
+        }
+
+
+def run_world(config: dict, seed: int) -> dict:
+    """Worker entry point: builds and runs one world. Must stay importable for the process pool."""
+    logging.disable(logging.WARNING)
+    started = time.perf_counter()
+    result = World(config, seed).run()
+    result['seed'] = seed
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+
+def merge_results(results: list) -> dict:
+    """Combines per-world summaries into totals, means and a mean supply curve."""
+    stats, bought, used = Counter(), Counter(), Counter()
+    by_strategy = {}
+    for r in results:
+        stats.update(r['stats'])
+        bought.update(r['cards_bought'])
+        used.update(r['cards_used'])
+        for name, mean in r['mean_coins_by_strategy'].items():
+            by_strategy.setdefault(name, []).append(mean)
+
+    series_len = min(len(r['supply_series']) for r in results)
+    supply_curve = [
+        {
+            'round': results[0]['supply_series'][i]['round'],
+            'supply': statistics.mean(r['supply_series'][i]['supply'] for r in results),
+            'gini': round(statistics.mean(r['supply_series'][i]['gini'] for r in results), 4),
+        }
+        for i in range(series_len)
+    ]
+    ginis = [r['final_gini'] for r in results]
+    return {
+        'worlds': len(results),
+        'stats': dict(stats),
+        'cards_bought': dict(bought.most_common()),
+        'cards_used': dict(used.most_common()),
+        'final_supply_mean': statistics.mean(r['final_supply'] for r in results),
+        'final_gini_mean': statistics.mean(ginis),
+        'final_gini_stdev': statistics.stdev(ginis) if len(ginis) > 1 else 0.0,
+        'mean_coins_by_strategy': {name: statistics.mean(v) for name, v in by_strategy.items()},
+        'supply_curve': supply_curve,
+        'seeds': [r['seed'] for r in results],
+        'world_seconds': sum(r['seconds'] for r in results),
+    }
+
+
+def format_report(merged: dict, wall_seconds: float) -> str:
+    stats = merged['stats']
+    lines = [
+        f"Worlds: {merged['worlds']}   Rounds: {stats.get('rounds', 0):,}   Wall time: {wall_seconds:.1f}s "
+        f"({stats.get('rounds', 0) / max(wall_seconds, 1e-9):,.0f} rounds/s)",
+        f"Buys: {stats.get('buys', 0):,}   Uses: {stats.get('uses', 0):,}   Blocked: {stats.get('blocked', 0):,}   "
+        f"Failed: {stats.get('failed', 0):,}   Ricochets: {stats.get('ricochets', 0):,}   Vortexes: {stats.get('vortexes', 0):,}",
+        f"Coins awarded: {stats.get('coins_awarded', 0):,}   Coins spent in store: {stats.get('coins_spent', 0):,}",
+        f"Final supply (mean/world): {merged['final_supply_mean']:,.0f}   "
+        f"Gini: {merged['final_gini_mean']:.3f} ± {merged['final_gini_stdev']:.3f}",
+        "Mean coins by strategy: " + ", ".join(f"{k} {v:,.1f}" for k, v in merged['mean_coins_by_strategy'].items()),
+        "",
+        "Card            bought      used",
+    ]
+    for card_id in sorted(set(merged['cards_bought']) | set(merged['cards_used'])):
+        lines.append(f"{card_id:<15} {merged['cards_bought'].get(card_id, 0):>6} {merged['cards_used'].get(card_id, 0):>9}")
+    return "\n".join(lines)
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate the Power Store economy offline.")
+    parser.add_argument('--worlds', type=int, default=os.cpu_count() or 1, help="independent game worlds to simulate")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument('--rounds', type=int, default=100_000, help="player turns per world")
+    parser.add_argument('--players', type=int, default=100, help="players per world")
+    parser.add_argument('--seed', type=int, default=1, help="base seed; world i uses seed + i")
+    parser.add_argument('--strategies', default='random=1', help="strategy mix, e.g. aggressive=0.3,hoarder=0.2,random=0.5")
+    parser.add_argument('--start-coins', type=int, default=100)
+    parser.add_argument('--award', type=int, default=20, help="coins given to every player by each /awardall")
+    parser.add_argument('--award-every', type=int, default=1000, help="rounds between /awardall calls (0 to disable)")
+    parser.add_argument('--round-seconds', type=float, default=15.0, help="simulated seconds per round")
+    parser.add_argument('--msgc-share', type=float, default=1.0, help="fraction of players registered for MSGC")
+    parser.add_argument('--sample-every', type=int, default=1000, help="rounds between coin supply samples")
+    parser.add_argument('--json', help="write the merged results to this file")
+    args = parser.parse_args(argv)
+
+    config = {
+        'rounds': args.rounds,
+        'players': args.players,
+        'strategies': parse_strategy_mix(args.strategies),
+        'start_coins': args.start_coins,
+        'award': args.award,
+        'award_every': args.award_every,
+        'round_seconds': args.round_seconds,
+        'msgc_share': args.msgc_share,
+        'sample_every': max(1, args.sample_every),
+    }
+    seeds = [args.seed + i for i in range(args.worlds)]
+
+    started = time.perf_counter()
+    if args.workers <= 1:
+        results = [run_world(config, seed) for seed in seeds]
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            results = list(pool.map(run_world, [config] * len(seeds), seeds))
+    wall = time.perf_counter() - started
+
+    merged = merge_results(results)
+    print(format_report(merged, wall))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'config': config, **merged}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# File header: format name and version. A file with any other header is ignored, not parsed.
+MAGIC = b'POWERSTORE-SNAPSHOT 1\n'
+
+
+class SnapshotStore:
+    """Compact warm-start snapshot on local disk.
+
+    The snapshot is one JSON document, zlib-compressed behind a short header. `save()` writes it to a
+    temporary file and renames it over the previous one, so a crash mid-write leaves the old snapshot
+    intact, and skips the write entirely when the content has not changed since the last save.
+    `load()` returns the saved data, or None for a missing, unreadable or older-than-`max_age` snapshot.
+    """
+
+    def __init__(self, path: str, max_age: float = 86400.0):
+        self.path = path
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.digest = None
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.stats = {'saves': 0, 'skipped': 0, 'errors': 0, 'bytes': 0, 'saved_at': None}
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                blob = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Could not read snapshot {self.path}: {e}")
+            return None
+        if not blob.startswith(MAGIC):
+            logger.warning(f"Ignoring snapshot {self.path}: unknown format.")
+            return None
+        try:
+            document = json.loads(zlib.decompress(blob[len(MAGIC):]))
+            saved_at, data = float(document['saved_at']), document['state']
+        except (zlib.error, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring corrupt snapshot {self.path}: {e}")
+            return None
+        age = time.time() - saved_at
+        if age > self.max_age:
+            logger.info(f"Ignoring snapshot {self.path}: {age / 3600:.1f}h old.")
+            return None
+        self.stats['saved_at'] = saved_at
+        return data
+
+    def save(self, data: dict) -> bool:
+        """Writes `data` with a `saved_at` stamp if it differs from the last snapshot. True if written."""
+        body = json.dumps(data, separators=(',', ':'), sort_keys=True, default=str).encode()
+        digest = hashlib.blake2b(body, digest_size=16).digest()
+        with self.lock:
+            if digest == self.digest:
+                self.stats['skipped'] += 1
+                return False
+            saved_at = time.time()
+            # The stamp wraps the hashed body, so an unchanged state hashes the same on every pass.
+            blob = MAGIC + zlib.compress(b'{"saved_at":%r,"state":%s}' % (saved_at, body), 6)
+            directory = os.path.dirname(os.path.abspath(self.path))
+            try:
+                fd, tmp = tempfile.mkstemp(prefix='.snapshot-', dir=directory)
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        f.write(blob)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp, self.path)
+                except BaseException:
+                    os.unlink(tmp)
+                    raise
+            except OSError as e:
+                self.stats['errors'] += 1
+                logger.warning(f"Could not write snapshot {self.path}: {e}")
+                return False
+            self.digest = digest
+            self.stats.update(saves=self.stats['saves'] + 1, bytes=len(blob), saved_at=saved_at)
+            return True
+
+    # --- PERIODIC WRITER ---
+    def start(self, collect, interval: float = 60.0):
+        """Saves `collect()` every `interval` seconds from a daemon thread until stop()."""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, args=(collect, interval), name='snapshot', daemon=True)
+        self.thread.start()
+
+    def _run(self, collect, interval: float):
+        while not self.stop_event.wait(interval):
+            self.flush(collect)
+
+    def flush(self, collect) -> bool:
+        try:
+            return self.save(collect())
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.warning(f"Snapshot failed, will retry: {e}")
+            return False
+
+    def stop(self, collect=None):
+        """Stops the writer, writing one last snapshot first if `collect` is given."""
+        self.stop_event.set()
+        if collect is not None:
+            self.flush(collect)
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundTasks:
+    """Supervised fire-and-forget runner for side effects that follow a handler's reply (DMs, log posts).
+
+    At most `max_concurrency` tasks run at once; the rest wait their turn. Exceptions are logged and
+    kept in `errors` instead of surfacing as "Task exception was never retrieved". `drain()` waits for
+    everything spawned so far, and is called on shutdown.
+    Tasks run in a copy of the spawning context, so ledger events and the current chat carry over.
+    """
+
+    ERROR_HISTORY = 50
+
+    def __init__(self, max_concurrency: int = 8):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.tasks = set()
+        self.errors = deque(maxlen=self.ERROR_HISTORY)
+        self.stats = {'spawned': 0, 'completed': 0, 'failed': 0, 'cancelled': 0, 'busy_seconds': 0.0}
+        self._loop = None
+        self._semaphore = None
+        self._running = 0
+
+    def __len__(self) -> int:
+        return len(self.tasks)
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def waiting(self) -> int:
+        return len(self.tasks) - self._running
+
+    def _limit(self) -> asyncio.Semaphore:
+        # Tasks are spawned from more than one event loop (updates, the jobs thread), so the semaphore follows the current loop.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._semaphore = loop, asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def spawn(self, coro, name: str = 'task') -> asyncio.Task:
+        """Schedules a coroutine to run after the caller returns. Must be called inside an event loop."""
+        task = asyncio.get_running_loop().create_task(self._run(coro, name), name=name)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        self.stats['spawned'] += 1
+        return task
+
+    async def _run(self, coro, name: str):
+        try:
+            async with self._limit():
+                self._running += 1
+                start = time.perf_counter()
+                try:
+                    await coro
+                    self.stats['completed'] += 1
+                except Exception as e:
+                    self.stats['failed'] += 1
+                    self.errors.append({'time': time.time(), 'task': name, 'error': repr(e)})
+                    logger.error(f"Background task {name} failed: {e}", exc_info=True)
+                finally:
+                    self._running -= 1
+                    self.stats['busy_seconds'] += time.perf_counter() - start
+        except asyncio.CancelledError:
+            self.stats['cancelled'] += 1
+            coro.close()
+            raise
+
+    async def drain(self, timeout: float = None) -> bool:
+        """Waits for every spawned task, including ones spawned while draining. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [t for t in self.tasks if t.get_loop() is loop and not t.done()]
+            if not pending:
+                return True
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                logger.warning(f"Background drain timed out with {len(pending)} tasks left; cancelling them.")
+                for task in pending:
+                    task.cancel()
+                return False
+            await asyncio.wait(pending, timeout=remaining)
+
+    def snapshot(self) -> dict:
+        return {**self.stats, 'running': self.running, 'waiting': self.waiting, 'recent_errors': list(self.errors)[-5:]}
@@ -0,0 +1,100 @@
+import json
+import logging
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+# Trace of the update being processed, if any. Background tasks spawned by it inherit it.
+_CURRENT_TRACE = ContextVar('update_trace', default=None)
+
+
+@dataclass(slots=True)
+class UpdateTrace:
+    """Round trips made while processing one update."""
+    update_id: int
+    command: str
+    user_id: int = None
+    chat_id: int = None
+    started: float = field(default_factory=time.time)
+    seconds: float = 0.0
+    db_calls: int = 0
+    db_seconds: float = 0.0
+    api_calls: int = 0
+    api_seconds: float = 0.0
+    calls: list = field(default_factory=list)
+    slow: bool = False
+
+    MAX_CALLS = 100
+
+    @property
+    def round_trips(self) -> int:
+        return self.db_calls + self.api_calls
+
+    def add(self, kind: str, name: str, seconds: float):
+        if len(self.calls) < self.MAX_CALLS:
+            self.calls.append((kind, name, seconds))
+
+    def breakdown(self) -> list:
+        """[(kind, name, count, seconds)] grouped by call, most expensive first."""
+        grouped = {}
+        for kind, name, seconds in self.calls:
+            count, total = grouped.get((kind, name), (0, 0.0))
+            grouped[(kind, name)] = (count + 1, total + seconds)
+        return sorted(((k, n, c, s) for (k, n), (c, s) in grouped.items()), key=lambda row: -row[3])
+
+    def to_record(self) -> dict:
+        return {
+            'update_id': self.update_id, 'command': self.command, 'user_id': self.user_id, 'chat_id': self.chat_id,
+            'seconds': round(self.seconds, 4), 'db_calls': self.db_calls, 'db_seconds': round(self.db_seconds, 4),
+            'api_calls': self.api_calls, 'api_seconds': round(self.api_seconds, 4), 'slow': self.slow,
+        }
+
+
+class Tracer:
+    """Attributes every Supabase and Bot API round trip to the update being processed.
+
+    `start()` opens a trace in the current context; `observe_db()` / `observe_api()` add to it;
+    `finish()` closes it and logs one structured JSON record. Updates slower than `slow_seconds`
+    or making more than `slow_round_trips` round trips are also kept in `slow` and logged as warnings.
+    """
+
+    def __init__(self, slow_seconds: float = 2.0, slow_round_trips: int = 15, keep: int = 50):
+        self.slow_seconds = slow_seconds
+        self.slow_round_trips = slow_round_trips
+        self.slow = deque(maxlen=keep)
+        self.recent = deque(maxlen=keep)
+
+    def start(self, update_id: int, command: str, user_id: int = None, chat_id: int = None):
+        trace = UpdateTrace(update_id, command, user_id, chat_id)
+        return trace, _CURRENT_TRACE.set(trace), time.perf_counter()
+
+    def finish(self, handle) -> UpdateTrace:
+        trace, token, start = handle
+        _CURRENT_TRACE.reset(token)
+        trace.seconds = time.perf_counter() - start
+        trace.slow = trace.seconds >= self.slow_seconds or trace.round_trips > self.slow_round_trips
+        self.recent.append(trace)
+        record = json.dumps(trace.to_record())
+        if trace.slow:
+            self.slow.append(trace)
+            logger.warning(f"SLOW UPDATE {record}")
+        else:
+            logger.info(f"TRACE {record}")
+        return trace
+
+    def observe_db(self, table: str, seconds: float, ok: bool = True, helper: str = ''):
+        trace = _CURRENT_TRACE.get()
+        if trace is not None:
+            trace.db_calls += 1
+            trace.db_seconds += seconds
+            trace.add('db', f"{table}·{helper}" if helper else table, seconds)
+
+    def observe_api(self, method: str, seconds: float):
+        trace = _CURRENT_TRACE.get()
+        if trace is not None:
+            trace.api_calls += 1
+            trace.api_seconds += seconds
+            trace.add('api', method, seconds)